@@ -3,13 +3,17 @@
 
     Definitions for some example baddies
 '''
-import random
+
+import numpy as np
 
 from maze import Baddy, UP, DOWN, LEFT, RIGHT, STAY
+from batch import BatchBaddy, choose_unobstructed
 
 class StaticBaddy(Baddy):
     ''' A static baddy - does not move from its initial position '''
 
+    stateless = True
+
     def take_turn(self, _obstruction, _ping_response):
         ''' Stay where we are '''
         return STAY
@@ -20,4 +24,20 @@ class RandomBaddy(Baddy):
     def take_turn(self, obstruction, _ping_response):
         ''' Ignore any ping information, just choose a random direction to walk in. We can't ping. '''
         possibilities = filter(lambda direction: not obstruction[direction], (UP, DOWN, LEFT, RIGHT))
-        return random.choice(possibilities)
+        return self.rng.choice(possibilities)
+
+class BatchStaticBaddy(BatchBaddy):
+    ''' A vectorised StaticBaddy '''
+
+    stateless = True
+
+    def take_turns(self, obstruction_masks, _ping_responses):
+        ''' Stay where we are, in every game '''
+        return np.full(len(obstruction_masks), STAY.code)
+
+class BatchRandomBaddy(BatchBaddy):
+    ''' A vectorised RandomBaddy '''
+
+    def take_turns(self, obstruction_masks, _ping_responses):
+        ''' Choose a random unobstructed direction to walk in, in every game. If we're boxed in, stay. '''
+        return choose_unobstructed(self.rng, obstruction_masks)
@@ -0,0 +1,393 @@
+'''
+    batch.py
+
+    A vectorised game engine, which plays many independent games on the same maze in lockstep.
+
+    It is intended for evaluating strategies, when only the results are needed. Rather than one Player object per
+    game, there is one BatchPlayer per role (goody0, goody1 and baddy), which decides the moves for that role in every
+    game at once.
+
+    The rules are exactly those of maze.Game - the goodies and then the baddy move in turn, pings are answered at the
+    start of the next round, and a game is drawn when its round counter reaches max_rounds. Draws are detected early
+    in the same way too (see BatchGame), so a batch gives the same rounds as the equivalent Games.
+
+    Moves are passed around as arrays of their integer codes (see maze.Move).
+
+    Defines:
+        BatchPlayer, BatchGoody, BatchBaddy - abstract base classes for vectorised players
+        PingResponses - the vectorised equivalent of a ping response dict
+        BatchGame - the engine itself
+        choose_unobstructed - a helper for vectorised random walkers
+'''
+
+import unittest
+
+from abc import ABCMeta, abstractmethod
+
+import numpy as np
+
+from maze import Game, Maze, MOVES, STEP, ZERO, UP, LEFT, DOWN, RIGHT, STAY, PING
+from tournament import Tournament, TournamentResults
+
+# Game statuses, as stored in BatchGame.status, and their equivalents in Game
+NOT_STARTED, IN_PLAY, GOODIES_WIN, BADDY_WINS, DRAW = range(5)
+STATUSES = (Game.not_started, Game.in_play, Game.goodies_win, Game.baddy_wins, Game.draw)
+
+# Reasons for a draw, as stored in BatchGame.draw_reason, and their equivalents in Game
+NO_DRAW, OUT_OF_ROUNDS, UNREACHABLE, REPEATING = range(4)
+DRAW_REASONS = (None, Game.out_of_rounds, Game.unreachable, Game.repeating)
+
+
+class PingResponses(object):
+    ''' The ping responses for one role across all the games in a batch.
+
+        'pinged' is a bool array - True for each game in which someone PINGed last round.
+        'relative' is an int array subscripted like this: relative[game, other, axis]. It gives the x (axis 0) and y
+        (axis 1) position of the other players relative to this one, in the order goody0, goody1, baddy (skipping
+        this player). It is only meaningful where 'pinged' is True.
+    '''
+    __slots__ = ("pinged", "relative")
+
+    def __init__(self, pinged, relative):
+        self.pinged = pinged
+        self.relative = relative
+
+
+class BatchPlayer(object):
+    ''' Common base class for vectorised goodies and baddies.
+
+        'size' is the number of games in the batch, and 'rng' is a numpy.random.RandomState owned by the BatchGame,
+        which should be used for any random decisions so that batches are reproducible.
+    '''
+
+    __metaclass__ = ABCMeta
+
+    stateless = False  # As for maze.Player - True if the moves depend only on the obstructions and ping responses
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+
+    @abstractmethod
+    def take_turns(self, obstruction_masks, ping_responses):
+        ''' Decide how to move in every game.
+
+            'obstruction_masks' is a uint8 array holding the Obstruction mask for this player in each game.
+
+            'ping_responses' is a PingResponses object.
+
+            Return an array of move codes (see maze.Move), one per game. Moves returned for games which have
+            already finished are ignored.
+        '''
+        pass
+
+
+class BatchGoody(BatchPlayer):
+    ''' A vectorised Goody. See maze.Goody for the rules. '''
+    pass
+
+
+class BatchBaddy(BatchPlayer):
+    ''' A vectorised Baddy. See maze.Baddy for the rules. '''
+    pass
+
+
+def _choice_table(extra):
+    ''' Private - tables of the unobstructed directions (followed by the codes in 'extra') for each mask.
+        Masks with no options at all get STAY.
+    '''
+    options = []
+    for mask in xrange(16):
+        codes = [move.code for move in (UP, DOWN, LEFT, RIGHT) if not mask & 1 << move.code]
+        options.append((codes + list(extra)) or [STAY.code])
+    table = np.zeros((16, 5), dtype=np.int8)
+    for mask, codes in enumerate(options):
+        table[mask, :len(codes)] = codes
+    return table, np.array([len(codes) for codes in options])
+
+_CHOICE_TABLES = {}
+
+def choose_unobstructed(rng, obstruction_masks, extra=()):
+    ''' Uniformly choose one of the unobstructed directions, or one of the move codes in 'extra', for each mask.
+        Where there are no options, STAY is chosen.
+    '''
+    extra = tuple(extra)
+    if extra not in _CHOICE_TABLES:
+        _CHOICE_TABLES[extra] = _choice_table(extra)
+    table, counts = _CHOICE_TABLES[extra]
+    choice = (rng.random_sample(len(obstruction_masks)) * counts[obstruction_masks]).astype(np.intp)
+    return table[obstruction_masks, choice]
+
+
+class BatchGame(object):
+    ''' A BatchGame plays 'size' games at once, on the same maze, between the given classes of BatchPlayer.
+
+        The state of every game is held in arrays:
+            cells - the position of goody0, goody1 and the baddy in each game, as indices into the padded cell
+                    array of the maze (see Maze.array) - use positions() to get x, y coordinates
+            round, ping, status - as in Game, except that status holds codes (e.g. GOODIES_WIN). See STATUSES.
+            draw_reason - as in Game, but as codes (e.g. REPEATING). See DRAW_REASONS.
+
+        'connected', 'detect_draws' and 'fast_forward' work as they do in Game.
+    '''
+
+    def __init__(self, maze, goody0_cls, goody1_cls, baddy_cls, size, max_rounds=10000, seed=None, connected=True,
+                 detect_draws=True, fast_forward=False):
+        if (not isinstance(maze, Maze) or not issubclass(goody0_cls, BatchGoody)
+            or not issubclass(goody1_cls, BatchGoody) or not issubclass(baddy_cls, BatchBaddy)):
+            raise TypeError("A BatchGame must be initialised with a maze, two BatchGoody classes, and a BatchBaddy "
+                            "class. Got:\n{}".format((maze, goody0_cls, goody1_cls, baddy_cls)))
+        self.maze = maze
+        self.size = size
+        self.max_rounds = max_rounds
+        self.rng = np.random.RandomState(seed)
+        self.players = (goody0_cls(size, self.rng), goody1_cls(size, self.rng), baddy_cls(size, self.rng))
+
+        self._stride = maze.width + 2
+        self._masks = maze.obstruction_array(padded=True).ravel()
+        # The change in cell index caused by each move code
+        self._steps = np.array([step.x + step.y * self._stride for step in (STEP.get(move, ZERO) for move in MOVES)])
+
+        self.cells = self._place_players(connected)
+        self.round = np.zeros(size, dtype=np.int64)
+        self.ping = np.zeros(size, dtype=bool)
+        self.status = np.full(size, NOT_STARTED, dtype=np.int8)
+        self.draw_reason = np.full(size, NO_DRAW, dtype=np.int8)
+        self.detect_draws = detect_draws
+        self.fast_forward = fast_forward
+        # The states (cells and ping) seen at the start of each round in each game, if a repeat would mean a draw
+        if detect_draws and all(player.stateless for player in self.players):
+            self._states = [set() for _ in xrange(size)]
+        else:
+            self._states = None
+
+    def _place_players(self, connected=True):
+        ''' Private - place the players at distinct empty cells in every game. Like Game, unless 'connected' is False
+            the players of each game are placed in the same connected component: the first cell is chosen uniformly
+            from the components that are big enough, and the rest uniformly from the other cells of its component.
+            Each player's cell is redrawn until it differs from those of the players before it, which makes the same
+            choice as sampling without replacement.
+        '''
+        empty = np.flatnonzero(self.maze.array(padded=True).ravel() == Maze.space)
+        if len(empty) < len(self.players):
+            raise ValueError("Failed to place the players - the maze only has {} empty cells!".format(len(empty)))
+        sizes = np.array(self.maze.component_sizes())
+        if len(sizes) == 1 or not connected:
+            def choose(player, games):
+                return empty[self.rng.randint(len(empty), size=len(games))]
+        else:
+            if sizes.max() < len(self.players):
+                raise ValueError("Failed to place the players - the largest area of the maze only has {} cells!".format(
+                                 sizes.max()))
+            # The empty cells, grouped by component, and where each component's group starts
+            labels = self.maze.component_array(padded=True).ravel()[empty]
+            order = np.argsort(labels, kind="mergesort")
+            grouped, labels = empty[order], labels[order]
+            starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+            eligible = np.flatnonzero(sizes[labels] >= len(self.players))
+            first = eligible[self.rng.randint(len(eligible), size=self.size)]
+            component = labels[first]
+
+            def choose(player, games):
+                if player == 0:
+                    return grouped[first[games]]
+                return grouped[starts[component[games]] +
+                               (self.rng.random_sample(len(games)) * sizes[component[games]]).astype(np.int64)]
+        cells = np.empty((self.size, len(self.players)), dtype=np.int64)
+        for player in xrange(len(self.players)):
+            games = np.arange(self.size)
+            while len(games):
+                cells[games, player] = choose(player, games)
+                games = games[(cells[games, :player] == cells[games, player, None]).any(axis=1)]
+        return cells
+
+    def positions(self):
+        ''' Return an int array of player positions, subscripted like this: positions[game, player, axis] '''
+        return np.stack((self.cells % self._stride - 1, self.cells // self._stride - 1), axis=-1)
+
+    def _ping_responses(self, pinged):
+        ''' Private - construct the PingResponses object for each player '''
+        positions = self.positions()
+        responses = []
+        for player in xrange(len(self.players)):
+            others = [other for other in xrange(len(self.players)) if other != player]
+            responses.append(PingResponses(pinged, positions[:, others] - positions[:, [player]]))
+        return responses
+
+    def do_round(self):
+        ''' Do a round of turns in every game that is still in play - goody0, goody1, then the baddy.
+            Return the array of game statuses.
+        '''
+        status = self.status
+        status[status == NOT_STARTED] = IN_PLAY
+        active = status == IN_PLAY
+        if not active.any():
+            return status
+
+        self.round[active] += 1
+        drawn = active & (self.round == self.max_rounds)
+        self._draw(drawn, OUT_OF_ROUNDS)
+        active &= ~drawn
+        if self.detect_draws:
+            self._detect_draws(active)
+            active &= status == IN_PLAY
+
+        ping_responses = self._ping_responses(self.ping & active)
+        self.ping[active] = False
+
+        cells = self.cells
+        for index, player in enumerate(self.players):
+            masks = self._masks[cells[:, index]]
+            moves = np.asarray(player.take_turns(masks, ping_responses[index]))
+
+            # Only unobstructed steps move a player
+            directions = np.minimum(moves, RIGHT.code)
+            moved = active & (moves <= RIGHT.code) & ((masks >> directions) & 1 == 0)
+            cells[moved, index] += self._steps[moves[moved]]
+
+            # Check for game over
+            if isinstance(player, BatchGoody):
+                self.ping |= active & (moves == PING.code)
+                goodies_win = moved & (cells[:, 0] == cells[:, 1])
+                baddy_wins = moved & ~goodies_win & (cells[:, index] == cells[:, 2])
+                status[goodies_win] = GOODIES_WIN
+            else:
+                baddy_wins = moved & ((cells[:, 2] == cells[:, 0]) | (cells[:, 2] == cells[:, 1]))
+            status[baddy_wins] = BADDY_WINS
+            active &= status == IN_PLAY
+
+        return status
+
+    def _draw(self, games, reason):
+        ''' Private - end the given games (a bool array) in a draw, for the given reason '''
+        self.status[games] = DRAW
+        self.draw_reason[games] = reason
+        if self.fast_forward:
+            self.round[games] = self.max_rounds
+
+    def _detect_draws(self, active):
+        ''' Private - draw the active games which can no longer end any other way, just as Game does '''
+        starting = active & (self.round == 1)
+        if starting.any():
+            labels = self.maze.component_array(padded=True).ravel()[self.cells[starting]]
+            can_end = (labels[:, 0] == labels[:, 1]) | (labels[:, 2] == labels[:, 0]) | (labels[:, 2] == labels[:, 1])
+            unreachable = np.zeros(self.size, dtype=bool)
+            unreachable[np.flatnonzero(starting)[~can_end]] = True
+            self._draw(unreachable, UNREACHABLE)
+            active = active & ~unreachable
+        if self._states is not None:
+            repeating = np.zeros(self.size, dtype=bool)
+            for game in np.flatnonzero(active):
+                state = (tuple(self.cells[game]), self.ping[game])
+                if state in self._states[game]:
+                    repeating[game] = True
+                else:
+                    self._states[game].add(state)
+            self._draw(repeating, REPEATING)
+
+    def play(self):
+        ''' Keep playing until every game has a result. Returns the results as a TournamentResults object. '''
+        while ((self.status == IN_PLAY) | (self.status == NOT_STARTED)).any():
+            self.do_round()
+        return self.results()
+
+    def results(self):
+        ''' Return a TournamentResults object describing the games that have finished so far '''
+        results = TournamentResults()
+        finished = (self.status != IN_PLAY) & (self.status != NOT_STARTED)
+        for status, rounds in zip(self.status[finished], self.round[finished]):
+            results.add(STATUSES[status], int(rounds))
+        return results
+
+
+class BatchGameTest(unittest.TestCase):
+    ''' Test that the batch engine behaves like the scalar one '''
+
+    def setUp(self):
+        from mazes import SMALL
+        self.maze = SMALL
+
+    def test_static_players_draw(self):
+        from goodies import BatchStaticGoody
+        from baddies import BatchStaticBaddy
+        from goodies import StaticGoody
+        from baddies import StaticBaddy
+        game = BatchGame(self.maze, BatchStaticGoody, BatchStaticGoody, BatchStaticBaddy, 50, max_rounds=20, seed=0)
+        results = game.play()
+        self.assertEqual(dict(results.results), {Game.draw: 50})
+        self.assertEqual(dict(results.rounds[Game.draw]), {2: 50})  # Back where they started after one round
+        self.assertTrue((game.draw_reason == REPEATING).all())
+        scalar = Game(self.maze, StaticGoody(), StaticGoody(), StaticBaddy(), max_rounds=20)
+        self.assertEqual(scalar.play(), (Game.draw, 2))
+
+        for kwargs in ({"detect_draws": False}, {"fast_forward": True}):
+            game = BatchGame(self.maze, BatchStaticGoody, BatchStaticGoody, BatchStaticBaddy, 50, max_rounds=20,
+                             seed=0, **kwargs)
+            self.assertEqual(dict(game.play().rounds[Game.draw]), {20: 50})
+        self.assertTrue((game.draw_reason == REPEATING).all())
+
+    def test_unreachable_draws(self):
+        from goodies import BatchRandomGoody
+        from baddies import BatchRandomBaddy
+        maze = Maze(8, 1, "00010100")
+        game = BatchGame(maze, BatchRandomGoody, BatchRandomGoody, BatchRandomBaddy, 200, seed=0, connected=False)
+        labels = maze.component_array(padded=True).ravel()[game.cells]
+        apart = (labels[:, 0] != labels[:, 1]) & (labels[:, 2] != labels[:, 0]) & (labels[:, 2] != labels[:, 1])
+        self.assertTrue(apart.any())
+        game.play()
+        self.assertTrue((game.status[apart] == DRAW).all())
+        self.assertTrue((game.round[apart] == 1).all())
+        self.assertTrue((game.draw_reason[apart] == UNREACHABLE).all())
+        self.assertTrue((game.draw_reason[~apart] != UNREACHABLE).all())
+
+    def test_placement(self):
+        from goodies import BatchStaticGoody
+        from baddies import BatchStaticBaddy
+        game = BatchGame(self.maze, BatchStaticGoody, BatchStaticGoody, BatchStaticBaddy, 1000, seed=1)
+        positions = game.positions()
+        for player in xrange(3):
+            for x, y in positions[:, player]:
+                self.assertEqual(self.maze[x, y], Maze.space)
+        self.assertTrue((game.cells[:, 0] != game.cells[:, 1]).all())
+
+    def test_connected_placement(self):
+        from goodies import BatchStaticGoody
+        from baddies import BatchStaticBaddy
+        maze = Maze(5, 3, "00100"
+                          "11100"
+                          "01011")
+        game = BatchGame(maze, BatchStaticGoody, BatchStaticGoody, BatchStaticBaddy, 1000, seed=1)
+        components = maze.component_array(padded=True).ravel()[game.cells]
+        self.assertTrue((components == maze.component((4, 2))).all())  # The only component with room for three
+        self.assertEqual(len(set(map(tuple, game.cells))), 24)  # Every arrangement of three of its four cells
+
+        maze = Maze(8, 1, "00010000")  # Components of three and four cells
+        game = BatchGame(maze, BatchStaticGoody, BatchStaticGoody, BatchStaticBaddy, 7000, seed=2)
+        in_small = (game.cells[:, 0] % game._stride - 1 < 3).mean()
+        self.assertAlmostEqual(in_small, 3.0 / 7, delta=0.02)  # Each of the seven cells is as likely to be chosen first
+
+    def test_reproducible(self):
+        from goodies import BatchRandomGoody
+        from baddies import BatchRandomBaddy
+        players = (BatchRandomGoody, BatchRandomGoody, BatchRandomBaddy)
+        first = BatchGame(self.maze, *players, size=200, seed=7).play()
+        second = BatchGame(self.maze, *players, size=200, seed=7).play()
+        self.assertEqual(first, second)
+
+    def test_matches_scalar_game(self):
+        from goodies import RandomGoody, BatchRandomGoody
+        from baddies import RandomBaddy, BatchRandomBaddy
+        games = 2000
+        batch = BatchGame(self.maze, BatchRandomGoody, BatchRandomGoody, BatchRandomBaddy, games, seed=3).play()
+        scalar = Tournament(self.maze, RandomGoody, RandomGoody, RandomBaddy, processes=1, seed=3).play(games)
+        for result in (Game.goodies_win, Game.baddy_wins):
+            # The rates should agree to within about four standard errors
+            self.assertAlmostEqual(batch.results[result] / float(games), scalar.results[result] / float(games),
+                                   delta=0.045)
+        mean_rounds = lambda results: (sum(rounds * count for histogram in results.rounds.values()
+                                           for rounds, count in histogram.items()) / float(games))
+        self.assertAlmostEqual(mean_rounds(batch), mean_rounds(scalar), delta=0.15 * mean_rounds(scalar))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,293 @@
+'''
+    benchmarks.py
+
+    Timing benchmarks for the game engine, the players and the GUI.
+
+    Run this script to run every benchmark, or give the names of the benchmarks to run, e.g.
+        python benchmarks.py a_star do_round
+
+    Each benchmark returns a (possibly nested) dict of measurements. Use --json to save them, along with the commit
+    they were measured at, so that two commits can be compared:
+        python benchmarks.py --json before.json
+        ... change something ...
+        python benchmarks.py --json after.json
+        python benchmarks.py --compare before.json after.json
+'''
+
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from maze import Game, Maze, PackedMaze, Position, STEP, UP, DOWN, LEFT, RIGHT
+from mazes import EXAMPLE_MAZE, TIGHT, OPEN
+from goodies import StaticGoody, RandomGoody, SmartGoody, IncrementalSmartGoody, PackedSmartGoody
+from baddies import StaticBaddy, RandomBaddy
+
+# The mazes that the engine benchmarks are run on
+MAZES = {"EXAMPLE_MAZE": EXAMPLE_MAZE,
+         "TIGHT": TIGHT,
+         "OPEN": OPEN,
+         "TIGHT*(4,4)": TIGHT * (4, 4),
+         "OPEN*(4,4)": OPEN * (4, 4),
+         "PackedMaze(OPEN*(4,4))": PackedMaze.from_maze(OPEN * (4, 4))}
+
+# The combinations of players that game benchmarks are run with
+PLAYERS = {"Random+Random v Random": (RandomGoody, RandomGoody, RandomBaddy),
+           "Static+Static v Static": (StaticGoody, StaticGoody, StaticBaddy),
+           "Smart+Smart v Random": (SmartGoody, SmartGoody, RandomBaddy),
+           "IncrementalSmart+IncrementalSmart v Random": (IncrementalSmartGoody, IncrementalSmartGoody, RandomBaddy),
+           "PackedSmart+PackedSmart v Random": (PackedSmartGoody, PackedSmartGoody, RandomBaddy)}
+
+
+def known_grid_goody(maze):
+    ''' Return a SmartGoody that already knows the layout of the whole maze '''
+    goody = SmartGoody()
+    goody.grid = np.array(maze.array().T, dtype=goody.grid.dtype)  # SmartGoody's grid is subscripted [x][y]
+    return goody
+
+def random_empty_cell(maze, rng):
+    ''' Return the (x, y) coordinates of a random empty cell in the maze '''
+    while True:
+        x, y = rng.randrange(maze.width), rng.randrange(maze.height)
+        if maze[x, y] == Maze.space:
+            return x, y
+
+def games(maze, players, max_rounds, seed=0):
+    ''' Generate an endless sequence of new games between the given player classes, seeding each one in turn '''
+    while True:
+        yield Game.from_seed(maze, seed, *players, max_rounds=max_rounds)
+        seed += 1
+
+def deep_size(obj, exclude=()):
+    ''' Return the total size in bytes of an object and everything that it refers to, excluding the objects in
+        'exclude' (and everything reachable only through them), classes and modules
+    '''
+    seen = set(id(excluded) for excluded in exclude)
+    pending = [obj]
+    size = 0
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, (type, type(sys))):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        pending.extend(gc.get_referents(obj))
+    return size
+
+
+def a_star(maze=OPEN * (4, 4), reaches=(10, 25, 50), searches=200, seed=0):
+    ''' Time SmartGoody.a_star between random pairs of empty cells, up to 'reach' cells apart in each direction, in a
+        maze that the goody knows completely
+    '''
+    rng = random.Random(seed)
+    goody = known_grid_goody(maze)
+    results = {}
+    for reach in reaches:
+        searches_to_do = []
+        for _ in xrange(searches):
+            src = random_empty_cell(maze, rng)
+            while True:
+                dest = random_empty_cell(maze, rng)
+                if abs(dest[0] - src[0]) <= reach and abs(dest[1] - src[1]) <= reach:
+                    break
+            searches_to_do.append((list(src), list(dest)))
+
+        start = time.time()
+        for src, dest in searches_to_do:
+            goody.a_star(src, dest)
+        results["reach {}".format(reach)] = {"seconds_per_search": (time.time() - start) / searches}
+    return results
+
+def position_step(steps=1000000):
+    ''' Time the position + STEP[move] operation that the engine does for every move '''
+    moves = [UP, RIGHT, DOWN, LEFT] * (steps // 4)
+    position = Position(5, 7)
+    start = time.time()
+    for move in moves:
+        position = position + STEP[move]
+    elapsed = time.time() - start
+    return {"steps": len(moves), "seconds_per_step": elapsed / len(moves)}
+
+def do_round(rounds=5000, max_rounds=1000):
+    ''' Time Game.do_round for each combination of players on each maze. Games are played to the end (or to
+        'max_rounds'), and new games started, until 'rounds' rounds have been played. Setting up each game is not
+        included in the time.
+    '''
+    results = {}
+    for maze_name, maze in sorted(MAZES.items()):
+        for players_name, players in sorted(PLAYERS.items()):
+            played = 0
+            elapsed = 0.0
+            for game in games(maze, players, max_rounds):
+                start = time.time()
+                while game.do_round() == Game.in_play:
+                    pass
+                elapsed += time.time() - start
+                played += game.round
+                if played >= rounds:
+                    break
+            results.setdefault(maze_name, {})[players_name] = {"rounds_per_second": played / elapsed}
+    return results
+
+def maze_access(lookups=200000, seed=0):
+    ''' Time Maze.__getitem__ and Maze.obstruction at random positions in each maze '''
+    rng = random.Random(seed)
+    results = {}
+    for maze_name, maze in sorted(MAZES.items()):
+        positions = [Position(rng.randrange(maze.width), rng.randrange(maze.height)) for _ in xrange(lookups)]
+        maze.obstruction(positions[0])  # Build any caches before timing
+
+        start = time.time()
+        for position in positions:
+            maze[position]
+        getitem = time.time() - start
+
+        start = time.time()
+        for position in positions:
+            maze.obstruction(position)
+        obstruction = time.time() - start
+
+        results[maze_name] = {"getitem_per_second": lookups / getitem,
+                              "obstruction_per_second": lookups / obstruction}
+    return results
+
+def maze_multiply(factors=(2, 4, 8), repeats=5):
+    ''' Time tiling each of the predefined mazes with Maze.__mul__ '''
+    results = {}
+    for maze_name in ("EXAMPLE_MAZE", "TIGHT", "OPEN"):
+        maze = MAZES[maze_name]
+        for factor in factors:
+            start = time.time()
+            for _ in xrange(repeats):
+                maze * (factor, factor)
+            results.setdefault(maze_name, {})["*({0},{0})".format(factor)] = {
+                "seconds": (time.time() - start) / repeats}
+    return results
+
+def generate_mazes(sizes=(50, 200, 1000), seconds=1.0):
+    ''' Time each of the maze generators in generate.py, generating mazes of each size for about 'seconds' '''
+    from generate import GENERATORS
+    results = {}
+    for name, generator in sorted(GENERATORS.items()):
+        for size in sizes:
+            made = 0
+            start = time.time()
+            while time.time() - start < seconds or not made:
+                generator(size, size, seed=made)
+                made += 1
+            results.setdefault(name, {})["{0}x{0}".format(size)] = {"mazes_per_second": made / (time.time() - start)}
+    return results
+
+def game_memory(rounds=200):
+    ''' Measure the memory used by a game (and its players, but not the maze, which games share) for each
+        combination of players on each maze, after it has been playing for up to 'rounds' rounds
+    '''
+    results = {}
+    for maze_name, maze in sorted(MAZES.items()):
+        for players_name, players in sorted(PLAYERS.items()):
+            game = next(games(maze, players, max_rounds=rounds))
+            game.play()
+            results.setdefault(maze_name, {})[players_name] = {"bytes": deep_size(game, exclude=[maze])}
+    return results
+
+def gui_setup(repeats=5):
+    ''' Time GameViewer.set_game for each maze, switching between games on the same maze. Skipped if PyQt5 is not
+        installed.
+    '''
+    try:
+        from PyQt5.QtWidgets import QApplication
+        from gui import GameViewer
+    except ImportError:
+        return {"skipped": "PyQt5 is not installed"}
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    viewer = GameViewer()
+    results = {}
+    for maze_name, maze in sorted(MAZES.items()):
+        game_list = [game for game, _ in zip(games(maze, PLAYERS["Random+Random v Random"], 1), xrange(repeats))]
+        start = time.time()
+        for game in game_list:
+            viewer.set_game(game)
+            app.processEvents()
+        results[maze_name] = {"seconds_per_game": (time.time() - start) / repeats}
+    return results
+
+BENCHMARKS = {"a_star": a_star,
+              "position_step": position_step,
+              "do_round": do_round,
+              "maze_access": maze_access,
+              "maze_multiply": maze_multiply,
+              "generate_mazes": generate_mazes,
+              "game_memory": game_memory,
+              "gui_setup": gui_setup}
+
+
+def flatten(results, prefix=""):
+    ''' Flatten nested benchmark results into a dict of {"name/key/...": number}, skipping anything that isn't
+        a number
+    '''
+    flat = {}
+    for key, value in results.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "/"))
+        elif isinstance(value, (int, long, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def compare(before, after):
+    ''' Print the ratio after/before of every measurement in two sets of saved results '''
+    before = flatten(before["benchmarks"])
+    after = flatten(after["benchmarks"])
+    width = max(len(name) for name in before) if before else 0
+    for name in sorted(set(before) & set(after)):
+        ratio = after[name] / float(before[name]) if before[name] else float("nan")
+        print("{:{}}  {:>12.6g} {:>12.6g}  x{:.3f}".format(name, width, before[name], after[name], ratio))
+    for name in sorted(set(before) ^ set(after)):
+        print("{:{}}  only in {}".format(name, width, "before" if name in before else "after"))
+
+def current_commit():
+    ''' Return the git commit that the benchmarks are being run at, or None if it can't be found '''
+    try:
+        with open(os.devnull, "w") as devnull:
+            return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=devnull,
+                                           cwd=os.path.dirname(os.path.abspath(__file__))).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run timing benchmarks.")
+    parser.add_argument("names", nargs="*", metavar="name",
+                        help="the benchmarks to run (default: all of them): " + ", ".join(sorted(BENCHMARKS)))
+    parser.add_argument("--json", metavar="PATH", help="save the results to PATH as JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="compare two sets of saved results instead of running the benchmarks")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error("unknown benchmarks: " + ", ".join(sorted(unknown)))
+
+    if args.compare:
+        with open(args.compare[0]) as before, open(args.compare[1]) as after:
+            compare(json.load(before), json.load(after))
+        sys.exit()
+
+    results = {}
+    for name in args.names or sorted(BENCHMARKS):
+        results[name] = BENCHMARKS[name]()
+        print(name, json.dumps(results[name], sort_keys=True, indent=2))
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"commit": current_commit(), "python": platform.python_version(), "time": time.time(),
+                       "benchmarks": results}, json_file, sort_keys=True, indent=2)
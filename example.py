@@ -9,71 +9,17 @@ from __future__ import print_function
 import sys
 import time
 
-from collections import defaultdict
-
 from PyQt5.QtWidgets import QApplication
 
-from maze import Maze, Game, game_repeater
+from maze import Game, game_repeater
+from mazes import EXAMPLE_MAZE, OPEN, TIGHT
+from tournament import Tournament
+from stats import ResultStats, compare
 from goodies import RandomGoody, SmartGoody
 from baddies import RandomBaddy
 from gui import GameViewer
 
 
-EXAMPLE_MAZE = Maze(10, 10, "0001010000"
-                            "0111010101"
-                            "0100000011"
-                            "0110100010"
-                            "0000100110"
-                            "1111100000"
-                            "0000001000"
-                            "1000111010"
-                            "0010001010"
-                            "1100101010")
-
-TIGHT = Maze(20, 20,
-							"00000000000000000000"
-							"01111111111111111110"
-							"00000000110000000000"
-							"00110111111110011111"
-							"00100000000000000000"
-							"00111111111111110010"
-							"00000000000000000010"
-							"01001111111111001110"
-							"10000000000000000000"
-							"10111111110111011111"
-							"00000000000000000000"
-							"11111111111111111110"
-							"00000000000000000000"
-							"00000000000000000000"
-							"01111111111111111111"
-							"00100100010010010100"
-							"00100100000010010100"
-							"00100100010010010100"
-							"00001110011011010110"
-							"00000000001000000000"
-							)
-OPEN = Maze(20, 20,
-							"10000000000001000000"
-							"01000001100010000000"
-							"01000001000111111000"
-							"00100011111000000100"
-							"00100000000000001000"
-							"00100000001111100000"
-							"00001000000000100000"
-							"00110110000000100000"
-							"00000001110000011110"
-							"00000100001110000000"
-							"00000001000001001000"
-							"00001111111110110010"
-							"00000100000000000100"
-							"00011000110000001000"
-							"00000111000000010000"
-							"00000000100011100000"
-							"00000000011100000000"
-							"00000000110000000000"
-							"00000000100000000000"
-							"00000000000000000000")
-
 def text_example():
     ''' Prints the state of the game to stdout after each round of turns '''
 
@@ -89,21 +35,27 @@ def text_example():
 
     game.play(hook=hook)
 
-def stats_example(total_games):
-    ''' Plays many games, printing cumulative and final stats '''
+def stats_example(total_games, processes=None, seed=None):
+    ''' Plays many games across all CPUs, printing cumulative and final stats '''
+
+    #tournament = Tournament(EXAMPLE_MAZE, SmartGoody, SmartGoody, RandomBaddy, processes=processes, seed=seed)
+    #tournament = Tournament(TIGHT, SmartGoody, SmartGoody, RandomBaddy, processes=processes, seed=seed)
+    tournament = Tournament(OPEN, SmartGoody, SmartGoody, RandomBaddy, processes=processes, seed=seed)
+
+    def callback(results):
+        stats = ResultStats()
+        stats.update(results)
+        print(results.total_games, "/", total_games, ":", stats)
 
-    results = defaultdict(int)
-    #for game_number, game in enumerate(game_repeater(EXAMPLE_MAZE, SmartGoody, SmartGoody, RandomBaddy)):
-    #for game_number, game in enumerate(game_repeater(TIGHT, SmartGoody, SmartGoody, RandomBaddy)):
-    for game_number, game in enumerate(game_repeater(OPEN, SmartGoody, SmartGoody, RandomBaddy)):
-        if game_number == total_games:
-            break
-        result, _rounds = game.play()
-        results[result] += 1
-        if game_number % 10 == 0:
-            print(game_number, "/", total_games, ":", dict(results))
+    results = tournament.play(total_games, callback=callback)
+    print("Seed:", tournament.seed)
+    print(results)
 
-    print(dict(results))
+def compare_example(processes=None, seed=None):
+    ''' Plays SmartGoodies and RandomGoodies until it's clear which of them win more often '''
+    comparison = compare(OPEN, (SmartGoody, SmartGoody, RandomBaddy), (RandomGoody, RandomGoody, RandomBaddy),
+                         processes=processes, seed=seed, callback=print)
+    print(comparison)
 
 def gui_example():
     ''' Opens a GUI, allowing games to be stepped through or quickly played one after another '''
@@ -119,4 +71,5 @@ if __name__ == "__main__":
     # Uncomment whichever example you want to run
     #text_example()
     stats_example(1000)
+    #compare_example()
     #gui_example()
\ No newline at end of file
@@ -0,0 +1,224 @@
+'''
+    generate.py
+
+    Procedural maze generators. Each one takes a width, a height, a seed and some parameters, and builds the Maze's
+    cell buffer directly.
+
+    Perfect mazes - exactly one path between any two empty cells. Rooms are at even (x, y) coordinates, and the
+    cells between them are corridors or walls. These are the slowest - a 1000x1000 maze takes a third to half a
+    second either way, so large ones are better generated once and reused than made afresh for every game:
+        backtracker - the recursive backtracker (a randomised depth-first search). Long, winding corridors. Each
+                      step depends on the one before, so this is built one room at a time in Python.
+        kruskal - randomised Kruskal's algorithm. Many short dead ends. Built with NumPy, but the walls are shuffled
+                  with the random module, which takes a third of the time.
+
+    Open mazes - built with NumPy, a whole grid at a time. By default everything except the largest connected area of
+    empty cells is filled in, so that every empty cell can be reached from every other:
+        caves - cellular automaton caves
+        obstacles - walls scattered at random with the given density
+
+    stream() yields any number of generated mazes, each with its own seed drawn from a master seed, ready to be fed
+    into maze.game_generator.
+'''
+
+import random
+import unittest
+
+from itertools import count as counter, islice
+
+import numpy as np
+
+from maze import Maze, Position, game_generator, _join_roots, _label_components
+
+
+def _perfect_maze_rooms(width, height):
+    ''' Private - return the layout used by the perfect maze generators: (stride, cells, rooms), where 'cells' is a
+        padded cell buffer full of walls, and 'rooms' is a list of the indices into it of the rooms
+    '''
+    stride = width + 2
+    cells = bytearray([Maze.wall]) * (stride * (height + 2))
+    rooms = [(y + 1) * stride + x + 1 for y in xrange(0, height, 2) for x in xrange(0, width, 2)]
+    return stride, cells, rooms
+
+def backtracker(width, height, seed=None):
+    ''' Return a perfect maze made by the recursive backtracker '''
+    rng = random.Random(seed)
+    stride, cells, rooms = _perfect_maze_rooms(width, height)
+    if rooms:
+        room_width = (width + 1) // 2
+        room_height = (height + 1) // 2
+        # The room grid has a border of visited rooms, so that neighbours never need bounds checks
+        room_stride = room_width + 2
+        visited = bytearray([1]) * (room_stride * (room_height + 2))
+        for room_y in xrange(room_height):
+            start = (room_y + 1) * room_stride + 1
+            visited[start:start + room_width] = bytearray(room_width)
+        # Moving between rooms moves two cells
+        steps = ((1, 2), (-1, -2), (room_stride, 2 * stride), (-room_stride, -2 * stride))
+
+        room = rng.randrange(room_width) + 1 + (rng.randrange(room_height) + 1) * room_stride
+        cell = ((room // room_stride - 1) * 2 + 1) * stride + (room % room_stride - 1) * 2 + 1
+        visited[room] = 1
+        cells[cell] = Maze.space
+        stack = [(room, cell)]
+        choice = rng.choice
+        while stack:
+            room, cell = stack[-1]
+            options = [step for step in steps if not visited[room + step[0]]]
+            if not options:
+                stack.pop()
+                continue
+            room_step, cell_step = choice(options)
+            room += room_step
+            visited[room] = 1
+            cells[cell + cell_step // 2] = cells[cell + cell_step] = Maze.space
+            stack.append((room, cell + cell_step))
+    return Maze.from_buffer(width, height, cells, connected=True)
+
+def kruskal(width, height, seed=None):
+    ''' Return a perfect maze made by randomised Kruskal's algorithm '''
+    rng = random.Random(seed)
+    stride, cells, rooms = _perfect_maze_rooms(width, height)
+    cells = np.frombuffer(cells, dtype=np.uint8).copy()
+    rooms = np.array(rooms, dtype=np.int64)
+    cells[rooms] = Maze.space
+    room_numbers = np.zeros(len(cells), dtype=np.int32)
+    room_numbers[rooms] = np.arange(len(rooms), dtype=np.int32)
+    # Every wall between two rooms, and the numbers of the rooms either side of it, in a random order
+    across, up = rooms[rooms % stride + 2 <= width], rooms[rooms // stride + 2 <= height]
+    walls = np.concatenate((across + 1, up + stride))
+    order = range(len(walls))
+    rng.shuffle(order)
+    order = np.array(order, dtype=np.int64)
+    walls = walls[order]
+    first = np.concatenate((room_numbers[across], room_numbers[up]))[order]
+    second = np.concatenate((room_numbers[across + 2], room_numbers[up + 2 * stride]))[order]
+
+    # Kruskal's algorithm removes each wall in turn if the rooms either side aren't yet connected. That makes the
+    # minimum spanning tree of the rooms, taking the walls' places in the order as their weights - which Boruvka's
+    # algorithm finds a whole maze at a time: every connected area removes the first wall out of it, until there is
+    # only one area left.
+    parent = np.arange(len(rooms), dtype=np.int32)  # A disjoint-set forest of the connected rooms
+    while True:
+        root_first, root_second = parent[first], parent[second]
+        differ = root_first != root_second
+        if not differ.any():
+            break
+        walls, first, second = walls[differ], first[differ], second[differ]
+        root_first, root_second = root_first[differ], root_second[differ]
+        places = np.arange(len(walls))
+        earliest = np.full(len(rooms), len(walls), dtype=np.int64)  # The first wall out of each area
+        np.minimum.at(earliest, root_first, places)
+        np.minimum.at(earliest, root_second, places)
+        removed = np.unique(earliest[earliest < len(walls)])
+        cells[walls[removed]] = Maze.space
+        parent = _join_roots(parent, root_first[removed], root_second[removed])
+    return Maze.from_buffer(width, height, bytearray(cells), connected=True)
+
+def largest_area(walls):
+    ''' Given a boolean array of walls (subscripted [y, x]), return it with every empty cell that isn't part of the
+        largest connected area of empty cells turned into a wall
+    '''
+    height, width = walls.shape
+    padded = np.ones((height + 2, width + 2), dtype=np.uint8)
+    padded[1:-1, 1:-1] = walls
+    labels, _, sizes = _label_components(padded.ravel(), width + 2)
+    if labels is None:
+        return walls  # There's no more than one area already
+    return labels.reshape(height + 2, width + 2)[1:-1, 1:-1] != np.argmax(sizes)
+
+def caves(width, height, density=0.45, steps=4, connected=True, seed=None):
+    ''' Return a maze of caves, grown from walls scattered with the given density by 'steps' rounds of a cellular
+        automaton: a wall survives if at least four of its eight neighbours are walls, and an empty cell becomes a
+        wall if at least five are (anything outside the maze counts as wall).
+    '''
+    rng = np.random.RandomState(seed)
+    walls = rng.random_sample((height, width)) < density
+    for _ in xrange(steps):
+        padded = np.ones((height + 2, width + 2), dtype=np.uint8)
+        padded[1:-1, 1:-1] = walls
+        neighbours = sum(padded[1 + dy:height + 1 + dy, 1 + dx:width + 1 + dx]
+                         for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dx or dy)
+        walls = neighbours >= np.where(walls, 4, 5)
+    if connected:
+        walls = largest_area(walls)
+    return Maze.from_array(walls.astype(np.uint8), connected)
+
+def obstacles(width, height, density=0.3, connected=True, seed=None):
+    ''' Return a maze of single-cell walls scattered at random with the given density '''
+    rng = np.random.RandomState(seed)
+    walls = rng.random_sample((height, width)) < density
+    if connected:
+        walls = largest_area(walls)
+    return Maze.from_array(walls.astype(np.uint8), connected)
+
+GENERATORS = {"backtracker": backtracker, "kruskal": kruskal, "caves": caves, "obstacles": obstacles}
+
+def stream(generator, width, height, count=None, seed=None, **params):
+    ''' Generate 'count' mazes (or an endless stream, if it's None) with the given generator function (or the name
+        of one in GENERATORS) and parameters. The seed of each maze is drawn from a random.Random seeded with 'seed',
+        so the whole stream is reproducible.
+    '''
+    if isinstance(generator, basestring):
+        generator = GENERATORS[generator]
+    rng = random.Random(seed)
+    for _ in (xrange(count) if count is not None else counter()):
+        yield generator(width, height, seed=rng.getrandbits(32), **params)
+
+
+class GenerateTest(unittest.TestCase):
+    ''' Test the maze generators '''
+
+    def assertConnected(self, maze):
+        ''' Check that every empty cell can be reached from every other one '''
+        ys, xs = np.nonzero(maze.array() == Maze.space)
+        self.assertTrue(len(xs))
+        distances = maze.distance_array(Position(xs[0], ys[0]))
+        self.assertTrue((distances[ys, xs] < np.iinfo(distances.dtype).max).all())
+        self.assertEqual(maze.component_sizes(), Maze.from_array(maze.array()).component_sizes())  # Not just assumed
+
+    def test_perfect_mazes(self):
+        for generator in (backtracker, kruskal):
+            for width, height in ((1, 1), (2, 2), (9, 7), (30, 21), (31, 22)):
+                maze = generator(width, height, seed=1)
+                self.assertEqual((maze.width, maze.height), (width, height))
+                self.assertConnected(maze)
+                rooms = ((width + 1) // 2) * ((height + 1) // 2)
+                self.assertEqual(maze.empty_cells(), 2 * rooms - 1)  # A tree: rooms, and one corridor less
+            self.assertEqual(repr(generator(15, 15, seed=3)), repr(generator(15, 15, seed=3)))
+            self.assertNotEqual(repr(generator(15, 15, seed=3)), repr(generator(15, 15, seed=4)))
+
+    def test_open_mazes(self):
+        for generator in (caves, obstacles):
+            maze = generator(60, 40, seed=2)
+            self.assertEqual((maze.width, maze.height), (60, 40))
+            self.assertConnected(maze)
+            self.assertEqual(repr(generator(20, 20, seed=3)), repr(generator(20, 20, seed=3)))
+        sparse = obstacles(100, 100, density=0.1, connected=False, seed=0)
+        self.assertAlmostEqual(sparse.array().mean(), 0.1, delta=0.02)
+
+    def test_largest_area(self):
+        walls = np.array([[0, 1, 0, 0],
+                          [0, 1, 0, 0],
+                          [1, 1, 1, 0]], dtype=bool)
+        expected = np.array([[1, 1, 0, 0],
+                             [1, 1, 0, 0],
+                             [1, 1, 1, 0]], dtype=bool)
+        self.assertTrue((largest_area(walls) == expected).all())
+        self.assertTrue(largest_area(np.ones((2, 2), dtype=bool)).all())
+
+    def test_stream(self):
+        from goodies import RandomGoody
+        from baddies import RandomBaddy
+        mazes = [repr(maze) for maze in stream("caves", 20, 20, count=3, seed=5)]
+        self.assertEqual(mazes, [repr(maze) for maze in stream(caves, 20, 20, count=3, seed=5)])
+        self.assertEqual(len(set(mazes)), 3)
+        games = game_generator(stream("kruskal", 11, 11, seed=0), iter(RandomGoody, None), iter(RandomGoody, None),
+                               iter(RandomBaddy, None), max_rounds=100)
+        for game in islice(games, 5):
+            game.play()
+            self.assertIsInstance(game.position[game.baddy], Position)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -4,14 +4,19 @@
     Definitions for some example goodies
 '''
 
-import random
+import unittest
 import numpy as np
 
+from heapq import heappop, heappush
+
 from maze import Goody, UP, DOWN, LEFT, RIGHT, STAY, PING
+from batch import BatchGoody, choose_unobstructed
 
 class StaticGoody(Goody):
     ''' A static goody - does not move from its initial position '''
 
+    stateless = True
+
     def take_turn(self, _obstruction, _ping_response):
         ''' Stay where we are '''
         return STAY
@@ -22,7 +27,23 @@ class RandomGoody(Goody):
     def take_turn(self, obstruction, _ping_response):
         ''' Ignore any ping information, just choose a random direction to walk in, or ping '''
         possibilities = filter(lambda direction: not obstruction[direction], [UP, DOWN, LEFT, RIGHT]) + [PING]
-        return random.choice(possibilities)
+        return self.rng.choice(possibilities)
+
+class BatchStaticGoody(BatchGoody):
+    ''' A vectorised StaticGoody '''
+
+    stateless = True
+
+    def take_turns(self, obstruction_masks, _ping_responses):
+        ''' Stay where we are, in every game '''
+        return np.full(len(obstruction_masks), STAY.code)
+
+class BatchRandomGoody(BatchGoody):
+    ''' A vectorised RandomGoody '''
+
+    def take_turns(self, obstruction_masks, _ping_responses):
+        ''' Choose a random unobstructed direction to walk in, or ping, in every game '''
+        return choose_unobstructed(self.rng, obstruction_masks, extra=[PING.code])
 
 ''' No obstruction '''
 EMPTY = 0
@@ -30,15 +51,20 @@ EMPTY = 0
 FULL = 1
 ''' Not yet discovered '''
 UNKNOWN = 2
+
+''' How far SmartGoody.a_star will search from its source in each direction '''
+A_STAR_REACH = 51
+INFINITY = float("inf")
 		
 class SmartGoody(Goody):
 	''' Maintains an expandable array containing all map information found so far, and [INSERT THE CLEVER THING IT DOES] '''
 	
+	# The positions we track, which must be shifted whenever the grid grows to the left or top
+	TRACKED_POSITIONS = ("pos", "other_goody_pos", "baddy_pos", "current_target_pos")
+	
 	def __init__(self):
-		# Grid as assembled so far
-		self.grid = np.array([[EMPTY]])
-		self.width = 1
-		self.height = 1
+		# Grid as assembled so far. This sets self.width and self.height too.
+		self.grid = np.array([[EMPTY]], dtype=np.uint8)
 		# Number of turns taken
 		self.turn = 0
 		# Conventionally, -1 means no ping yet
@@ -70,8 +96,8 @@ class SmartGoody(Goody):
 			self.expand_to_include(self.baddy_pos)
 			
 			# Mark the grid cells containing players as EMPTY
-			self.grid[ self.other_goody_pos[0] ][ self.other_goody_pos[1] ] = EMPTY
-			self.grid[ self.baddy_pos[0] ][ self.baddy_pos[1] ] = EMPTY
+			self.set_grid_cell(self.other_goody_pos, EMPTY)
+			self.set_grid_cell(self.baddy_pos, EMPTY)
 			
 			self.choose_target()
 			
@@ -90,25 +116,25 @@ class SmartGoody(Goody):
 		if self.turns_since_last_ping == -1:
 			return PING
 			
-		while self.have_in_grid(self.current_target_pos) and self.grid[ self.current_target_pos[0] ][ self.current_target_pos[1] ] == FULL:
-			self.current_target_pos[0] += random.randint(-1,1)
-			self.current_target_pos[1] += random.randint(-1,1)
+		while self.have_in_grid(self.current_target_pos) and self.safe_get_point_in_grid(self.current_target_pos) == FULL:
+			self.current_target_pos[0] += self.rng.randint(-1,1)
+			self.current_target_pos[1] += self.rng.randint(-1,1)
 		
 		#print "Target cell ",self.current_target_pos," is ",self.grid[ self.current_target_pos[0] ][ self.current_target_pos[1] ]
 		
-		path = self.a_star(self.pos, self.current_target_pos)
+		path = self.find_path(self.pos, self.current_target_pos)
 		
 		#print path
 		
 		if path is None:
-			if(random.random() > 0.5):
+			if(self.rng.random() > 0.5):
 				return STAY
 			else:
 				return PING
 		if len(path) >= 2:
 			path = path[-2]
 		else:
-			if(random.random() > 0.5):
+			if(self.rng.random() > 0.5):
 				return STAY
 			else:
 				return PING
@@ -124,7 +150,7 @@ class SmartGoody(Goody):
 			choice = LEFT
 		
 		if obstruction[choice]:
-			if(random.random() > 0.5):
+			if(self.rng.random() > 0.5):
 				return STAY
 			else:
 				return PING
@@ -182,28 +208,68 @@ class SmartGoody(Goody):
 		''' L2 norm '''
 		return (delta[0]*delta[0] + delta[1]*delta[1]) ** 0.5
 	
+	@property
+	def grid(self):
+		''' The grid as assembled so far, subscripted [x][y]. This is a view onto a larger storage array. '''
+		return self._grid
+	
+	@grid.setter
+	def grid(self, grid):
+		self._storage = grid
+		self._origin = [0, 0]  # The position of grid[0][0] in the storage array
+		self._grid = grid
+		self.width, self.height = grid.shape
+	
 	def expand(self, delta_shape):
-		''' Expand the array by the amount indicated in delta_shape, and update coordinates appropriately '''
-		
-		self.grid = np.pad(self.grid, [ delta_shape[1], delta_shape[0] ], mode='constant', constant_values=UNKNOWN)
-		self.width += delta_shape[1][0] + delta_shape[1][1]
-		self.height += delta_shape[0][0] + delta_shape[0][1]
-		
-		self.pos[0] += delta_shape[1][0]
-		self.pos[1] += delta_shape[0][0]
-		
-		if(self.other_goody_pos != None):
-			self.other_goody_pos[0] += delta_shape[1][0]
-			self.other_goody_pos[1] += delta_shape[0][0]
-		
-		if(self.baddy_pos != None):
-			self.baddy_pos[0] += delta_shape[1][0]
-			self.baddy_pos[1] += delta_shape[0][0]
-		
-		if(self.current_target_pos != None):
-			self.current_target_pos[0] += delta_shape[1][0]
-			self.current_target_pos[1] += delta_shape[0][0]		
-		
+		''' Expand the array by the amount indicated in delta_shape, and update coordinates appropriately.
+		
+		The grid lives in a larger storage array, which doubles in size (and is recentred) whenever the grid
+		outgrows it. So usually expanding only moves the grid's bounds within the storage, and the cost of copying
+		is amortised over many expansions.
+		'''
+		(top, bottom), (left, right) = delta_shape
+		width = self.width + left + right
+		height = self.height + top + bottom
+		x0 = self._origin[0] - left
+		y0 = self._origin[1] - top
+		
+		capacity_x, capacity_y = self._storage_shape()
+		if x0 < 0 or y0 < 0 or x0 + width > capacity_x or y0 + height > capacity_y:
+			capacity_x = max(2 * capacity_x, 2 * width)
+			capacity_y = max(2 * capacity_y, 2 * height)
+			x0 = (capacity_x - width) // 2
+			y0 = (capacity_y - height) // 2
+			self._reallocate(capacity_x, capacity_y, x0 + left, y0 + top)
+		
+		self._set_bounds(x0, y0, width, height)
+		self.shift(left, top)
+	
+	def _storage_shape(self):
+		''' Private - the (x, y) capacity of the storage array '''
+		return self._storage.shape
+	
+	def _reallocate(self, capacity_x, capacity_y, x, y):
+		''' Private - replace the storage with a new array of the given capacity, filled with UNKNOWN, copying the
+		current grid to (x, y) in it
+		'''
+		storage = np.full((capacity_x, capacity_y), UNKNOWN, dtype=self._storage.dtype)
+		storage[x:x + self.width, y:y + self.height] = self._grid
+		self._storage = storage
+	
+	def _set_bounds(self, x0, y0, width, height):
+		''' Private - make the grid the given region of the storage array '''
+		self._origin = [x0, y0]
+		self._grid = self._storage[x0:x0 + width, y0:y0 + height]
+		self.width = width
+		self.height = height
+	
+	def shift(self, dx, dy):
+		''' Move all our tracked positions by (dx, dy), because the grid has grown to the left or top '''
+		for name in self.TRACKED_POSITIONS:
+			position = getattr(self, name)
+			if position is not None:
+				position[0] += dx
+				position[1] += dy
 	
 	def expand_to_include(self, pos):
 		''' Expand to include the position given, pos, and a buffer of one surrounding cell, in the array '''
@@ -222,91 +288,116 @@ class SmartGoody(Goody):
 			
 	def store_obstruction_data(self, obstruction):
 		''' Store, in our grid, the given information about obstructions relative to ourself '''
-		if obstruction[UP]:
-			self.grid[ self.pos[0] ][ self.pos[1] - 1 ] = FULL
-		else:
-			self.grid[ self.pos[0] ][ self.pos[1] - 1 ] = EMPTY
-		
-		if obstruction[LEFT]:
-			self.grid[ self.pos[0] - 1 ][ self.pos[1] ] = FULL
-		else:
-			self.grid[ self.pos[0] - 1 ][ self.pos[1] ] = EMPTY
-		
-		if obstruction[DOWN]: 
-			self.grid[ self.pos[0] ][ self.pos[1] + 1 ] = FULL
-		else:
-			self.grid[ self.pos[0] ][ self.pos[1] + 1 ] = EMPTY
-		
-		if obstruction[RIGHT]:
-			self.grid[ self.pos[0] + 1 ][ self.pos[1] ] = FULL
-		else:
-			self.grid[ self.pos[0] + 1 ][ self.pos[1] ] = EMPTY
-		
-	def a_star(self, src_list, dest_list):
-		''' Return a path between the given source and destination '''
-		# Make sure these are tuples! We need them to be hashable as keys
-		src = (src_list[0], src_list[1])
-		dest = (dest_list[0], dest_list[1])
+		self.set_grid_cell([ self.pos[0], self.pos[1] - 1 ], FULL if obstruction[UP] else EMPTY)
+		self.set_grid_cell([ self.pos[0] - 1, self.pos[1] ], FULL if obstruction[LEFT] else EMPTY)
+		self.set_grid_cell([ self.pos[0], self.pos[1] + 1 ], FULL if obstruction[DOWN] else EMPTY)
+		self.set_grid_cell([ self.pos[0] + 1, self.pos[1] ], FULL if obstruction[RIGHT] else EMPTY)
 	
-		closed_set = []
-		open_set = [src]
-		came_from = {}
-		
-		start_to_here_cost = {}	# Default value infinity
-		start_to_here_cost[src] = 0
-		
-		start_to_goal_via_here_cost = {} # Default value of infinity
-		start_to_goal_via_here_cost[src] = self.cost_estimate(src, dest)
+	def set_grid_cell(self, pt, value):
+		''' Store a value in our grid. The point must lie in the grid. '''
+		self.grid[ pt[0] ][ pt[1] ] = value
+	
+	def find_path(self, src, dest):
+		''' Return a path between the given source and destination, in the format returned by a_star '''
+		return self.a_star(src, dest)
 		
-		while len(open_set) > 0:
-			# Choose next best point 
-			min_cost = -1 # -1 denotes infinity
-			current = None
-			
-			for pt in open_set:
-				if pt in start_to_goal_via_here_cost:
-					if (start_to_goal_via_here_cost[pt] < min_cost) or (min_cost == -1):
-						current = pt
-						min_cost = start_to_goal_via_here_cost[pt]
-				elif current is None:
-					current = pt
+	def a_star(self, src_list, dest_list):
+		''' Return a path between the given source and destination, as a list of (x, y) tuples from dest back to src.
+		
+		The search is bounded to a square of side 2 * A_STAR_REACH + 1 around the source. Within that it only needs
+		the grid, the source and the destination, with a border of one cell: beyond those everything is unknown, so
+		a path that strays further out and back is always longer than one that follows the border. Its state is held
+		in flat arrays over that rectangle, and the open set is a binary heap ordered by (estimated cost, order of
+		discovery) - so ties are broken in favour of the cell discovered first.
+		'''
+		if max(abs(dest_list[0] - src_list[0]), abs(dest_list[1] - src_list[1])) > A_STAR_REACH:
+			return None  # Out of reach
+		x0 = max(src_list[0] - A_STAR_REACH, min(0, src_list[0], dest_list[0]) - 1)
+		y0 = max(src_list[1] - A_STAR_REACH, min(0, src_list[1], dest_list[1]) - 1)
+		width = min(src_list[0] + A_STAR_REACH, max(self.width - 1, src_list[0], dest_list[0]) + 1) + 1 - x0
+		height = min(src_list[1] + A_STAR_REACH, max(self.height - 1, src_list[1], dest_list[1]) + 1) + 1 - y0
+		dest_x = dest_list[0] - x0
+		dest_y = dest_list[1] - y0
+		
+		# Cells in the rectangle are indexed by (x - x0) * height + (y - y0)
+		cells = self.grid_window(x0, y0, width, height).ravel().tolist()
+		src = (src_list[0] - x0) * height + src_list[1] - y0
+		dest = dest_x * height + dest_y
+		
+		cost_to_here = [INFINITY] * len(cells)
+		came_from = [-1] * len(cells)
+		discovery_order = [0] * len(cells)
+		closed = bytearray(len(cells))
+		move_costs = [None] * 3  # Indexed by cell value. None means impassable.
+		move_costs[EMPTY] = self.cost_of_moving_to(EMPTY)
+		move_costs[UNKNOWN] = self.cost_of_moving_to(UNKNOWN)
+		
+		cost_to_here[src] = 0
+		open_heap = [(self.cost_estimate(dest_list, src_list), 0, src)]
+		discovered = 1
+		
+		while open_heap:
+			# Choose next best point
+			_, _, current = heappop(open_heap)
+			if closed[current]:
+				continue  # A stale entry - this cell was pushed again when a cheaper route to it was found
 			
 			if current == dest:
-				path = [current]
-				while current in came_from.keys():
+				path = []
+				while current != -1:
+					path.append((current // height + x0, current % height + y0))
 					current = came_from[current]
-					path.append(current)
 				return path
 			
-			open_set.remove(current)
-			closed_set.append(current)
+			closed[current] = True
 			
-			# Lookup neighbours which are not known to be full, and bound our search to a roughly 100x100 square around ourselves
+			# Lookup neighbours which are not known to be full and are within our square
+			x, y = divmod(current, height)
 			neighbours = []
-			if (current[0]-src[0] >= -50) and (self.safe_get_point_in_grid([ current[0] - 1, current[1]     ]) != FULL):
-				neighbours.append( (current[0] - 1, current[1]) )
-			if (current[1]-src[1] >= -50) and (self.safe_get_point_in_grid([ current[0]    , current[1] - 1 ]) != FULL):
-				neighbours.append( (current[0], current[1] - 1) )
-			if (current[0]-src[0] <= 50) and  (self.safe_get_point_in_grid([ current[0] + 1, current[1]     ]) != FULL):
-				neighbours.append( (current[0] + 1, current[1]) )
-			if (current[1]-src[1] <= 50) and  (self.safe_get_point_in_grid([ current[0]    , current[1] + 1 ]) != FULL):
-				neighbours.append( (current[0], current[1] + 1) )
+			if x > 0:
+				neighbours.append(current - height)
+			if y > 0:
+				neighbours.append(current - 1)
+			if x < width - 1:
+				neighbours.append(current + height)
+			if y < height - 1:
+				neighbours.append(current + 1)
 			
 			for neighbour in neighbours:
-				if neighbour in closed_set:
+				move_cost = move_costs[cells[neighbour]]
+				if move_cost is None or closed[neighbour]:
 					continue
-				tentative_start_to_here_cost = start_to_here_cost[current] + self.cost_of_moving_to(self.safe_get_point_in_grid(neighbour))
-				if neighbour not in open_set:
-					open_set.append(neighbour)
-				elif tentative_start_to_here_cost >= start_to_here_cost[neighbour]:
+				tentative_cost_to_here = cost_to_here[current] + move_cost
+				if cost_to_here[neighbour] == INFINITY:
+					discovered += 1
+					order = discovered
+				elif tentative_cost_to_here >= cost_to_here[neighbour]:
 					continue
+				else:
+					order = discovery_order[neighbour]
 				
 				came_from[neighbour] = current
-				start_to_here_cost[neighbour] = tentative_start_to_here_cost
-				start_to_goal_via_here_cost[neighbour] = tentative_start_to_here_cost + self.cost_estimate(neighbour, dest)
+				cost_to_here[neighbour] = tentative_cost_to_here
+				discovery_order[neighbour] = order
+				neighbour_x, neighbour_y = divmod(neighbour, height)
+				heappush(open_heap, (tentative_cost_to_here + abs(neighbour_x - dest_x) + abs(neighbour_y - dest_y),
+				                     order, neighbour))
 		
 		return None
 
+	def grid_window(self, x0, y0, width, height):
+		''' Return a (width, height) array copied from our grid, starting at (x0, y0). Cells beyond the grid are UNKNOWN. '''
+		window = np.full((width, height), UNKNOWN, dtype=self.grid.dtype)
+		left, top = max(x0, 0), max(y0, 0)
+		right, bottom = min(x0 + width, self.width), min(y0 + height, self.height)
+		if left < right and top < bottom:
+			window[left - x0:right - x0, top - y0:bottom - y0] = self._grid_region(left, top, right, bottom)
+		return window
+	
+	def _grid_region(self, left, top, right, bottom):
+		''' Private - return the cells of the grid from (left, top) up to (right, bottom), which must lie in it '''
+		return self.grid[left:right, top:bottom]
+
 	def safe_get_point_in_grid(self, pt):
 		''' Look up the cell at the given point relative to us, returning UNKNOWN if it's out of the grid '''
 		if not self.have_in_grid(pt):
@@ -328,4 +419,358 @@ class SmartGoody(Goody):
 	def cost_estimate(self, src, dest):
 		''' Taxicab metric '''
 		return abs(src[0] - dest[0]) + abs(src[1] - dest[1])
-		
\ No newline at end of file
+
+
+class IncrementalPlanner(object):
+	''' An incremental path planner (D* Lite) for a SmartGoody, working over a square window of its grid.
+	
+	The planner searches backwards from a fixed goal, and keeps its search tree between calls to path(). When cells
+	in the window change (see set_cell), or the start moves, only the affected parts of the tree are repaired.
+	Moving the goal requires a new planner.
+	
+	'cells' is a flat list of the cell values in the window, indexed by (x - x0) * size + (y - y0).
+	'move_costs' maps a cell value to the cost of moving into it - None if it is impassable.
+	'''
+	
+	def __init__(self, cells, x0, y0, size, goal, start, move_costs):
+		self.cells = cells
+		self.x0 = x0
+		self.y0 = y0
+		self.size = size
+		self.move_costs = [INFINITY if cost is None else cost for cost in move_costs]
+		
+		self.g = [INFINITY] * len(cells)
+		self.rhs = [INFINITY] * len(cells)
+		self.queued_key = [None] * len(cells)  # The key of each cell in the heap, or None if it isn't queued
+		self.heap = []
+		self.km = 0  # Added to every key, to account for the start moving
+		
+		self.goal = self.index(goal)
+		self.start = self.index(start)
+		self.rhs[self.goal] = 0
+		self.update_vertex(self.goal)
+	
+	def index(self, pt):
+		''' Return the index of the given grid point, or None if it is outside the window '''
+		x = pt[0] - self.x0
+		y = pt[1] - self.y0
+		if not (0 <= x < self.size and 0 <= y < self.size):
+			return None
+		return x * self.size + y
+	
+	def point(self, index):
+		''' Return the grid point, as an (x, y) tuple, of the given index '''
+		x, y = divmod(index, self.size)
+		return (x + self.x0, y + self.y0)
+	
+	def goal_point(self):
+		''' Return the goal as an (x, y) tuple '''
+		return self.point(self.goal)
+	
+	def shift(self, dx, dy):
+		''' The grid has been expanded, moving every grid point by (dx, dy) '''
+		self.x0 += dx
+		self.y0 += dy
+	
+	def neighbours(self, index):
+		''' Return the indices of the cells adjacent to the given one, within the window '''
+		size = self.size
+		x, y = divmod(index, size)
+		neighbours = []
+		if x > 0:
+			neighbours.append(index - size)
+		if y > 0:
+			neighbours.append(index - 1)
+		if x < size - 1:
+			neighbours.append(index + size)
+		if y < size - 1:
+			neighbours.append(index + 1)
+		return neighbours
+	
+	def heuristic(self, a, b):
+		''' Taxicab metric between two indices '''
+		ax, ay = divmod(a, self.size)
+		bx, by = divmod(b, self.size)
+		return abs(ax - bx) + abs(ay - by)
+	
+	def key(self, index):
+		g_rhs = min(self.g[index], self.rhs[index])
+		return (g_rhs + self.heuristic(self.start, index) + self.km, g_rhs)
+	
+	def update_vertex(self, index):
+		''' (Re)queue the cell if it is inconsistent, otherwise dequeue it '''
+		if self.g[index] != self.rhs[index]:
+			key = self.key(index)
+			self.queued_key[index] = key
+			heappush(self.heap, (key, index))
+		else:
+			self.queued_key[index] = None  # Any entries left in the heap are now stale
+	
+	def best_successor_cost(self, index):
+		''' The lowest cost of reaching the goal via one of the given cell's neighbours '''
+		cells, move_costs, g = self.cells, self.move_costs, self.g
+		return min(move_costs[cells[neighbour]] + g[neighbour] for neighbour in self.neighbours(index))
+	
+	def set_cell(self, pt, value):
+		''' Tell the planner that a cell of the grid now has the given value '''
+		index = self.index(pt)
+		if index is None or self.cells[index] == value:
+			return
+		old_cost = self.move_costs[self.cells[index]]
+		self.cells[index] = value
+		new_cost = self.move_costs[value]
+		
+		# The cost of moving into this cell from each of its neighbours has changed
+		g = self.g[index]
+		for neighbour in self.neighbours(index):
+			if neighbour == self.goal:
+				continue
+			if new_cost < old_cost:
+				self.rhs[neighbour] = min(self.rhs[neighbour], new_cost + g)
+			elif self.rhs[neighbour] == old_cost + g:
+				self.rhs[neighbour] = self.best_successor_cost(neighbour)
+			self.update_vertex(neighbour)
+	
+	def compute_shortest_path(self):
+		''' Process inconsistent cells until the start is consistent '''
+		g, rhs, heap, queued_key = self.g, self.rhs, self.heap, self.queued_key
+		cells, move_costs = self.cells, self.move_costs
+		while heap:
+			key, index = heap[0]
+			if queued_key[index] != key:
+				heappop(heap)  # Stale
+				continue
+			if not (key < self.key(self.start) or rhs[self.start] != g[self.start]):
+				break
+			heappop(heap)
+			new_key = self.key(index)
+			if key < new_key:
+				queued_key[index] = new_key
+				heappush(heap, (new_key, index))
+				continue
+			queued_key[index] = None
+			
+			if g[index] > rhs[index]:
+				g[index] = rhs[index]
+				cost = move_costs[cells[index]]
+				for neighbour in self.neighbours(index):
+					if neighbour != self.goal and cost + g[index] < rhs[neighbour]:
+						rhs[neighbour] = cost + g[index]
+						self.update_vertex(neighbour)
+			else:
+				old_g = g[index]
+				g[index] = INFINITY
+				cost = move_costs[cells[index]]
+				for neighbour in self.neighbours(index) + [index]:
+					if neighbour != self.goal and (neighbour == index or rhs[neighbour] == cost + old_g):
+						rhs[neighbour] = self.best_successor_cost(neighbour)
+					self.update_vertex(neighbour)
+	
+	def path(self, start):
+		''' Return a path from the start point to the goal, in the format returned by SmartGoody.a_star '''
+		start = self.index(start)
+		if start is None:
+			return None
+		self.km += self.heuristic(self.start, start)
+		self.start = start
+		self.compute_shortest_path()
+		if self.g[start] == INFINITY:
+			return None
+		
+		cells, move_costs, g = self.cells, self.move_costs, self.g
+		path = [start]
+		while path[-1] != self.goal and len(path) <= len(cells):
+			path.append(min(self.neighbours(path[-1]),
+			                key=lambda neighbour: move_costs[cells[neighbour]] + g[neighbour]))
+		path.reverse()
+		return [self.point(index) for index in path]
+
+
+class IncrementalSmartGoody(SmartGoody):
+	''' A SmartGoody that keeps its plan between turns with an IncrementalPlanner, rather than running a_star from
+	scratch every turn. The planner is only rebuilt when the target moves, or we leave its window.
+	'''
+	
+	def __init__(self):
+		super(IncrementalSmartGoody, self).__init__()
+		self.planner = None
+	
+	def find_path(self, src, dest):
+		''' Return a path between the given source and destination, in the format returned by a_star '''
+		if self.planner is None or self.planner.goal_point() != tuple(dest) or self.planner.index(src) is None:
+			size = 2 * A_STAR_REACH + 1
+			x0 = dest[0] - A_STAR_REACH
+			y0 = dest[1] - A_STAR_REACH
+			move_costs = [None] * 3
+			move_costs[EMPTY] = self.cost_of_moving_to(EMPTY)
+			move_costs[UNKNOWN] = self.cost_of_moving_to(UNKNOWN)
+			self.planner = IncrementalPlanner(self.grid_window(x0, y0, size, size).ravel().tolist(), x0, y0, size,
+			                                  dest, src, move_costs)
+		return self.planner.path(src)
+	
+	def set_grid_cell(self, pt, value):
+		super(IncrementalSmartGoody, self).set_grid_cell(pt, value)
+		if self.planner is not None:
+			self.planner.set_cell(pt, value)
+	
+	def shift(self, dx, dy):
+		super(IncrementalSmartGoody, self).shift(dx, dy)
+		if self.planner is not None:
+			self.planner.shift(dx, dy)
+
+class PackedSmartGoody(SmartGoody):
+	''' A SmartGoody which packs its grid into two bits per cell, rather than a byte, so that many more of them fit in
+	memory. The cell values are unchanged - EMPTY, FULL and UNKNOWN.
+	
+	The storage is a bytearray holding each column of the storage array in turn (so it's subscripted [x][y] like the
+	grid), four cells to a byte with the lowest y in the lowest bits. Reading 'grid' returns an unpacked copy.
+	'''
+	
+	@property
+	def grid(self):
+		''' An unpacked copy of the grid as assembled so far, subscripted [x][y] '''
+		return self._grid_region(0, 0, self.width, self.height)
+	
+	@grid.setter
+	def grid(self, grid):
+		grid = np.asarray(grid, dtype=np.uint8)
+		self._capacity = (grid.shape[0], -(-grid.shape[1] // 4) * 4)
+		storage = np.full(self._capacity, UNKNOWN, dtype=np.uint8)
+		storage[:, :grid.shape[1]] = grid
+		self._pack(storage)
+		self._origin = [0, 0]
+		self.width, self.height = grid.shape
+	
+	def _pack(self, storage):
+		''' Private - pack a whole storage array into self._storage '''
+		quads = storage.reshape(self._capacity[0], -1, 4)
+		packed = quads[..., 0] | quads[..., 1] << 2 | quads[..., 2] << 4 | quads[..., 3] << 6
+		self._storage = bytearray(packed.tobytes())
+	
+	def _storage_shape(self):
+		return self._capacity
+	
+	def _reallocate(self, capacity_x, capacity_y, x, y):
+		grid = self.grid
+		self._capacity = (capacity_x, -(-capacity_y // 4) * 4)
+		storage = np.full(self._capacity, UNKNOWN, dtype=np.uint8)
+		storage[x:x + self.width, y:y + self.height] = grid
+		self._pack(storage)
+	
+	def _set_bounds(self, x0, y0, width, height):
+		self._origin = [x0, y0]
+		self.width = width
+		self.height = height
+	
+	def _grid_region(self, left, top, right, bottom):
+		x0, y0 = self._origin[0] + left, self._origin[1] + top
+		first, last = y0 // 4, -(-(self._origin[1] + bottom) // 4)
+		packed = np.frombuffer(self._storage, dtype=np.uint8).reshape(self._capacity[0], -1)
+		packed = packed[x0:self._origin[0] + right, first:last]
+		cells = (packed[..., None] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 3
+		return cells.reshape(len(packed), -1)[:, y0 - 4 * first:y0 - 4 * first + bottom - top]
+	
+	def set_grid_cell(self, pt, value):
+		''' Store a value in our grid. The point must lie in the grid. '''
+		y = pt[1] + self._origin[1]
+		index = (pt[0] + self._origin[0]) * (self._capacity[1] // 4) + (y >> 2)
+		shift = (y & 3) * 2
+		self._storage[index] = self._storage[index] & ~(3 << shift) | value << shift
+	
+	def safe_get_point_in_grid(self, pt):
+		''' Look up the cell at the given point relative to us, returning UNKNOWN if it's out of the grid '''
+		if not self.have_in_grid(pt):
+			return UNKNOWN
+		y = pt[1] + self._origin[1]
+		return self._storage[(pt[0] + self._origin[0]) * (self._capacity[1] // 4) + (y >> 2)] >> (y & 3) * 2 & 3
+
+
+class SmartGoodyTest(unittest.TestCase):
+    ''' Test SmartGoody's path finding '''
+
+    goody_cls = SmartGoody
+
+    def setUp(self):
+        self.goody = self.goody_cls()
+        # Subscripted [x][y]
+        self.goody.grid = np.array([[EMPTY, EMPTY,   EMPTY, EMPTY],
+                                    [EMPTY, FULL,    FULL,  EMPTY],
+                                    [EMPTY, UNKNOWN, FULL,  EMPTY],
+                                    [EMPTY, FULL,    EMPTY, EMPTY]])
+
+    def test_a_star_avoids_walls(self):
+        path = self.goody.a_star([2, 3], [2, 1])
+        self.assertEqual(path[0], (2, 1))
+        self.assertEqual(path[-1], (2, 3))
+        for (x0, y0), (x1, y1) in zip(path, path[1:]):
+            self.assertEqual(abs(x1 - x0) + abs(y1 - y0), 1)
+        self.assertNotIn(FULL, [self.goody.safe_get_point_in_grid(point) for point in path])
+
+    def test_a_star_through_unknown(self):
+        self.assertEqual(self.goody.a_star([2, 0], [2, 1]), [(2, 1), (2, 0)])
+        self.assertIsNone(self.goody.a_star([2, 0], [1, 2]))
+
+    def test_a_star_out_of_reach(self):
+        self.assertIsNone(self.goody.a_star([0, 0], [0, A_STAR_REACH + 1]))
+        self.assertEqual(self.goody.a_star([0, 0], [0, 0]), [(0, 0)])
+
+    def test_expand(self):
+        original = self.goody.grid.copy()
+        self.goody.pos = [1, 2]
+        self.goody.current_target_pos = [3, 3]
+        for _ in xrange(20):
+            self.goody.expand(((1, 2), (3, 0)))  # (top, bottom), (left, right)
+        self.assertEqual(self.goody.grid.shape, (4 + 60, 4 + 60))
+        self.assertEqual((self.goody.width, self.goody.height), (64, 64))
+        self.assertEqual(self.goody.pos, [61, 22])
+        self.assertEqual(self.goody.current_target_pos, [63, 23])
+        self.assertTrue((self.goody.grid[60:64, 20:24] == original).all())
+        self.assertEqual((self.goody.grid == UNKNOWN).sum(), 64 * 64 - 16 + (original == UNKNOWN).sum())
+
+
+class IncrementalSmartGoodyTest(SmartGoodyTest):
+    ''' Run the SmartGoody tests against IncrementalSmartGoody, and check its planner against A* '''
+
+    goody_cls = IncrementalSmartGoody
+
+    def test_planner_matches_a_star(self):
+        reference = SmartGoody()
+        reference.grid = self.goody.grid
+        path_cost = lambda path: sum(reference.cost_of_moving_to(reference.safe_get_point_in_grid(point))
+                                     for point in path[:-1])
+        self.assertEqual(path_cost(self.goody.find_path([0, 3], [3, 0])), path_cost(reference.a_star([0, 3], [3, 0])))
+        for pt, value in (([1, 0], FULL), ([2, 1], EMPTY), ([2, 2], EMPTY), ([1, 1], UNKNOWN), ([2, 2], FULL)):
+            self.goody.set_grid_cell(pt, value)  # They share a grid
+            self.assertAlmostEqual(path_cost(self.goody.find_path([0, 3], [3, 0])),
+                                   path_cost(reference.a_star([0, 3], [3, 0])))
+
+
+class PackedSmartGoodyTest(SmartGoodyTest):
+    ''' Run the SmartGoody tests against PackedSmartGoody '''
+
+    goody_cls = PackedSmartGoody
+
+    def test_cells(self):
+        unpacked = SmartGoody()
+        unpacked.grid = self.goody.grid
+        self.assertEqual(len(self.goody._storage), 4)  # Four columns of four cells
+        for pt, value in (([0, 0], FULL), ([3, 3], UNKNOWN), ([2, 1], EMPTY), ([1, 3], FULL)):
+            for goody in (self.goody, unpacked):
+                goody.set_grid_cell(pt, value)
+            self.assertEqual(self.goody.safe_get_point_in_grid(pt), value)
+        self.assertTrue((self.goody.grid == unpacked.grid).all())
+        self.assertEqual(self.goody.grid_window(-3, 1, 9, 5).tolist(), unpacked.grid_window(-3, 1, 9, 5).tolist())
+        self.assertEqual(self.goody.safe_get_point_in_grid([4, 0]), UNKNOWN)
+
+    def test_same_game(self):
+        from mazes import OPEN
+        from maze import Game
+        from baddies import RandomBaddy
+        games = [Game.from_seed(OPEN, 2, goody_cls, goody_cls, RandomBaddy, max_rounds=300)
+                 for goody_cls in (SmartGoody, PackedSmartGoody)]
+        for game in games:
+            game.play()
+        self.assertEqual([(game.status, game.round, sorted(game.position.values())) for game in games[:1]],
+                         [(game.status, game.round, sorted(game.position.values())) for game in games[1:]])
+        self.assertTrue((games[0].goody0.grid == games[1].goody0.grid).all())
+
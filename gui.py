@@ -2,22 +2,76 @@
     gui.py
 
     A GUI for displaying and running/stopping/stepping through games.
+
+    "Fast Forward" plays games in a background thread as fast as the engine allows, while the display is only redrawn
+    at the screen's refresh rate - so the result counters can be watched building up over thousands of games.
 '''
+import threading
+
 from collections import defaultdict
 
-from PyQt5.QtCore import QTimer
-from PyQt5.QtGui import QBrush, QColor, QPen, QPixmap
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QBrush, QColor, QGuiApplication, QImage, QPen, QPixmap
 from PyQt5.QtWidgets import (QFormLayout, QGraphicsScene, QGraphicsView, QHBoxLayout, QLabel, QLineEdit, QPushButton,
                              QVBoxLayout, QWidget, QCheckBox)
 
 from maze import Game, Maze
 
+
+class FastForward(QThread):
+    ''' Plays games as fast as possible in a background thread, so the GUI only has to draw the latest state.
+
+        The current game is played to the end, then (if 'auto_start' is set) games are taken from the generator and
+        played one after another until stop() is called, or the generator runs out. Only this thread touches the games
+        while it runs. The result of each game is sent back with the game_over signal, and the state of the current
+        game with the snapshot signal whenever request_snapshot() has been called. Both are emitted from the thread, so
+        they are queued, and the slots connected to them run in the GUI thread.
+        'game' is the game being played - it is only safe to read once the thread has finished.
+    '''
+
+    game_over = pyqtSignal(object)  # The result of a game
+    snapshot = pyqtSignal(object)  # (game, round, status, {player: position}) - see request_snapshot
+
+    def __init__(self, game, game_generator, auto_start):
+        super(FastForward, self).__init__()
+        self.game = game
+        self.game_generator = game_generator
+        self.auto_start = auto_start
+        self._stopping = threading.Event()
+        self._snapshot_wanted = threading.Event()
+
+    def run(self):
+        game = self.game
+        while not self._stopping.is_set():
+            result = game.do_round()
+            if self._snapshot_wanted.is_set():
+                self._snapshot_wanted.clear()
+                self.snapshot.emit((game, game.round, game.status, dict(game.position)))
+            if result == Game.in_play:
+                continue
+            self.game_over.emit(result)
+            if not self.auto_start or self.game_generator is None:
+                return
+            try:
+                game = self.game = next(self.game_generator)
+            except StopIteration:
+                return  # There are no more games to play
+
+    def request_snapshot(self):
+        ''' Ask for the snapshot signal to be emitted after the next round '''
+        self._snapshot_wanted.set()
+
+    def stop(self):
+        ''' Stop playing, and wait for the thread to finish '''
+        self._stopping.set()
+        self.wait()
+
+
 class GameViewer(QWidget):
     ''' The main game viewer GUI '''
 
     # Define the colours used for drawing everything
     wall_brush = QBrush(QColor("black"))
-    wall_pen = QPen(wall_brush, 0)
 
     goody0_brush = QBrush(QColor("#00CC00"))
     goody0_pen = QPen(goody0_brush, 0)
@@ -44,6 +98,9 @@ class GameViewer(QWidget):
         self.results = defaultdict(int)
         self.round_timer = QTimer(interval=50, timeout=self._play)  # milliseconds
         self.running = False
+        self.fast_forward = None  # The FastForward thread, while fast-forwarding
+        self.refresh_timer = QTimer(timeout=self._refresh)  # Asks the FastForward thread for something to draw
+        self._walls = None  # (maze, cells, pixmap) for the last maze drawn - see _wall_pixmap
 
         self.view = QGraphicsView()
         self.view.scale(1, -1)  # We want x to increase rightwards and y to increase upwards
@@ -60,6 +117,7 @@ class GameViewer(QWidget):
         self.new_game_button = QPushButton("&New Game", clicked=self.new_game, enabled=False)
         self.step_button = QPushButton("S&tep", clicked=self.do_round, enabled=False)
         self.go_stop_button = QPushButton("&Go", clicked=self.toggle_running, enabled=False)
+        self.fast_forward_button = QPushButton("&Fast Forward", clicked=self.toggle_fast_forward, enabled=False)
 
         stats_layout = QHBoxLayout()
         stats_layout.addWidget(QLabel("Goodies:"))
@@ -101,6 +159,7 @@ class GameViewer(QWidget):
         buttons_layout.addWidget(self.new_game_button)
         buttons_layout.addWidget(self.step_button)
         buttons_layout.addWidget(self.go_stop_button)
+        buttons_layout.addWidget(self.fast_forward_button)
 
         layout = QVBoxLayout(self)
         layout.addWidget(self.view)
@@ -115,13 +174,26 @@ class GameViewer(QWidget):
 
         if self.running:
             self.toggle_running()
+        if self.fast_forward is not None:
+            self.toggle_fast_forward()
+
+        self._show_game(game)
+        self.round.setText(str(game.round))
+        self.status.setText(game.status)
+        self.running = False
+        self._update_widgets()
+
+    def _show_game(self, game, positions=None):
+        ''' Private - build the scene for the given game, with the players at 'positions' (a dict mapping each player
+            to its Position - by default the game's own)
+        '''
+        if positions is None:
+            positions = game.position
 
         # Alter the GUI widgets
         self.game = game
         self.scene = QGraphicsScene()
         self.view.setScene(self.scene)
-        self.go_stop_button.setEnabled(True)
-        self.step_button.setEnabled(True)
 
         height = game.maze.height
         width = game.maze.width
@@ -131,22 +203,15 @@ class GameViewer(QWidget):
         self.scene.setSceneRect(-cell, -cell, (width + 2) * cell, (height + 2) * cell)
         self.view.fitInView(self.scene.sceneRect())
 
-        # Create the border
-        self.scene.addRect(-cell, -cell, (width + 2) * cell, cell, pen=self.wall_pen, brush=self.wall_brush)
-        self.scene.addRect(-cell, height * cell, (width + 2) * cell, cell, pen=self.wall_pen, brush=self.wall_brush)
-        self.scene.addRect(-cell, 0, cell, height * cell, pen=self.wall_pen, brush=self.wall_brush)
-        self.scene.addRect(width * cell, 0, cell, height * cell, pen=self.wall_pen, brush=self.wall_brush)
-
-        # Add the obstructions:
-        for y in xrange(width):
-            for x in xrange(height):
-                if game.maze[x, y] == Maze.wall:
-                    self.scene.addRect(x * cell, y * cell, cell, cell, pen=self.wall_pen, brush=self.wall_brush)
+        # Add the walls, including the border, as a single item scaled up from one pixel per cell
+        walls = self.scene.addPixmap(self._wall_pixmap(game.maze))
+        walls.setPos(-cell, -cell)
+        walls.setScale(cell)
 
         # Add the players
-        goody0_pos = game.position[game.goody0]
-        goody1_pos = game.position[game.goody1]
-        baddy_pos = game.position[game.baddy]
+        goody0_pos = positions[game.goody0]
+        goody1_pos = positions[game.goody1]
+        baddy_pos = positions[game.baddy]
         self.goody0 = self.scene.addEllipse(0, 0, cell, cell, pen=self.goody0_pen, brush=self.goody0_brush)
         self.goody0.setPos(goody0_pos.x * cell, goody0_pos.y * cell)
         self.goody1 = self.scene.addEllipse(0, 0, cell, cell, pen=self.goody1_pen, brush=self.goody1_brush)
@@ -161,11 +226,6 @@ class GameViewer(QWidget):
             marker.setZValue(-1)
             self.ping_marker[player] = marker
 
-        # Set the info
-        self.round.setText(str(game.round))
-        self.status.setText(game.status)
-        self.running = False
-
         # Update the legend
         self.goody0_name.setText(type(game.goody0).__name__)
         self.goody1_name.setText(type(game.goody1).__name__)
@@ -175,6 +235,22 @@ class GameViewer(QWidget):
         self.setWindowTitle("{} and {} vs. {}".format(type(game.goody0).__name__, type(game.goody1).__name__,
                                                       type(game.baddy).__name__))
 
+    def _wall_pixmap(self, maze):
+        ''' Private - return a pixmap of the maze, including its border, with one pixel per cell. Walls are opaque
+            and spaces are transparent. The pixmap for the last maze is cached, as games usually share a maze.
+        '''
+        cells = maze.array(padded=True).tobytes()  # Row 0 is the bottom border, which suits the flipped view
+        if self._walls is not None and self._walls[0] is maze and self._walls[1] == cells:
+            return self._walls[2]
+        stride = maze.width + 2
+        image = QImage(cells, stride, maze.height + 2, stride, QImage.Format_Indexed8)
+        colors = [0] * 256
+        colors[Maze.wall] = self.wall_brush.color().rgba()
+        image.setColorTable(colors)
+        pixmap = QPixmap.fromImage(image)  # Copies the image, so 'cells' can be freed
+        self._walls = (maze, cells, pixmap)
+        return pixmap
+
     def set_game_generator(self, game_generator):
         ''' Set the game generator (a generator of Game instances) that the GUI can take from '''
         self.game_generator = game_generator
@@ -186,6 +262,69 @@ class GameViewer(QWidget):
         if self.game_generator is not None:
             self.set_game(next(self.game_generator))
 
+    def toggle_fast_forward(self):
+        ''' Switch between playing games in the background as fast as possible, and normal play '''
+        if self.fast_forward is None:
+            if self.running:
+                self.toggle_running()
+            for marker in self.ping_marker.values():
+                marker.hide()
+            self.fast_forward = FastForward(self.game, self.game_generator, self.auto_start.isChecked())
+            self.fast_forward.game_over.connect(self._add_result)
+            self.fast_forward.snapshot.connect(self._show_snapshot)
+            self.fast_forward.finished.connect(self._fast_forward_finished)
+            self._update_widgets()  # Before the thread starts changing the game
+            self.fast_forward.start()
+            # Only redraw as often as the screen does
+            refresh_rate = QGuiApplication.primaryScreen().refreshRate() or 60
+            self.refresh_timer.start(max(1, int(1000 / refresh_rate)))
+        else:
+            fast_forward, self.fast_forward = self.fast_forward, None
+            fast_forward.stop()
+            self.refresh_timer.stop()
+            # Show the final state - the thread has finished, so the game can be read directly
+            game = fast_forward.game
+            if game is not self.game:
+                self._show_game(game)
+            else:
+                self._update_positions(show_pings=False)
+            self.round.setText(str(game.round))
+            self.status.setText(game.status)
+            self._update_widgets()
+
+    def _refresh(self):
+        ''' Private - ask the fast-forwarding thread for the latest state of its game (see _show_snapshot) '''
+        self.fast_forward.request_snapshot()
+
+    def _show_snapshot(self, snapshot):
+        ''' Private - draw a snapshot of the fast-forwarding game '''
+        if self.sender() is not self.fast_forward:
+            return  # Left over from a fast forward that has been stopped
+        game, game_round, status, positions = snapshot
+        if game is not self.game:
+            self._show_game(game, positions)
+        else:
+            self._update_positions(positions, show_pings=False)
+        self.round.setText(str(game_round))
+        self.status.setText(status)
+        self._update_result_counts()
+
+    def _add_result(self, result):
+        ''' Private - count the result of a game played by the fast-forwarding thread '''
+        self.results[result] += 1
+        if self.fast_forward is None:
+            self._update_result_counts()  # Otherwise the next snapshot shows it
+
+    def _fast_forward_finished(self):
+        ''' Private - called when the fast-forwarding thread finishes '''
+        if self.sender() is self.fast_forward:
+            self.toggle_fast_forward()  # It stopped by itself - there are no more games to play
+
+    def closeEvent(self, event):
+        if self.fast_forward is not None:
+            self.toggle_fast_forward()  # A QThread mustn't be destroyed while it's running
+        super(GameViewer, self).closeEvent(event)
+
     def toggle_running(self):
         ''' Switch between automatically stepping through the game and allowing manual "Step" clicks '''
         if self.running:
@@ -208,16 +347,26 @@ class GameViewer(QWidget):
 
     def _update_widgets(self):
         ''' Private - Make the GUI show the current state of the Game '''
-        if self.running:
+        fast_forwarding = self.fast_forward is not None
+        playable = self.game.status in (Game.not_started, Game.in_play)
+        self.new_game_button.setEnabled(self.game_generator is not None and not fast_forwarding)
+        self.fast_forward_button.setText("Stop &Fast Forward" if fast_forwarding else "&Fast Forward")
+        self.fast_forward_button.setEnabled(fast_forwarding or playable)
+        if fast_forwarding:
+            self.go_stop_button.setEnabled(False)
+            self.step_button.setEnabled(False)
+        elif self.running:
             self.go_stop_button.setText("&Stop")
+            self.go_stop_button.setEnabled(True)
             self.step_button.setEnabled(False)
         else:
             self.go_stop_button.setText("&Go")
-            if self.game.status == Game.in_play:
-                self.step_button.setEnabled(True)
-            else:
-                self.go_stop_button.setEnabled(False)
-                self.step_button.setEnabled(False)
+            self.go_stop_button.setEnabled(playable)
+            self.step_button.setEnabled(playable)
+        self._update_result_counts()
+
+    def _update_result_counts(self):
+        ''' Private - Show the number of games won by each side '''
         self.goodies_win_count.setText(str(self.results[Game.goodies_win]))
         self.draw_count.setText(str(self.results[Game.draw]))
         self.baddy_wins_count.setText(str(self.results[Game.baddy_wins]))
@@ -229,15 +378,7 @@ class GameViewer(QWidget):
         if game is None:
             return
         result = game.do_round()
-        for graphic, player in ((self.goody0, game.goody0), (self.goody1, game.goody1), (self.baddy, game.baddy)):
-            new_pos = game.position[player]
-            new_x = new_pos.x * self.cell_size
-            new_y = new_pos.y * self.cell_size
-            graphic.setPos(new_x, new_y)
-            if game.ping:
-                marker = self.ping_marker[player]
-                marker.setPos(new_x, new_y)
-                marker.show()
+        self._update_positions()
 
         if result != Game.in_play:
             self.results[result] += 1
@@ -246,3 +387,20 @@ class GameViewer(QWidget):
         self.round.setText(str(self.game.round))
         self.status.setText(self.game.status)
         return result
+
+    def _update_positions(self, positions=None, show_pings=True):
+        ''' Private - move the player graphics to 'positions' (a dict mapping each player to its Position - by default
+            the game's own)
+        '''
+        game = self.game
+        if positions is None:
+            positions = game.position
+        for graphic, player in ((self.goody0, game.goody0), (self.goody1, game.goody1), (self.baddy, game.baddy)):
+            new_pos = positions[player]
+            new_x = new_pos.x * self.cell_size
+            new_y = new_pos.y * self.cell_size
+            graphic.setPos(new_x, new_y)
+            if show_pings and game.ping:
+                marker = self.ping_marker[player]
+                marker.setPos(new_x, new_y)
+                marker.show()
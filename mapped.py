@@ -0,0 +1,250 @@
+'''
+    mapped.py
+
+    A file format for mazes which can be memory-mapped, so that many processes can share one copy of a very large
+    maze, and opening one is instant however big it is.
+
+    A maze file is a 32-byte header followed by a bitmap of the cells, one bit per cell (set for a wall), least
+    significant bit first. The bitmap is laid out exactly like a Maze's own storage - row by row from the bottom,
+    surrounded by a one-cell border of wall - so the neighbours of any cell can be looked up without bounds checking.
+    The header also records how many empty cells and connected components the maze has, so that players can be placed
+    without analysing the whole maze.
+
+    Defines:
+        write_maze - save a maze in this format
+        MappedMaze - a read-only Maze backed by a memory-mapped maze file
+'''
+
+import mmap
+import os
+import pickle
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+
+from maze import Game, Maze, Obstruction, Position, _EmptyBits, _pack_bits, _unpack_bits
+
+MAGIC = b"MZMP"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sB3xIIQI4x")  # Magic, version, width, height, empty cells, components
+
+
+def write_maze(maze, path):
+    ''' Save the maze to a maze file at 'path', replacing any file that's already there. Finding the maze's connected
+        components (for the header) may take a while for a very large maze, but it's only done once.
+
+        The file is written under a temporary name in the same directory and then renamed over 'path', so a process
+        that still has the old file mapped keeps its copy rather than seeing it change (or shrink) underneath it. The
+        file gets the same permissions as one made by open() would.
+    '''
+    header = _HEADER.pack(MAGIC, VERSION, maze.width, maze.height, maze.empty_cells(), len(maze.component_sizes()))
+    maze_file = tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)), delete=False)
+    try:
+        with maze_file:
+            maze_file.write(header)
+            maze_file.write(_pack_bits(maze._cells))
+        umask = os.umask(0)  # The only way to read the umask is to set it
+        os.umask(umask)
+        os.chmod(maze_file.name, 0o666 & ~umask)  # NamedTemporaryFile makes it readable only by its owner
+        os.rename(maze_file.name, path)
+    except:
+        os.remove(maze_file.name)
+        raise
+
+
+class MappedMaze(Maze):
+    ''' A read-only maze backed by a memory-mapped maze file (see write_maze). The operating system shares the pages of
+        the file between every process that maps it.
+
+        Subscripting, obstruction() and placing players work on the mapped bits directly, as in a PackedMaze, and make
+        the same choices as an ordinary Maze. A maze whose header says it has a single connected component is never
+        analysed for components. Anything else that analyses the whole maze (distances, the components of a maze with
+        more than one, array() and so on) works on a private copy of the cells, unpacked the first time it's needed.
+
+        Pickling a MappedMaze pickles only its path, so a maze passed to worker processes (e.g. by a Tournament) is
+        mapped by each of them rather than copied.
+    '''
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with open(self.path, "rb") as maze_file:
+            self._bits = mmap.mmap(maze_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._bits) < _HEADER.size:
+            raise ValueError("{} is not a maze file".format(path))
+        magic, version, self.width, self.height, self._empty_count, self._component_count = \
+            _HEADER.unpack_from(self._bits)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a version {} maze file".format(path, VERSION))
+        if len(self._bits) < _HEADER.size + -(-self._stride * (self.height + 2) // 8):
+            raise ValueError("{} is truncated".format(path))
+        self._unpacked = None
+        self._empty = None
+        self._invalidate()
+        if self._component_count == 1:
+            self._components = [self._empty_count], None, None  # See Maze._component_index
+
+    def __reduce__(self):
+        return MappedMaze, (self.path,)
+
+    def close(self):
+        ''' Unmap the file. The maze can't be used after this. '''
+        self._bits.close()
+
+    @property
+    def _cells(self):
+        ''' Private - the cells unpacked into a bytearray, laid out as in Maze '''
+        if self._unpacked is None:
+            self._unpacked = _unpack_bits(self._bits, self._stride * (self.height + 2), offset=_HEADER.size)
+        return self._unpacked
+
+    def _cell_buffer(self):
+        ''' Private - the unpacked cells if they have been kept, otherwise a temporary copy '''
+        if self._unpacked is not None:
+            return self._unpacked
+        return _unpack_bits(self._bits, self._stride * (self.height + 2), offset=_HEADER.size)
+
+    def _rows(self):
+        ''' Private - generate a bytearray for each row of the maze (without the border), starting at y == 0 '''
+        cells = self._cell_buffer()
+        stride = self._stride
+        for y in xrange(1, self.height + 1):
+            yield cells[y * stride + 1:(y + 1) * stride - 1]
+
+    def _empty_index(self):
+        ''' Private - see Maze._empty_index. This is an _EmptyBits reading the mapped bits. '''
+        if self._empty is None:
+            self._empty = _EmptyBits(self._bits, self._stride * (self.height + 2), offset=_HEADER.size)
+        return self._empty
+
+    def _bit(self, cell_index):
+        ''' Private - return the cell with the given index into the bitmap '''
+        return ord(self._bits[_HEADER.size + (cell_index >> 3)]) >> (cell_index & 7) & 1
+
+    def __getitem__(self, index):
+        cell_index = self._index(index)
+        if cell_index is None:
+            return Maze.wall
+        return self._bit(cell_index)
+
+    def __setitem__(self, index, value):
+        raise TypeError("A MappedMaze is read-only")
+
+    def obstruction(self, position):
+        ''' Returns an Obstruction object for the given x, y position '''
+        i = self._index(position)
+        if i is None:
+            return Maze.obstruction(self, position)
+        bit = self._bit
+        stride = self._stride
+        return Obstruction.from_mask(bit(i + stride) | bit(i - 1) << 1 | bit(i - stride) << 2 | bit(i + 1) << 3)
+
+    def empty_cells(self):
+        ''' Return the number of empty cells in this maze '''
+        return self._empty_count
+
+
+class MappedMazeTest(unittest.TestCase):
+    ''' Test that a mapped maze behaves like the maze it was saved from '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "maze.bin")
+        self.maze = Maze(7, 3, "0010000"
+                               "1010110"
+                               "0000100")
+        write_maze(self.maze, self.path)
+        self.mapped = MappedMaze(self.path)
+
+    def tearDown(self):
+        self.mapped.close()
+        shutil.rmtree(self.directory)
+
+    def test_cells(self):
+        self.assertEqual((self.mapped.width, self.mapped.height), (7, 3))
+        for x in xrange(-1, 8):
+            for y in xrange(-1, 4):
+                self.assertEqual(self.mapped[x, y], self.maze[x, y])
+                self.assertEqual(self.mapped.obstruction(Position(x, y)).mask,
+                                 self.maze.obstruction(Position(x, y)).mask)
+        self.assertEqual(repr(self.mapped), repr(self.maze).replace("Maze", "MappedMaze"))
+        self.assertEqual(self.mapped.distance((0, 0), (6, 2)), self.maze.distance((0, 0), (6, 2)))
+        self.assertRaises(TypeError, self.mapped.__setitem__, (0, 0), Maze.wall)
+
+    def test_components(self):
+        self.assertEqual(self.mapped.empty_cells(), 15)
+        self.assertEqual(self.mapped.component_sizes(), self.maze.component_sizes())
+        self.assertEqual(self.mapped.connected((0, 0), (6, 2)), self.maze.connected((0, 0), (6, 2)))
+        positions = self.mapped.random_empty_positions(3, random.Random(0), connected=True)
+        self.assertTrue(self.maze.connected(*positions))
+
+        open_maze = Maze(40, 30)
+        open_maze[5, 5] = Maze.wall
+        path = os.path.join(self.directory, "open.bin")
+        write_maze(open_maze, path)
+        mapped = MappedMaze(path)
+        self.assertEqual(mapped.component_sizes(), [1199])
+        positions = mapped.random_empty_positions(1199, random.Random(0), connected=True)
+        self.assertEqual(len(set(positions)), 1199)
+        self.assertNotIn(Position(5, 5), positions)
+        mapped.close()
+
+    def test_pickle(self):
+        copy = pickle.loads(pickle.dumps(self.mapped, pickle.HIGHEST_PROTOCOL))
+        self.assertIsInstance(copy, MappedMaze)
+        self.assertEqual(copy.path, self.mapped.path)
+        self.assertEqual(repr(copy), repr(self.mapped))
+        copy.close()
+
+    def test_game(self):
+        from goodies import RandomGoody
+        from baddies import RandomBaddy
+        for seed in xrange(10):
+            game = Game(self.mapped, RandomGoody(), RandomGoody(), RandomBaddy(), max_rounds=200, seed=seed)
+            game.play()
+            self.assertTrue(self.maze.connected(*game.position.values()))
+
+    def test_same_positions(self):
+        maze = Maze(60, 50)
+        for x in xrange(0, 60, 3):
+            maze[x, 20] = Maze.wall
+        path = os.path.join(self.directory, "mostly_open.bin")
+        write_maze(maze, path)
+        mapped = MappedMaze(path)
+        from goodies import RandomGoody
+        from baddies import RandomBaddy
+        for seed in xrange(10):
+            games = [Game.from_seed(cells, seed, RandomGoody, RandomGoody, RandomBaddy) for cells in (mapped, maze)]
+            self.assertEqual(*[[game.position[player] for player in game.players] for game in games])
+        self.assertIsNone(mapped._unpacked)
+        mapped.close()
+
+    def test_replace(self):
+        write_maze(Maze(100, 100), self.path)
+        self.assertEqual(repr(self.mapped), repr(self.maze).replace("Maze", "MappedMaze"))  # Still the old file
+        replaced = MappedMaze(self.path)
+        self.assertEqual((replaced.width, replaced.height), (100, 100))
+        replaced.close()
+        self.assertEqual(os.listdir(self.directory), ["maze.bin"])
+        umask = os.umask(0o022)
+        try:
+            write_maze(self.maze, self.path)
+        finally:
+            os.umask(umask)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o644)
+
+    def test_bad_files(self):
+        path = os.path.join(self.directory, "bad.bin")
+        with open(path, "wb") as maze_file:
+            maze_file.write(b"not a maze file at all, honestly")
+        self.assertRaises(ValueError, MappedMaze, path)
+        write_maze(Maze(100, 100), path)
+        with open(path, "r+b") as maze_file:
+            maze_file.truncate(100)
+        self.assertRaises(ValueError, MappedMaze, path)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -8,6 +8,7 @@
     It also defines the game-playing classes:
         Maze - a container for holding the layout of a maze (walls and spaces) and for asking questions about
                particular positions in the maze
+        PackedMaze - a Maze which stores one bit per cell, for very large mazes
 
         Move - a small class whose instances represent the different moves that a player can take
             UP, DOWN, LEFT, RIGHT, STAY, PING
@@ -18,98 +19,109 @@
         Game - A class responsible for placing the players within the maze, asking them to take their turn, and
                detecting end-of-game conditions.
 
+        TurnTimes - statistics about how long a player has taken over its turns, optionally collected by a Game
+
     Some utility function for repeatedly playing games, and the helper objects are also defined here:
         STEP, DX, DY, ZERO
         game_generator
         game_repeater
 '''
 
+import hashlib
+import pickle
 import random
+import struct
+import time
 import unittest
 
 from abc import ABCMeta, abstractmethod
-from itertools import izip
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from itertools import compress, islice, izip
+from operator import itemgetter
 
 class Move(object):
     ''' An instruction returned by goodies and baddies.
         'name' is the human-readable name
+        'code' is a small integer, unique to each move, which can be used to look moves up in tables.
+        MOVES[code] is the Move with that code.
+
+        There is only one instance of each move, so they compare (and hash) by identity.
     '''
-    def __init__(self, name):
+    __slots__ = ("name", "code")
+
+    def __init__(self, name, code):
         if not isinstance(name, basestring):
             raise TypeError("'name' must be a string, got: {}".format(name))
+        if not isinstance(code, int):
+            raise TypeError("'code' must be an int, got: {}".format(code))
         self.name = name
+        self.code = code
 
     def __str__(self):
         return self.name
 
-    def __hash__(self):  # Make Moves usable as dict keys
-        return hash((type(self), self.name))
-
     def __repr__(self):
         return self.name
 
+    def __reduce__(self):
+        return self.name.upper()  # Pickle as a reference to the module-level instance, to preserve identity
+
+
+# The codes of the four directions are also their bit numbers in an Obstruction's mask
+UP    = Move("up", 0)
+LEFT  = Move("left", 1)
+DOWN  = Move("down", 2)
+RIGHT = Move("right", 3)
+STAY  = Move("stay", 4)
+PING  = Move("ping", 5)
 
-STAY  = Move("stay")
-UP    = Move("up")
-LEFT  = Move("left")
-DOWN  = Move("down")
-RIGHT = Move("right")
-PING  = Move("ping")
+MOVES = (UP, LEFT, DOWN, RIGHT, STAY, PING)  # Indexed by code
 
-class Position(object):
+class Position(tuple):
     ''' A 2-dimensional x, y position, supporting addition and subtraction with other Position objects
         and 2-tuples of ints.
+
+        Positions are immutable tuples of (x, y), so they hash and compare as cheaply as tuples, and compare equal
+        to the equivalent 2-tuple.
     '''
-    __slots__ = ("x", "y")
+    __slots__ = ()
 
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
+    def __new__(cls, x, y):
+        return _new_tuple(cls, (x, y))
 
-    @classmethod
-    def _convert(cls, value):
-        ''' Pass through values of the correct type, otherwise try to expand them as (x, y) coordinates '''
-        return value if isinstance(value, cls) else cls(*value)
+    def __getnewargs__(self):
+        return tuple(self)  # For pickling
+
+    x = property(itemgetter(0), doc="The x component")
+    y = property(itemgetter(1), doc="The y component")
 
     def __add__(self, other):
-        other = self._convert(other)
-        return Position(self.x + other.x, self.y + other.y)  # Add components individually
+        return _new_tuple(Position, (self[0] + other[0], self[1] + other[1]))  # Add components individually
 
-    def __radd__(self, other):
-        return self + other  # Commutative, so use the same implementation as above
+    __radd__ = __add__  # Commutative, so use the same implementation as above
 
     def __sub__(self, other):
-        other = self._convert(other)
-        return Position(self.x - other.x, self.y - other.y)
+        return _new_tuple(Position, (self[0] - other[0], self[1] - other[1]))
 
     def __rsub__(self, other):
-        return self._convert(other) - self  # Convert 'other' to a Position, then use the implementation above
+        return _new_tuple(Position, (other[0] - self[0], other[1] - self[1]))
 
     def __repr__(self):
-        return "{}({}, {})".format(type(self).__name__, self.x, self.y)
+        return "{}({}, {})".format(type(self).__name__, self[0], self[1])
 
     def __str__(self):
-        return "({}, {})".format(self.x, self.y)
+        return "({}, {})".format(self[0], self[1])
 
     def __neg__(self):
-        return Position(-self.x, -self.y)
-
-    def __eq__(self, other):
-        if isinstance(other, tuple):
-            other = self._convert(other)  # Allow loose equality comparisons with 2-tuples
-        elif not isinstance(other, Position):
-            return False
-        return self.x == other.x and self.y == other.y
-
-    def __hash__(self):
-        return hash((type(self), self.x, self.y))
-
-    def __ne__(self, other):
-        return not self == other
+        return _new_tuple(Position, (-self[0], -self[1]))
 
     def l1_norm(self):
         ''' Return the sum of the abs of the components '''
-        return abs(self.x) + abs(self.y)
+        return abs(self[0]) + abs(self[1])
+
+_new_tuple = tuple.__new__
 
 # Some common positions / position changes
 ZERO = Position(0, 0)
@@ -117,6 +129,166 @@ DX = Position(1, 0)
 DY = Position(0, 1)
 STEP = {UP: DY, LEFT: -DX, DOWN: -DY, RIGHT: DX, STAY: ZERO}
 
+# A translation table which turns the cells of a maze into 1 for space and 0 for wall
+_IS_SPACE = bytearray([1]) + bytearray(255)
+
+def _pack_bits(cells):
+    ''' Private - pack a bytearray of cell values into a bytearray of one bit per cell, least significant bit first '''
+    if not cells:
+        return bytearray()
+    import numpy as np
+    bits = np.zeros(-(-len(cells) // 8) * 8, dtype=np.uint8)
+    bits[:len(cells)] = np.frombuffer(cells, dtype=np.uint8)
+    return bytearray(np.packbits(bits.reshape(-1, 8)[:, ::-1]).tobytes())  # packbits puts the first bit at the top
+
+def _unpack_bits(data, count, offset=0):
+    ''' Private - the reverse of _pack_bits: return a bytearray of the first 'count' cell values packed into 'data'
+        (anything supporting the buffer protocol) from byte 'offset' on
+    '''
+    if not count:
+        return bytearray()
+    import numpy as np
+    packed = np.frombuffer(data, dtype=np.uint8, count=-(-count // 8), offset=offset)
+    return bytearray(np.unpackbits(packed).reshape(-1, 8)[:, ::-1].ravel()[:count].tobytes())
+
+class _EmptyBits(object):
+    ''' Private - stands in for the empty cell index (see Maze._empty_index) of a maze whose cells are packed one bit
+        each, as by _pack_bits, into 'data' from byte 'offset' on. Rather than listing the empty cells it counts them
+        in each block of 'block_bytes' bytes of the bits, so it takes a few bytes for thousands of cells: looking up
+        the i'th empty cell finds its block by bisection and then unpacks just that block. It gives exactly the same
+        cells as the index of an ordinary Maze.
+    '''
+
+    block_bytes = 512
+
+    def __init__(self, data, count, offset=0):
+        import numpy as np
+        self.data = data
+        self.count = count
+        self.offset = offset
+        byte_count = -(-count // 8)
+        if byte_count:
+            packed = np.frombuffer(data, dtype=np.uint8, count=byte_count, offset=offset)
+            bit_counts = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+            walls = np.add.reduceat(bit_counts[packed], np.arange(0, byte_count, self.block_bytes)).tolist()
+        else:
+            walls = []
+        block_cells = 8 * self.block_bytes
+        self.counts = [block_cells - block_walls for block_walls in walls]  # Empty cells in each block
+        if self.counts:
+            self.counts[-1] -= len(self.counts) * block_cells - count  # The last block is only partly used
+        self._starts = None  # The number of empty cells before each block, while it's known
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def __getitem__(self, slot):
+        import numpy as np
+        if self._starts is None:
+            self._starts = [0]
+            for block_count in self.counts[:-1]:
+                self._starts.append(self._starts[-1] + block_count)
+        if not 0 <= slot < len(self):
+            raise IndexError("There are only {} empty cells".format(len(self)))
+        block = bisect_right(self._starts, slot) - 1  # The last block starting at or before it, skipping empty blocks
+        start = block * self.block_bytes
+        packed = np.frombuffer(self.data, dtype=np.uint8, count=min(self.block_bytes, -(-self.count // 8) - start),
+                               offset=self.offset + start)
+        spaces = np.flatnonzero(np.unpackbits(packed).reshape(-1, 8)[:, ::-1].ravel() == Maze.space)
+        return start * 8 + int(spaces[slot - self._starts[block]])
+
+    def update(self, cell_index, value):
+        ''' Count a change to the cell with the given index '''
+        self.counts[cell_index // (8 * self.block_bytes)] += 1 if value == Maze.space else -1
+        self._starts = None
+
+def _join_roots(parent, first, second):
+    ''' Private - join sets in a disjoint-set forest held in a NumPy array, in which every entry points straight at
+        the root of its set. Joins the sets of first[i] and second[i] for each i by hooking roots onto the
+        lower-numbered root and jumping pointers, until every pair agrees. Returns the new forest, again pointing
+        straight at the roots.
+    '''
+    import numpy as np
+    while True:
+        root_first, root_second = parent[first], parent[second]
+        differ = root_first != root_second
+        if not differ.any():
+            return parent
+        first, second = first[differ], second[differ]
+        root_first, root_second = root_first[differ], root_second[differ]
+        parent[np.maximum(root_first, root_second)] = np.minimum(root_first, root_second)
+        while True:
+            grandparent = parent[parent]
+            if (grandparent == parent).all():
+                break
+            parent = grandparent
+
+def _label_components(cells, stride):
+    ''' Private - find the connected areas of empty cells in a cell buffer laid out like Maze._cells. Returns
+        (labels, members, sizes): an array of the component number of every cell (or -1 for walls), an array of the
+        indices of the empty cells grouped by component (ascending within each), and a list of the size of each
+        component. Both arrays hold 4-byte ints. Components are numbered in order of their lowest cell. If there is
+        at most one component 'labels' and 'members' may be None, since every empty cell is in component 0.
+
+        Every horizontal run of empty cells lies in one component, so the runs are numbered first and then joined
+        wherever they touch vertically - hooking roots onto the lower-numbered root and jumping pointers, until every
+        pair of touching runs agrees. This is done with NumPy if it's installed, otherwise by flood fill.
+    '''
+    try:
+        import numpy as np
+    except ImportError:
+        return _flood_fill_components(cells, stride)
+    empty = np.frombuffer(cells, dtype=np.uint8) == Maze.space
+    if not empty.any():
+        return None, None, []
+
+    run_starts = empty.copy()
+    run_starts[1:] &= ~empty[:-1]
+    runs = np.cumsum(run_starts, dtype=np.int32) - 1  # The number of the run each empty cell is in
+    run_count = int(runs[-1]) + 1
+    del run_starts
+    # Vertically touching runs, keeping one pair from each stretch along which the same two runs touch
+    touching = empty[:-stride] & empty[stride:]
+    lower, upper = runs[:-stride][touching], runs[stride:][touching]
+    del touching
+    new_pair = np.ones(len(lower), dtype=bool)
+    new_pair[1:] = (lower[1:] != lower[:-1]) | (upper[1:] != upper[:-1])
+    lower, upper = lower[new_pair], upper[new_pair]
+
+    parent = _join_roots(np.arange(run_count, dtype=np.int32), lower, upper)
+
+    roots = parent == np.arange(run_count)
+    if roots.sum() == 1:
+        return None, None, [int(empty.sum())]  # Every empty cell is in component 0
+    labels = np.where(empty, (np.cumsum(roots, dtype=np.int32) - 1)[parent][runs], np.int32(-1))
+    del runs
+    cell_indices = np.flatnonzero(empty)
+    members = cell_indices[np.argsort(labels[cell_indices], kind="mergesort")].astype(np.int32)
+    return labels, members, np.bincount(labels[cell_indices]).tolist()
+
+def _flood_fill_components(cells, stride):
+    ''' Private - _label_components without NumPy '''
+    offsets = (stride, -1, -stride, 1)
+    labels = array("i", [-1]) * len(cells)
+    components = []
+    for start in xrange(stride + 1, len(cells) - stride - 1):
+        if labels[start] != -1 or cells[start] != Maze.space:
+            continue
+        label = len(components)
+        labels[start] = label
+        component = array("i", [start])
+        for cell in component:  # The array grows as the fill reaches new cells
+            for offset in offsets:
+                neighbour = cell + offset
+                if labels[neighbour] == -1 and cells[neighbour] == Maze.space:
+                    labels[neighbour] = label
+                    component.append(neighbour)
+        components.append(component)
+    members = array("i")
+    for component in components:
+        members.extend(sorted(component))
+    return labels, members, [len(component) for component in components]
+
 def _cell_str(value):
     ''' Private function, used when printing mazes '''
     return "X" if value else " "
@@ -125,9 +297,21 @@ class Obstruction(object):
     ''' An object that tells a player about nearby obstructions.
         Subscript this with a direction to receive True if there is an obstruction, else False
         e.g. obstruction[UP]  # --> True or False
+
+        Each Obstruction also has a 4-bit 'mask' - bits 0 to 3 are set if UP, LEFT, DOWN, RIGHT (respectively) are
+        obstructed. There are only 16 distinct obstructions, so the game uses the shared, interned instances returned
+        by Obstruction.from_mask rather than creating new ones. Don't modify them!
     '''
+    __slots__ = ("_state", "mask")
+
     def __init__(self, up, left, down, right):
         self._state = {UP: up, LEFT: left, DOWN: down, RIGHT: right}
+        self.mask = bool(up) | bool(left) << 1 | bool(down) << 2 | bool(right) << 3
+
+    @staticmethod
+    def from_mask(mask):
+        ''' Return the shared Obstruction instance for the given 4-bit mask '''
+        return _OBSTRUCTIONS[mask]
 
     def __getitem__(self, key):
         if not isinstance(key, Move):
@@ -140,12 +324,35 @@ class Obstruction(object):
                           _cell_str(self[LEFT]) + "o" + _cell_str(self[RIGHT]),
                           "." +            _cell_str(self[DOWN])       + "."])
 
+# For each Obstruction mask, the change in position caused by each move (indexed by code), or None if the move
+# doesn't change the position
+_STEP_BY_MASK = tuple(tuple(None if move in (STAY, PING) or mask >> move.code & 1 else STEP[move] for move in MOVES)
+                      for mask in xrange(16))
+
+# The value stored for unreachable cells in each type of distance array
+_UNREACHABLE = {"H": 0xFFFF, "I": 0xFFFFFFFF}
+
+# The interned Obstruction instances, indexed by mask
+_OBSTRUCTIONS = tuple(Obstruction(bool(mask & 1), bool(mask & 2), bool(mask & 4), bool(mask & 8))
+                      for mask in xrange(16))
+
 
 class Player(object):
-    ''' Common base class for goodies and baddies '''
+    ''' Common base class for goodies and baddies.
+
+        Players should make any random decisions with 'rng'. When a player joins a Game, the game replaces it with a
+        random.Random instance seeded from the game's seed, so that the whole game can be reproduced from its seed.
+        Until then it is the random module itself.
+    '''
 
     __metaclass__ = ABCMeta
 
+    rng = random
+
+    # Set to True by players whose action depends only on the obstruction and ping response they are given - with no
+    # memory and no randomness. A Game between three such players that returns to an earlier state is a draw.
+    stateless = False
+
     @abstractmethod
     def take_turn(self, obstruction, ping_response):
         ''' Decide how to move.
@@ -203,10 +410,16 @@ class Maze(object):
 
         The state of a cell can be interrogated by subscripting the object with an (x, y) pair, or a Position object
         e.g. maze[4, 5]  # -> Maze.space (== 0) or Maze.wall (== 1)
+
+        The cells are stored in a single bytearray, row by row from the bottom (y == 0) upwards, surrounded by a
+        one-cell border of wall. The border means that the neighbours of any cell in the maze can be looked up
+        without bounds checking. Use array() to get a NumPy view of the cells.
     '''
     space = 0
     wall  = 1
 
+    distance_cache_size = 32  # The maximum number of distance fields each maze keeps (see distance)
+
     def __init__(self, width, height, data=None):
         if not isinstance(width, int) or not isinstance(height, int):
             raise TypeError("width and height must both be ints. Got {} and {}".format(width, height))
@@ -218,69 +431,400 @@ class Maze(object):
             if len(data) != width * height:
                 raise ValueError("'data' must be a string of length {}, but it has length {}".format(
                                  width * height, len(data)))
-        self._cells = []  # A list of lists, subscripted like this: _cells[y][x]
-                          # Arranging the rows in this way makes it easier to print the maze
 
-        # Initialise self._cells - either as a blank maze, or from the input data
-        for y in xrange(self.height):
+        # Initialise self._cells - either as a blank maze, or from the input data. The data string starts with the
+        # top row, so its rows are taken in reverse order.
+        rows = []
+        for y in reversed(xrange(self.height)):
             if data is None:
-                row = [Maze.space] * self.width
+                rows.append(bytearray(self.width))
             else:
-                row = map(int, data[y * self.width:(y + 1) * self.width])
-            self._cells.append(row)
-        self._cells.reverse()
+                rows.append(bytearray(map(int, data[y * self.width:(y + 1) * self.width])))
+        self._set_rows(rows)
+
+    @property
+    def _stride(self):
+        ''' Private - the distance between vertically adjacent cells in self._cells '''
+        return self.width + 2
+
+    def _set_rows(self, rows):
+        ''' Private - build self._cells from a list of bytearrays, one for each row starting at y == 0 '''
+        border = bytearray([Maze.wall])
+        full_row = border * self._stride
+        self._set_cells(full_row + bytearray().join(border + row + border for row in rows) + full_row)
+
+    def _set_cells(self, cells):
+        ''' Private - replace self._cells, discarding everything derived from the old cells '''
+        self._cells = cells
+        self._empty = None  # See _empty_index
+        self._invalidate()
+
+    def _invalidate(self):
+        ''' Private - discard everything cached about the layout of the maze. Call this whenever a cell changes. '''
+        self._masks = None
+        self._distance_fields = OrderedDict()  # Least recently used first
+        self._components = None  # See _component_index
+        self._digest = None  # See digest
+
+    def _rows(self):
+        ''' Private - generate a bytearray for each row of the maze (without the border), starting at y == 0 '''
+        stride = self._stride
+        for y in xrange(1, self.height + 1):
+            yield self._cells[y * stride + 1:(y + 1) * stride - 1]
+
+    def _cell_buffer(self):
+        ''' Private - return the cells laid out like self._cells, for an analysis which reads them through once. A
+            subclass which stores its cells some other way can return a temporary copy.
+        '''
+        return self._cells
 
-    def __getitem__(self, index):
+    def _index(self, index):
+        ''' Private - convert an (x, y) pair or Position into an index into self._cells.
+            Returns None if the position is outside the maze.
+        '''
         if isinstance(index, tuple):
             if len(index) != 2:
                 raise ValueError("index must be a Position or an x, y pair. Got: {}".format(index))
-            index = Position(*index)
+            x, y = index
+        else:
+            x, y = index.x, index.y
+
+        if not (0 <= x < self.width) or not (0 <= y < self.height):
+            return None
+        return (y + 1) * self._stride + x + 1
 
-        if not (0 <= index.x < self.width) or not (0 <= index.y < self.height):
+    def __getitem__(self, index):
+        cell_index = self._index(index)
+        if cell_index is None:
             return Maze.wall
-        else:
-            return self._cells[index.y][index.x]
+        return self._cells[cell_index]
 
     def __setitem__(self, index, value):
-        if isinstance(index, tuple):
-            if len(index) != 2:
-                raise ValueError("index must be a Position or an x, y pair. Got: {}".format(index))
-            index = Position(*index)
         if value not in (Maze.wall, Maze.space):
             raise ValueError("value must be either Maze.space or Maze.wall")
-
-        if not (0 <= index.x < self.width) or not (0 <= index.y < self.height):
+        cell_index = self._index(index)
+        if cell_index is None:
             raise IndexError("{} is out of bounds (0-{}, 0-{})".format(index, self.width - 1, self.height - 1))
 
-        self._cells[index.y][index.x] = value
+        if self._cells[cell_index] == value:
+            return
+        self._cells[cell_index] = value
+        self._update_empty_index(cell_index, value)
+        self._invalidate()
+
+    def array(self, padded=False):
+        ''' Return a read-only NumPy view (no copy is made) of the cells, subscripted like this: array[y, x].
+            If 'padded' is True the view includes the border of walls, so array[0, 0] is the cell at (-1, -1).
+        '''
+        import numpy as np  # Only needed for bulk analytics, so the game engine itself doesn't depend on NumPy
+        cells = np.frombuffer(self._cells, dtype=np.uint8).reshape(self.height + 2, self._stride)
+        if not padded:
+            cells = cells[1:-1, 1:-1]
+        cells.flags.writeable = False
+        return cells
 
     def __str__(self):
         parts = ["X" * (self.width + 2)]  # Top border
-        for row in reversed(self._cells):
+        for row in reversed(list(self._rows())):
             parts.append("X" + "".join("X" if cell else " " for cell in row) + "X")  # Rows with left/right border
         parts.append(parts[0])  # Bottom border
         return "\n".join(parts)
 
     def __repr__(self):
         return "{}({}, {}, {})".format(type(self).__name__, self.width, self.height,
-                                       "".join(str(cell) for row in self._cells for cell in row))
+                                       "".join(str(cell) for row in self._rows() for cell in row))
 
     def __getstate__(self):
         return (self.width, self.height, self._cells)
 
     def __setstate__(self, state):
-        self.width, self.height, self._cells = state
+        self.width, self.height, cells = state
+        if isinstance(cells, list):
+            self._set_rows([bytearray(row) for row in cells])  # Mazes pickled when cells were a list of lists
+        else:
+            self._set_cells(cells)
+
+    def _obstruction_masks(self):
+        ''' Private - return a bytearray, laid out like self._cells, holding the Obstruction mask of each cell.
+            It is computed the first time it's needed after the maze changes.
+        '''
+        if self._masks is None:
+            cells = self._cells
+            stride = self._stride
+            masks = bytearray(len(cells))
+            for i in xrange(stride + 1, len(cells) - stride - 1):
+                masks[i] = cells[i + stride] | cells[i - 1] << 1 | cells[i - stride] << 2 | cells[i + 1] << 3
+            self._masks = masks
+        return self._masks
+
+    def obstruction_array(self, padded=False):
+        ''' Return a read-only NumPy view of the Obstruction mask of every cell, subscripted like array() '''
+        import numpy as np
+        masks = np.frombuffer(self._obstruction_masks(), dtype=np.uint8).reshape(self.height + 2, self._stride)
+        if not padded:
+            masks = masks[1:-1, 1:-1]
+        masks.flags.writeable = False
+        return masks
 
     def obstruction(self, position):
         ''' Returns an Obstruction object for the given x, y position '''
-        return Obstruction(bool(self[position + STEP[UP]]),
-                           bool(self[position + STEP[LEFT]]),
-                           bool(self[position + STEP[DOWN]]),
-                           bool(self[position + STEP[RIGHT]]))
+        i = self._index(position)
+        if i is None:
+            return Obstruction(bool(self[position + STEP[UP]]),
+                               bool(self[position + STEP[LEFT]]),
+                               bool(self[position + STEP[DOWN]]),
+                               bool(self[position + STEP[RIGHT]]))
+        return _OBSTRUCTIONS[self._obstruction_masks()[i]]
+
+    def _distance_field(self, target):
+        ''' Private - return (distances, steps) for the cell with the given index into self._cells.
+            'distances' is an array, laid out like self._cells, of the length of the shortest path from each cell to
+            the target - or the maximum value of the array's type if there is no path. 'steps' is a bytearray of the
+            code of the first move along such a path.
+            The result is cached, and the least recently used results are discarded.
+        '''
+        fields = self._distance_fields
+        field = fields.pop(target, None)
+        if field is None:
+            field = self._breadth_first_search(target)
+            while len(fields) >= self.distance_cache_size:
+                fields.popitem(last=False)
+        fields[target] = field
+        return field
+
+    def _breadth_first_search(self, target):
+        ''' Private - compute the distance field for the given target index. See _distance_field. '''
+        cells = self._cells
+        stride = self._stride
+        typecode = "H" if len(cells) < 0xFFFF else "I"  # Shortest paths can't be longer than the number of cells
+        unreachable = _UNREACHABLE[typecode]
+        distances = array(typecode, [unreachable]) * len(cells)
+        steps = bytearray([STAY.code]) * len(cells)
+        # For each neighbour of a cell: its offset, and the step from the neighbour back to the cell
+        neighbours = ((stride, DOWN.code), (-1, RIGHT.code), (-stride, UP.code), (1, LEFT.code))
+
+        if cells[target] != Maze.space:
+            return distances, steps  # Nothing can reach a wall
+        distances[target] = 0
+        frontier = [target]
+        distance = 0
+        while frontier:
+            distance += 1
+            next_frontier = []
+            for cell in frontier:
+                for offset, step in neighbours:
+                    neighbour = cell + offset
+                    if distances[neighbour] == unreachable and cells[neighbour] == Maze.space:
+                        distances[neighbour] = distance
+                        steps[neighbour] = step
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+        return distances, steps
+
+    def distance(self, source, target):
+        ''' Return the number of moves in the shortest path between two positions, or None if there is no path.
+            The distances from every cell to the target are computed once, then cached.
+        '''
+        source = self._index(source)
+        target = self._index(target)
+        if source is None or target is None:
+            return None
+        distances, _ = self._distance_field(target)
+        distance = distances[source]
+        return None if distance == _UNREACHABLE[distances.typecode] else distance
+
+    def next_step(self, source, target):
+        ''' Return the move (UP, DOWN, LEFT or RIGHT) that starts a shortest path from source to target.
+            Returns STAY if they are the same, or there is no path. Cached like distance.
+        '''
+        source = self._index(source)
+        target = self._index(target)
+        if source is None or target is None:
+            return STAY
+        _, steps = self._distance_field(target)
+        return MOVES[steps[source]]
+
+    def distance_array(self, target):
+        ''' Return a read-only NumPy array of the distance from every cell to the target, subscripted like
+            array(). Cells with no path to the target hold the maximum value of the array's dtype.
+        '''
+        import numpy as np
+        target_index = self._index(target)
+        if target_index is None:
+            raise IndexError("{} is out of bounds (0-{}, 0-{})".format(target, self.width - 1, self.height - 1))
+        distances, _ = self._distance_field(target_index)
+        dtype = np.uint16 if distances.typecode == "H" else np.uint32
+        distances = np.frombuffer(distances, dtype=dtype).reshape(self.height + 2, self._stride)[1:-1, 1:-1]
+        distances.flags.writeable = False
+        return distances
+
+    def _empty_index(self):
+        ''' Private - return an array of the indices into self._cells of every empty cell, in ascending order - so that
+            anything sampled from it depends only on the cells, not on how they came to be. It is built when first
+            needed, then kept up to date by __setitem__. It takes four bytes for each empty cell, and nothing more.
+        '''
+        if self._empty is None:
+            cells = self._cell_buffer()
+            self._empty = array("i", compress(xrange(len(cells)), cells.translate(_IS_SPACE)))
+        return self._empty
+
+    def _update_empty_index(self, cell_index, value):
+        ''' Private - update the empty cell index, if it has been built, after a cell has changed '''
+        if self._empty is None:
+            return
+        slot = bisect_left(self._empty, cell_index)
+        if value == Maze.space:
+            self._empty.insert(slot, cell_index)
+        else:
+            del self._empty[slot]
 
     def empty_cells(self):
         ''' Return the number of empty cells in this maze '''
-        return sum(not cell for row in self._cells for cell in row)
+        return len(self._empty_index())
+
+    def random_empty_positions(self, count, rng=random, connected=False):
+        ''' Return a list of 'count' distinct Positions of empty cells, chosen uniformly at random.
+            'rng' may be a random.Random instance, otherwise the random module is used.
+            If 'connected' is True the cells are all chosen from the same connected component: the first is chosen
+            uniformly from the empty cells of the components that are big enough, and the rest from its component.
+            The choices depend only on the cells of the maze and the random numbers, not on the maze's history.
+        '''
+        empty = self._empty_index()
+        if count > len(empty):
+            raise ValueError("Can't choose {} empty cells - the maze only has {}!".format(count, len(empty)))
+        if connected and count > 1:
+            sizes, _, _ = self._component_index()
+            if len(sizes) > 1:
+                return self._random_connected_positions(count, rng)
+        stride = self._stride
+        return [Position(empty[slot] % stride - 1, empty[slot] // stride - 1)
+                for slot in rng.sample(xrange(len(empty)), count)]
+
+    def _random_connected_positions(self, count, rng):
+        ''' Private - choose the positions for random_empty_positions from a single component '''
+        sizes, _, members = self._component_index()
+        starts = [0]
+        for size in sizes[:-1]:
+            starts.append(starts[-1] + size)
+        candidates = [(start, size) for start, size in izip(starts, sizes) if size >= count]
+        if not candidates:
+            raise ValueError("Can't choose {} connected empty cells - the largest area of the maze only has {}!".format(
+                             count, max(sizes)))
+        slot = rng.randrange(sum(size for _, size in candidates))
+        for start, size in candidates:
+            if slot < size:
+                break
+            slot -= size
+        others = rng.sample(xrange(size - 1), count - 1)  # Skipping over the first cell chosen
+        stride = self._stride
+        cells = [int(members[start + index]) for index in [slot] + [other + (other >= slot) for other in others]]
+        return [Position(cell % stride - 1, cell // stride - 1) for cell in cells]
+
+    def _component_index(self):
+        ''' Private - return (sizes, labels, members), describing the connected components of the maze - the areas
+            of empty cells that can be reached from one another - as returned by _label_components. Components are
+            numbered in order of their lowest cell index. They are found the first time they're needed after the maze
+            changes (unless the maze was created knowing it's connected - see from_buffer).
+            A maze with no more than one component keeps only 'sizes': 'labels' and 'members' are None, since every
+            empty cell is in component 0.
+        '''
+        if self._components is None:
+            labels, members, sizes = _label_components(self._cell_buffer(), self._stride)
+            if len(sizes) <= 1:
+                labels = members = None  # Any left by the flood fill
+            self._components = sizes, labels, members
+        return self._components
+
+    def component(self, position):
+        ''' Return the number of the connected component that the position belongs to, or None if it is a wall or
+            outside the maze. Two positions can reach one another if, and only if, they are in the same component.
+        '''
+        i = self._index(position)
+        if i is None:
+            return None
+        _, labels, _ = self._component_index()
+        if labels is None:
+            return 0 if self[position] == Maze.space else None
+        return int(labels[i]) if labels[i] != -1 else None
+
+    def component_sizes(self):
+        ''' Return a list of the number of cells in each connected component, indexed by component number '''
+        sizes, _, _ = self._component_index()
+        return list(sizes)
+
+    def connected(self, *positions):
+        ''' Return whether all the given positions are empty cells in the same connected component '''
+        components = set(self.component(position) for position in positions)
+        return len(components) == 1 and None not in components
+
+    def component_array(self, padded=False):
+        ''' Return a read-only NumPy array of the component number of every cell (or -1 for walls), subscripted like
+            array()
+        '''
+        import numpy as np
+        _, labels, _ = self._component_index()
+        if labels is None:
+            labels = np.where(self.array(padded=True).ravel() == Maze.space, 0, -1).astype(np.int32)
+        else:
+            labels = np.frombuffer(labels, dtype=np.int32)
+        labels = labels.reshape(self.height + 2, self._stride)
+        if not padded:
+            labels = labels[1:-1, 1:-1]
+        labels.flags.writeable = False
+        return labels
+
+    def packed(self):
+        ''' Return the cells as a bytearray holding one bit per cell (set for a wall), row by row starting at y == 0.
+            Within each byte the least significant bit comes first.
+        '''
+        return _pack_bits(bytearray().join(self._rows()))
+
+    def digest(self):
+        ''' Return the SHA-1 digest of the maze's size and packed() cells, which identifies its layout. It is cached
+            until a cell changes.
+        '''
+        if self._digest is None:
+            self._digest = hashlib.sha1(struct.pack("<II", self.width, self.height) + bytes(self.packed())).digest()
+        return self._digest
+
+    @classmethod
+    def from_packed(cls, width, height, data):
+        ''' Create a maze from the output of packed() '''
+        maze = cls(width, height)
+        if width * height:
+            bits = _unpack_bits(data, width * height)
+            maze._set_rows([bits[y * width:(y + 1) * width] for y in xrange(height)])
+        return maze
+
+    @classmethod
+    def from_buffer(cls, width, height, cells, connected=False):
+        ''' Create a maze which takes over 'cells' - a bytearray laid out like the maze's own storage (see the class
+            docstring), including the border of walls. Maze generators build mazes directly this way.
+            If 'connected' is True the caller guarantees that every empty cell can be reached from every other, so the
+            maze's connected components needn't be searched for.
+        '''
+        if len(cells) != (width + 2) * (height + 2):
+            raise ValueError("A {}x{} maze needs {} cells including the border, got {}".format(
+                             width, height, (width + 2) * (height + 2), len(cells)))
+        maze = cls(0, 0)
+        maze.width = width
+        maze.height = height
+        maze._set_cells(cells)
+        if connected:
+            empty_cells = maze.empty_cells()
+            maze._components = [empty_cells] if empty_cells else [], None, None
+        return maze
+
+    @classmethod
+    def from_array(cls, cells, connected=False):
+        ''' Create a maze from a two-dimensional NumPy array of Maze.space/Maze.wall values, subscripted like this:
+            cells[y, x] (as returned by array()). 'connected' is as for from_buffer.
+        '''
+        import numpy as np
+        height, width = cells.shape
+        padded = np.full((height + 2, width + 2), Maze.wall, dtype=np.uint8)
+        padded[1:-1, 1:-1] = cells
+        return cls.from_buffer(width, height, bytearray(padded.tobytes()), connected)
 
     def __mul__(self, other):
         ''' Multiply a maze by a (x, y) tuple - return a new maze that is this one repeated 'x' times in the
@@ -289,19 +833,195 @@ class Maze(object):
         if not isinstance(other, tuple):
             raise TypeError("Can only multiple a maze by an (x, y) tuple, got:{}".format(other))
         x_repeats, y_repeats = other
-        new_cells = []
-        for _ in xrange(y_repeats):
-            for y in xrange(self.height):
-                new_cells.append(self._cells[y] * x_repeats)
         new_maze = Maze(self.width * x_repeats, self.height * y_repeats)
-        new_maze._cells = new_cells
+        new_maze._set_rows([row * x_repeats for row in self._rows()] * y_repeats)
         return new_maze
 
 
+class PackedMaze(Maze):
+    ''' A Maze which stores its cells in one bit each, rather than one byte, so very large mazes take an eighth of the
+        memory. The bits are laid out like a Maze's cells - with the border - least significant bit first.
+
+        Subscripting, assignment and obstruction() work directly on the bits. obstruction() reads the neighbours to
+        the left and right in one 16-bit load, so it takes three lookups rather than four and needs no cache of
+        obstruction masks. Placing players works on the bits too: instead of an index of the empty cells the maze
+        keeps a count of them for each block of 4096 cells (see _EmptyBits), and it makes the same choices as a Maze.
+
+        The connected components are found from a temporary unpacked copy of the cells. If there is only one (as in
+        any generated maze) nothing more is kept, so a Game can be played without the maze growing. Otherwise a label
+        for every cell and a list of the empty cells are kept, at four bytes each, as in Maze. Anything else that
+        analyses the whole maze (distances, obstruction_array(), array() and so on) works on a copy of the cells
+        unpacked to one byte each the first time it's needed, which is then kept up to date by assignment. The results
+        of those analyses are cached just as in Maze.
+    '''
+
+    @property
+    def _cells(self):
+        ''' Private - the cells unpacked into a bytearray, laid out as in Maze '''
+        if self._unpacked is None:
+            self._unpacked = _unpack_bits(self._bits, self._stride * (self.height + 2))
+        return self._unpacked
+
+    def _cell_buffer(self):
+        ''' Private - the unpacked cells if they have been kept, otherwise a temporary copy '''
+        if self._unpacked is not None:
+            return self._unpacked
+        return _unpack_bits(self._bits, self._stride * (self.height + 2))
+
+    def _set_cells(self, cells):
+        ''' Private - pack the cells into self._bits, discarding everything derived from the old cells '''
+        self._bits = _pack_bits(cells) + bytearray(1)  # A spare byte, so that obstruction can always load 16 bits
+        self._unpacked = None
+        self._empty = None
+        self._invalidate()
+
+    def _rows(self):
+        ''' Private - generate a bytearray for each row of the maze (without the border), starting at y == 0 '''
+        cells = self._cell_buffer()
+        stride = self._stride
+        for y in xrange(1, self.height + 1):
+            yield cells[y * stride + 1:(y + 1) * stride - 1]
+
+    def _empty_index(self):
+        ''' Private - see Maze._empty_index. This is an _EmptyBits, which reads self._bits as they change. '''
+        if self._empty is None:
+            self._empty = _EmptyBits(self._bits, self._stride * (self.height + 2))
+        return self._empty
+
+    def _update_empty_index(self, cell_index, value):
+        ''' Private - update the counts of empty cells, if they have been made, after a cell has changed '''
+        if self._empty is not None:
+            self._empty.update(cell_index, value)
+
+    def __getitem__(self, index):
+        cell_index = self._index(index)
+        if cell_index is None:
+            return Maze.wall
+        return self._bits[cell_index >> 3] >> (cell_index & 7) & 1
+
+    def __setitem__(self, index, value):
+        if value not in (Maze.wall, Maze.space):
+            raise ValueError("value must be either Maze.space or Maze.wall")
+        cell_index = self._index(index)
+        if cell_index is None:
+            raise IndexError("{} is out of bounds (0-{}, 0-{})".format(index, self.width - 1, self.height - 1))
+
+        if self._bits[cell_index >> 3] >> (cell_index & 7) & 1 == value:
+            return
+        self._bits[cell_index >> 3] ^= 1 << (cell_index & 7)
+        if self._unpacked is not None:
+            self._unpacked[cell_index] = value
+        self._update_empty_index(cell_index, value)
+        self._invalidate()
+
+    def obstruction(self, position):
+        ''' Returns an Obstruction object for the given x, y position '''
+        i = self._index(position)
+        if i is None:
+            return Maze.obstruction(self, position)
+        bits = self._bits
+        left = i - 1
+        row = (bits[left >> 3] | bits[(left >> 3) + 1] << 8) >> (left & 7)  # Bit 0 is the left cell, bit 2 the right
+        up = i + self._stride
+        down = i - self._stride
+        return _OBSTRUCTIONS[(row & 5) << 1 | bits[up >> 3] >> (up & 7) & 1 | (bits[down >> 3] >> (down & 7) & 1) << 2]
+
+    def __getstate__(self):
+        return (self.width, self.height, self._bits)
+
+    def __setstate__(self, state):
+        self.width, self.height, self._bits = state
+        self._unpacked = None
+        self._empty = None
+        self._invalidate()
+
+    def __mul__(self, other):
+        ''' Multiply a maze by a (x, y) tuple - see Maze.__mul__. The result is a PackedMaze. '''
+        return PackedMaze.from_maze(Maze.__mul__(self, other))
+
+    @classmethod
+    def from_maze(cls, maze):
+        ''' Create a PackedMaze with the same cells as another maze '''
+        return cls.from_buffer(maze.width, maze.height, bytearray(maze._cells))
+
+
+_wall_time = getattr(time, "perf_counter", time.time)
+_cpu_time = getattr(time, "process_time", time.clock)
+
+
+class TurnTimes(object):
+    ''' Statistics about how long a player has taken over its turns. All times are in seconds.
+
+        Attributes: turns, wall_total, wall_max, cpu_total, cpu_max, overruns (turns that went over the Game's
+        turn_budget), and wall_histogram and cpu_histogram. Bucket i of a histogram counts the turns that took
+        from 2**(i-1) up to 2**i microseconds (bucket 0 is for less than a microsecond, and the last bucket
+        catches everything longer).
+    '''
+
+    buckets = 25  # The last bucket starts at about eight seconds
+
+    def __init__(self):
+        self.turns = 0
+        self.overruns = 0
+        self.wall_total = self.wall_max = 0.0
+        self.cpu_total = self.cpu_max = 0.0
+        self.wall_histogram = [0] * self.buckets
+        self.cpu_histogram = [0] * self.buckets
+
+    @classmethod
+    def bucket(cls, seconds):
+        ''' Return the histogram bucket for a turn that took the given time '''
+        return min(int(seconds * 1e6).bit_length(), cls.buckets - 1)
+
+    def add(self, wall, cpu):
+        ''' Record a turn that took the given wall-clock and CPU time '''
+        self.turns += 1
+        self.wall_total += wall
+        self.cpu_total += cpu
+        self.wall_max = max(self.wall_max, wall)
+        self.cpu_max = max(self.cpu_max, cpu)
+        self.wall_histogram[self.bucket(wall)] += 1
+        self.cpu_histogram[self.bucket(cpu)] += 1
+
+    @property
+    def wall_mean(self):
+        return self.wall_total / self.turns if self.turns else 0.0
+
+    @property
+    def cpu_mean(self):
+        return self.cpu_total / self.turns if self.turns else 0.0
+
+    def __str__(self):
+        return ("{} turns, wall mean {:.1f}us max {:.1f}us total {:.3f}s, cpu mean {:.1f}us max {:.1f}us total "
+                "{:.3f}s, {} over budget".format(self.turns, self.wall_mean * 1e6, self.wall_max * 1e6,
+                                                 self.wall_total, self.cpu_mean * 1e6, self.cpu_max * 1e6,
+                                                 self.cpu_total, self.overruns))
+
+
 class Game(object):
     ''' A Game takes a Maze, two Goodies and one Baddy.
         It places the three players at random empty cells in the maze, then allows them to take turns in moving,
         passing them any needed information.
+
+        If 'timing' is True, the time each player takes over each turn is recorded in 'turn_times' - a dict mapping
+        player to TurnTimes (see also timing_summary). Otherwise 'turn_times' is None.
+
+        If 'turn_budget' is given, any turn which takes longer than that many seconds (of wall-clock time) is
+        replaced by STAY. Turns can't be interrupted, so this penalises slow players rather than preventing a player
+        from stalling the game. Setting a budget also turns on timing.
+
+        All the randomness in a game comes from 'seed' - it seeds a random.Random which places the players, and the
+        'rng' of each player is seeded from that in turn. If no seed is given, one is drawn from the random module. A
+        game can be reproduced with from_seed, as long as its players only use their own 'rng'.
+
+        The players are placed in the same connected component of the maze, so that the game can always be won. With
+        'connected=False' they are placed anywhere, and can_end() tells whether the game can be won at all.
+
+        A game is drawn when it reaches 'max_rounds' rounds. If 'detect_draws' is True (the default) it is also drawn
+        as soon as a draw is certain - when no player can reach another, or when three stateless players (see
+        Player.stateless) are back in a state they have been in before. 'draw_reason' records which of these ended
+        the game. Normally 'round' is then the round the draw was declared in, but with 'fast_forward' the game skips
+        straight to 'max_rounds', so that the result is exactly what playing on would have given.
     '''
 
     not_started = "not started"
@@ -310,7 +1030,13 @@ class Game(object):
     baddy_wins = "baddy wins"
     draw = "draw"
 
-    def __init__(self, maze, goody0, goody1, baddy, max_rounds=10000):
+    # Reasons for a draw
+    out_of_rounds = "out of rounds"
+    unreachable = "unreachable"
+    repeating = "repeating"
+
+    def __init__(self, maze, goody0, goody1, baddy, max_rounds=10000, timing=False, turn_budget=None, seed=None,
+                 connected=True, detect_draws=True, fast_forward=False):
         if (not isinstance(maze, Maze) or not isinstance(goody0, Goody) or not isinstance(goody1, Goody)
             or not isinstance(baddy, Baddy)):
             raise TypeError("A Game must be initialised with a maze, two goodies, and a baddy. Got:\n{}".format(
@@ -322,29 +1048,60 @@ class Game(object):
 
         self.players = (self.goody0, self.goody1, self.baddy)
 
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        rng = random.Random(self.seed)  # Not kept - it's only needed until the players are placed
+        for player in self.players:
+            player.rng = random.Random(rng.getrandbits(64))
+
         self.position = {}  # a dict mapping player to Position
-        self._place_players()
+        self._place_players(rng, connected)
 
         self.round = 0  # How many rounds of turns we've had so far
         self.max_rounds = max_rounds  # The maximum number of rounds we're allowed before calling it a draw
         self.ping = False  # Whether a ping should be triggered at the start of the next round
         self.status = Game.not_started
+        self.draw_reason = None  # Why the game was drawn, if it was: out_of_rounds, unreachable or repeating
+        self.last_actions = []  # The actions returned by each player in the last round, in turn order
+        self.detect_draws = detect_draws
+        self.fast_forward = fast_forward
+        # The states (positions and ping) seen at the start of each round, if a repeat would mean a draw
+        if detect_draws and all(player.stateless for player in self.players):
+            self._states = set()
+        else:
+            self._states = None
+        self.turn_budget = turn_budget
+        if timing or turn_budget is not None:
+            self.turn_times = {player: TurnTimes() for player in self.players}
+        else:
+            self.turn_times = None
 
-    def _place_players(self):
-        ''' Randomly place the two goodies and the baddy in the maze '''
-        taken = []
-        max_attempts = 1000  # Just to avoid an infinite loop. We expect to place a player much sooner than this!
-        for player in self.players:
-            for _ in xrange(max_attempts):
-                new_position = Position(random.randint(0, self.maze.width - 1), random.randint(0, self.maze.height - 1))
-                if new_position not in taken and self.maze[new_position] == Maze.space:
-                    taken.append(new_position)
-                    self.position[player] = new_position
-                    break
-            else:
-                # We've used up all our attempts! What sort of maze is this ?!?!
-                raise ValueError("Failed to randomly place a player in {} attempts - the maze is too dense!"
-                                 .format(max_attempts))
+    def _place_players(self, rng, connected=True):
+        ''' Randomly place the two goodies and the baddy in the maze, using the random.Random 'rng' - in the same
+            connected component, if 'connected' is True
+        '''
+        try:
+            positions = self.maze.random_empty_positions(len(self.players), rng, connected)
+        except ValueError:
+            raise ValueError("Failed to place the players - the maze is too dense!")
+        for player, position in izip(self.players, positions):
+            self.position[player] = position
+
+    def can_end(self):
+        ''' Return whether the game can end other than in a draw - whether the goodies can reach one another, or the
+            baddy can reach a goody. Players can never leave their connected component, so this never changes unless
+            the maze does.
+        '''
+        maze, position = self.maze, self.position
+        return (maze.connected(position[self.goody0], position[self.goody1]) or
+                maze.connected(position[self.baddy], position[self.goody0]) or
+                maze.connected(position[self.baddy], position[self.goody1]))
+
+    @classmethod
+    def from_seed(cls, maze, seed, goody0_cls, goody1_cls, baddy_cls, max_rounds=10000, **kwargs):
+        ''' Create a game between new players of the given classes, with the given seed. Games created with the same
+            arguments are played identically, as long as the players only use their own 'rng'.
+        '''
+        return cls(maze, goody0_cls(), goody1_cls(), baddy_cls(), max_rounds=max_rounds, seed=seed, **kwargs)
 
     def _ping_response_for_player(self, player):
         ''' Construct a ping response for the given player '''
@@ -357,15 +1114,61 @@ class Game(object):
             If a ping was requested that is computed before anyone moves.
             Return the new status of the game.
         '''
-        if self.status == Game.not_started:
+        ping_response = self._start_round()
+        if ping_response is None:
+            return self.status
+
+        for player in self.players:
+            obstruction = self.maze.obstruction(self.position[player])
+            if self.turn_times is None:
+                action = player.take_turn(obstruction, ping_response[player])
+            else:
+                action = self.take_turn(player, obstruction, ping_response[player])
+            if self._apply_action(player, obstruction, action):
+                break
+
+        return self.status
+
+    def turns(self):
+        ''' A generator which does a round of turns, just like do_round, except that instead of asking the players
+            to take their turns it yields (player, obstruction, ping_response) for each turn, and must be sent the
+            player's action in reply. This lets the turns of many games be interleaved (see remote.play_games).
+            When the generator finishes, the round is over and self.status holds the new status.
+        '''
+        ping_response = self._start_round()
+        if ping_response is None:
+            return
+
+        for player in self.players:
+            obstruction = self.maze.obstruction(self.position[player])
+            action = yield player, obstruction, ping_response[player]
+            if self._apply_action(player, obstruction, action):
+                break
+
+    def _start_round(self):
+        ''' Private - start a new round. Returns the dict mapping each player to its ping response, or None if there
+            are no turns to take this round (because the game is over, or has just been drawn).
+        '''
+        started = self.status == Game.not_started
+        if started:
             self.status = Game.in_play
         elif self.status != Game.in_play:
-            return self.status
+            return None
 
         self.round += 1
+        self.last_actions = []
         if self.round == self.max_rounds:
-            self.status = Game.draw
-            return self.status
+            self._draw(Game.out_of_rounds)
+            return None
+        if started and self.detect_draws and not self.can_end():
+            self._draw(Game.unreachable)
+            return None
+        if self._states is not None:
+            state = (self.position[self.goody0], self.position[self.goody1], self.position[self.baddy], self.ping)
+            if state in self._states:
+                self._draw(Game.repeating)
+                return None
+            self._states.add(state)
 
         if self.ping:
             # Prepare ping responses object for the goodies and baddy
@@ -373,43 +1176,73 @@ class Game(object):
             self.ping = False
         else:
             ping_response = dict.fromkeys(self.players, None)
-
-        for player in self.players:
-            obstruction = self.maze.obstruction(self.position[player])
-            action = player.take_turn(obstruction, ping_response[player])
-
-            # Handle the cases that result in no action
-            if (action == STAY or
-                action in (UP, DOWN, LEFT, RIGHT) and obstruction[action] or
-                action == PING and isinstance(player, Baddy)):
-                continue
-
-            if action == PING:
+        return ping_response
+
+    def _draw(self, reason):
+        ''' Private - end the game in a draw, for the given reason '''
+        self.status = Game.draw
+        self.draw_reason = reason
+        if self.fast_forward:
+            self.round = self.max_rounds
+
+    def _apply_action(self, player, obstruction, action):
+        ''' Private - carry out a player's action. Returns True if it ended the game. '''
+        self.last_actions.append(action)
+
+        # Handle the cases that don't change the player's position
+        step = _STEP_BY_MASK[obstruction.mask][action.code]
+        if step is None:
+            if action is PING and isinstance(player, Goody):
                 self.ping = True
-            else:
-                self.position[player] += STEP[action]
-
-            # Check for game over
-            if isinstance(player, Goody):
-                if self.position[self.goody0] == self.position[self.goody1]:
-                    # The goodies have met
-                    self.status = Game.goodies_win
-                    break
-                elif self.position[player] == self.position[self.baddy]:
-                    # The goody walked into the baddy
-                    self.status = Game.baddy_wins
-                    break
-            else:
-                if self.position[self.baddy] in (self.position[self.goody0], self.position[self.goody1]):
-                    # The baddy caught a goody
-                    self.status = Game.baddy_wins
-                    break
+            return False
 
-        return self.status
+        self.position[player] += step
+
+        # Check for game over
+        if isinstance(player, Goody):
+            if self.position[self.goody0] == self.position[self.goody1]:
+                # The goodies have met
+                self.status = Game.goodies_win
+                return True
+            elif self.position[player] == self.position[self.baddy]:
+                # The goody walked into the baddy
+                self.status = Game.baddy_wins
+                return True
+        elif self.position[self.baddy] in (self.position[self.goody0], self.position[self.goody1]):
+            # The baddy caught a goody
+            self.status = Game.baddy_wins
+            return True
+        return False
+
+    def take_turn(self, player, obstruction, ping_response):
+        ''' Ask the player to take its turn, and return its action. If timing is turned on, the time it takes is
+            recorded and the turn budget is enforced.
+        '''
+        if self.turn_times is None:
+            return player.take_turn(obstruction, ping_response)
+        wall, cpu = _wall_time(), _cpu_time()
+        action = player.take_turn(obstruction, ping_response)
+        wall, cpu = _wall_time() - wall, _cpu_time() - cpu
+        times = self.turn_times[player]
+        times.add(wall, cpu)
+        if self.turn_budget is not None and wall > self.turn_budget:
+            times.overruns += 1
+            action = STAY
+        return action
+
+    def timing_summary(self):
+        ''' Return a description of the time taken by each player so far, one line per player.
+            Only available if the game was created with timing turned on.
+        '''
+        if self.turn_times is None:
+            raise ValueError("This game was not created with timing=True")
+        return "\n".join("{} ({}): {}".format(name, type(player).__name__, self.turn_times[player])
+                         for name, player in (("Goody0", self.goody0), ("Goody1", self.goody1), ("Baddy", self.baddy)))
 
     def play(self, hook=None):
         ''' Keep playing until there is a result. Returns the result and the number of rounds.
             'hook' will be called after each round. It should accept one argument - the game.
+            If timing is turned on, timing_summary() describes how long each player took.
         '''
         while True:
             result = self.do_round()
@@ -441,10 +1274,14 @@ def game_generator(mazes, goody0s, goody1s, baddies, max_rounds=10000):
     for maze, goody0, goody1, baddy in izip(mazes, goody0s, goody1s, baddies):
         yield Game(maze, goody0, goody1, baddy, max_rounds=max_rounds)
 
-def game_repeater(maze, goody0_cls, goody1_cls, baddy_cls, max_rounds=10000)        :
-    ''' A generator of instances of identical games '''
+def game_repeater(maze, goody0_cls, goody1_cls, baddy_cls, max_rounds=10000, seed=None):
+    ''' A generator of instances of identical games.
+        If 'seed' is given, the seed of each game is drawn from a random.Random seeded with it, so the whole sequence
+        of games is reproducible.
+    '''
+    rng = random.Random(seed) if seed is not None else random
     while True:
-        yield Game(maze, goody0_cls(), goody1_cls(), baddy_cls(), max_rounds=max_rounds)
+        yield Game.from_seed(maze, rng.getrandbits(64), goody0_cls, goody1_cls, baddy_cls, max_rounds=max_rounds)
 
 
 class PositionTest(unittest.TestCase):
@@ -474,6 +1311,409 @@ class PositionTest(unittest.TestCase):
     def test_inequality(self):
         self.assertTrue(self.pos1 != self.pos2)
 
+    def test_tuples(self):
+        self.assertEqual(self.pos1 + (1, 1), Position(6, 8))
+        self.assertEqual((1, 1) + self.pos1, Position(6, 8))
+        self.assertEqual((1, 1) - self.pos1, Position(-4, -6))
+        self.assertIsInstance((1, 1) - self.pos1, Position)
+        self.assertTrue(self.pos1 == (5, 7))
+        self.assertEqual(hash(self.pos1), hash((5, 7)))
+        x, y = self.pos1
+        self.assertEqual((x, y), (self.pos1.x, self.pos1.y))
+
+    def test_immutable(self):
+        with self.assertRaises(AttributeError):
+            self.pos1.x = 3
+
+    def test_pickle(self):
+        self.assertEqual(pickle.loads(pickle.dumps(self.pos1, pickle.HIGHEST_PROTOCOL)), self.pos1)
+
+
+class MazeTest(unittest.TestCase):
+    ''' Test that the Maze class stores and reports cells correctly '''
+
+    def setUp(self):
+        self.maze = Maze(3, 2, "110"
+                               "001")
+
+    def test_getitem(self):
+        self.assertEqual(self.maze[0, 1], Maze.wall)
+        self.assertEqual(self.maze[Position(2, 1)], Maze.space)
+        self.assertEqual(self.maze[2, 0], Maze.wall)
+        self.assertEqual(self.maze[0, 0], Maze.space)
+
+    def test_out_of_bounds(self):
+        for index in ((-1, 0), (3, 0), (0, 2), (0, -1), (100, 100)):
+            self.assertEqual(self.maze[index], Maze.wall)
+
+    def test_setitem(self):
+        self.maze[2, 1] = Maze.wall
+        self.assertEqual(self.maze[2, 1], Maze.wall)
+        self.assertRaises(IndexError, self.maze.__setitem__, (3, 0), Maze.wall)
+        self.assertRaises(ValueError, self.maze.__setitem__, (0, 0), 2)
+
+    def test_str(self):
+        self.assertEqual(str(self.maze), "XXXXX\n"
+                                         "XXX X\n"
+                                         "X  XX\n"
+                                         "XXXXX")
+
+    def test_obstruction(self):
+        obstruction = self.maze.obstruction(Position(1, 0))
+        self.assertEqual([obstruction[move] for move in (UP, LEFT, DOWN, RIGHT)], [True, False, True, True])
+
+    def test_move_codes(self):
+        for code, move in enumerate(MOVES):
+            self.assertEqual(move.code, code)
+            self.assertIs(pickle.loads(pickle.dumps(move, pickle.HIGHEST_PROTOCOL)), move)
+        for move in (UP, LEFT, DOWN, RIGHT):
+            self.assertEqual(Obstruction.from_mask(1 << move.code)[move], True)
+
+    def test_obstruction_is_interned(self):
+        self.assertIs(self.maze.obstruction(Position(1, 0)), self.maze.obstruction(Position(1, 0)))
+        self.assertIs(self.maze.obstruction(Position(1, 0)), Obstruction.from_mask(0b1101))
+
+    def test_obstruction_after_setitem(self):
+        self.maze.obstruction(Position(0, 0))
+        self.maze[0, 0] = Maze.wall
+        self.assertTrue(self.maze.obstruction(Position(1, 0))[LEFT])
+
+    def test_distance(self):
+        maze = Maze(4, 3, "0000"
+                          "1101"
+                          "0001")
+        self.assertEqual(maze.distance((0, 0), (0, 2)), 6)
+        self.assertEqual(maze.distance((0, 2), (0, 0)), 6)
+        self.assertEqual(maze.distance((1, 0), (1, 0)), 0)
+        self.assertIsNone(maze.distance((0, 0), (3, 0)))  # A wall
+        self.assertIsNone(maze.distance((0, 0), (4, 0)))  # Out of the maze
+        self.assertEqual(maze.next_step((0, 0), (0, 2)), RIGHT)
+        self.assertEqual(maze.next_step((2, 1), (0, 2)), UP)
+        self.assertEqual(maze.next_step((2, 2), (2, 2)), STAY)
+
+        maze[2, 1] = Maze.wall
+        self.assertIsNone(maze.distance((0, 0), (0, 2)))
+        self.assertEqual(maze.next_step((0, 0), (0, 2)), STAY)
+
+    def test_distance_cache_is_bounded(self):
+        maze = Maze(10, 10)
+        maze.distance_cache_size = 4
+        for x in xrange(10):
+            self.assertEqual(maze.distance((0, 0), (x, 9)), x + 9)
+        self.assertEqual(len(maze._distance_fields), 4)
+
+    def test_empty_cells(self):
+        self.assertEqual(self.maze.empty_cells(), 3)
+        self.assertEqual((self.maze * (3, 2)).empty_cells(), 18)
+
+    def test_empty_cells_after_setitem(self):
+        self.maze[0, 0] = Maze.wall
+        self.maze[0, 1] = Maze.space
+        self.maze[0, 1] = Maze.space
+        self.assertEqual(self.maze.empty_cells(), 3)
+        self.maze[1, 0] = Maze.wall
+        self.maze[2, 1] = Maze.wall
+        self.assertEqual(self.maze.empty_cells(), 1)
+        self.assertEqual(self.maze.random_empty_positions(1), [Position(0, 1)])
+        self.assertRaises(ValueError, self.maze.random_empty_positions, 2)
+
+    def test_random_empty_positions(self):
+        maze = Maze(5, 5, "01010"
+                          "10101"
+                          "01010"
+                          "10101"
+                          "01010")
+        positions = maze.random_empty_positions(13, random.Random(1))
+        self.assertEqual(len(set(positions)), 13)
+        for position in positions:
+            self.assertEqual(maze[position], Maze.space)
+
+    def test_random_empty_positions_ignore_history(self):
+        maze = self.maze * (4, 4)
+        maze.empty_cells()  # Build the index, so that the edits below update it
+        for x, y in ((0, 0), (5, 2), (1, 0), (11, 7)):
+            maze[x, y] = Maze.wall
+        for x, y in ((0, 0), (2, 2), (0, 3)):
+            maze[x, y] = Maze.space
+        empty = list(maze._empty_index())
+        self.assertEqual(empty, sorted(empty))
+        copy = pickle.loads(pickle.dumps(maze, pickle.HIGHEST_PROTOCOL))
+        for seed in xrange(10):
+            self.assertEqual(maze.random_empty_positions(3, random.Random(seed)),
+                             copy.random_empty_positions(3, random.Random(seed)))
+
+    def test_components(self):
+        maze = Maze(5, 3, "00100"
+                          "11100"
+                          "01011")
+        self.assertEqual(sorted(maze.component_sizes()), [1, 1, 2, 4])
+        self.assertTrue(maze.connected((3, 1), (4, 2), (3, 2)))
+        self.assertFalse(maze.connected((0, 2), (3, 2)))
+        self.assertFalse(maze.connected((0, 0), (0, 1)))  # A wall isn't in any component
+        self.assertIsNone(maze.component((9, 9)))
+        maze[2, 2] = Maze.space
+        self.assertTrue(maze.connected((0, 2), (3, 2)))
+        self.assertEqual(sorted(maze.component_sizes()), [1, 1, 7])
+        try:
+            labels = maze.component_array()
+        except ImportError:
+            return
+        self.assertEqual(labels[0, 1], -1)
+        self.assertEqual(labels[2, 0], maze.component((4, 1)))
+
+    def test_label_components(self):
+        rng = random.Random(3)
+        for width, height, density in ((1, 1, 0), (7, 5, 0.4), (30, 20, 0.45), (25, 25, 0.6)):
+            maze = Maze(width, height, "".join(str(int(rng.random() < density)) for _ in xrange(width * height)))
+            labels, members, sizes = _label_components(maze._cells, maze._stride)
+            expected_labels, expected_members, expected_sizes = _flood_fill_components(maze._cells, maze._stride)
+            self.assertEqual(sizes, expected_sizes)
+            if len(sizes) > 1:
+                self.assertEqual(list(labels), list(expected_labels))
+                self.assertEqual(list(members), list(expected_members))
+        connected = Maze.from_buffer(3, 2, bytearray(Maze(3, 2)._cells), connected=True)
+        self.assertIsNone(connected._components[1])  # Known without a search
+        self.assertEqual(connected.component_sizes(), [6])
+        self.assertEqual(connected.component((2, 1)), 0)
+
+    def test_random_connected_positions(self):
+        maze = Maze(5, 3, "00100"
+                          "11100"
+                          "01011")
+        rng = random.Random(0)
+        seen = set()
+        for _ in xrange(500):
+            positions = maze.random_empty_positions(3, rng, connected=True)
+            self.assertEqual(len(set(positions)), 3)
+            self.assertTrue(maze.connected(*positions))
+            seen.update(positions)
+        self.assertEqual(seen, {Position(3, 1), Position(4, 1), Position(3, 2), Position(4, 2)})
+        self.assertEqual(len(maze.random_empty_positions(2, rng, connected=True)), 2)
+        self.assertRaises(ValueError, maze.random_empty_positions, 5, rng, connected=True)
+        # The same choices as unconnected placement when the whole maze is connected
+        self.assertEqual(Maze(4, 4).random_empty_positions(3, random.Random(1), connected=True),
+                         Maze(4, 4).random_empty_positions(3, random.Random(1)))
+
+    def test_multiply(self):
+        tiled = self.maze * (2, 3)
+        self.assertEqual((tiled.width, tiled.height), (6, 6))
+        for x in xrange(tiled.width):
+            for y in xrange(tiled.height):
+                self.assertEqual(tiled[x, y], self.maze[x % 3, y % 2])
+
+    def test_packed(self):
+        self.assertEqual(self.maze.packed(), bytearray([0b011100]))
+        for maze in (self.maze, self.maze * (7, 3), Maze(0, 0), Maze(9, 1, "100000001")):
+            copy = type(maze).from_packed(maze.width, maze.height, maze.packed())
+            self.assertEqual(repr(copy), repr(maze))
+
+    def test_digest(self):
+        digest = self.maze.digest()
+        self.assertEqual(type(self.maze).from_packed(3, 2, self.maze.packed()).digest(), digest)
+        self.assertNotEqual(Maze(2, 3).digest(), Maze(3, 2).digest())
+        self.maze[0, 0] = Maze.wall
+        self.assertNotEqual(self.maze.digest(), digest)
+
+    def test_from_array(self):
+        try:
+            cells = self.maze.array()
+        except ImportError:
+            self.skipTest("NumPy is not installed")
+        copy = type(self.maze).from_array(cells)
+        self.assertEqual(repr(copy), repr(self.maze))
+        self.assertEqual(copy.obstruction(Position(1, 1)), self.maze.obstruction(Position(1, 1)))
+        self.assertRaises(ValueError, Maze.from_buffer, 3, 2, bytearray(19))
+
+    def test_pickle(self):
+        copy = pickle.loads(pickle.dumps(self.maze, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(repr(copy), repr(self.maze))
+
+    def test_array(self):
+        try:
+            cells = self.maze.array()
+        except ImportError:
+            self.skipTest("NumPy is not installed")
+        self.assertEqual(cells.shape, (2, 3))
+        self.assertEqual(cells[1, 0], Maze.wall)
+        self.assertEqual(self.maze.array(padded=True).sum(), 17)
+        self.maze[0, 0] = Maze.wall
+        self.assertEqual(cells[0, 0], Maze.wall)  # It's a view, not a copy
+
+
+class PackedMazeTest(MazeTest):
+    ''' Run the Maze tests against PackedMaze '''
+
+    def setUp(self):
+        self.maze = PackedMaze(3, 2, "110"
+                                     "001")
+
+    def test_obstruction_everywhere(self):
+        maze = Maze(9, 7, "001000110"
+                          "011010100"
+                          "000010001"
+                          "010000111"
+                          "010110000"
+                          "100000101"
+                          "000011000")
+        packed = PackedMaze.from_maze(maze)
+        for x in xrange(-1, 10):
+            for y in xrange(-1, 8):
+                self.assertEqual(packed[x, y], maze[x, y])
+                self.assertEqual(packed.obstruction(Position(x, y)).mask, maze.obstruction(Position(x, y)).mask)
+        self.assertEqual(len(packed._bits), (11 * 9 + 7) // 8 + 1)
+        self.assertEqual(repr(packed * (2, 3)), repr(maze * (2, 3)).replace("Maze", "PackedMaze"))
+        self.assertIsInstance(packed * (2, 3), PackedMaze)
+
+    def test_game(self):
+        from goodies import RandomGoody
+        from baddies import RandomBaddy
+        from mazes import SMALL as maze
+        packed = PackedMaze.from_maze(maze)
+        games = [Game.from_seed(cells, 5, RandomGoody, RandomGoody, RandomBaddy, max_rounds=500)
+                 for cells in (maze, packed)]
+        for game in games:
+            game.play()
+        self.assertEqual([(game.status, game.round, sorted(game.position.values())) for game in games[:1]],
+                         [(game.status, game.round, sorted(game.position.values())) for game in games[1:]])
+        self.assertIsNone(packed._unpacked)  # Placing the players and playing didn't unpack the cells
+        self.assertEqual(packed._components, ([maze.empty_cells()], None, None))
+
+    def test_empty_bits(self):
+        maze = Maze(150, 40)
+        rng = random.Random(2)
+        for _ in xrange(2000):
+            maze[rng.randrange(150), rng.randrange(40)] = Maze.wall
+        packed = PackedMaze.from_maze(maze)
+        empty = packed._empty_index()
+        self.assertEqual(len(empty.counts), 2)  # Two blocks, the second only partly used
+        self.assertEqual(list(empty), list(maze._empty_index()))
+        for _ in xrange(100):
+            position = rng.randrange(150), rng.randrange(40)
+            value = rng.choice((Maze.space, Maze.wall))
+            maze[position] = packed[position] = value
+        self.assertEqual(list(empty), list(maze._empty_index()))
+        self.assertRaises(IndexError, empty.__getitem__, len(empty))
+
+
+class GameTest(unittest.TestCase):
+    ''' Test the timing of players' turns '''
+
+    class Slow(Goody, Baddy):
+        ''' Always makes the same move, optionally taking a while to decide '''
+        def __init__(self, delay=0, move=STAY):
+            self.delay = delay
+            self.move = move
+
+        def take_turn(self, obstruction, ping_response):
+            if self.delay:
+                time.sleep(self.delay)
+            return self.move
+
+    def setUp(self):
+        self.maze = Maze(10, 3)
+
+    def new_game(self, goody1_delay, **kwargs):
+        goody1 = self.Slow(goody1_delay, PING)
+        return Game(self.maze, self.Slow(), goody1, self.Slow(), max_rounds=4, **kwargs)
+
+    def test_untimed(self):
+        game = self.new_game(0)
+        game.play()
+        self.assertIsNone(game.turn_times)
+        self.assertRaises(ValueError, game.timing_summary)
+
+    def test_timing(self):
+        game = self.new_game(0.002, timing=True)
+        _, rounds = game.play()
+        self.assertEqual(rounds, 4)
+        slow = game.turn_times[game.goody1]
+        self.assertEqual(slow.turns, 3)  # The last round is the draw, when nobody moves
+        self.assertGreaterEqual(slow.wall_total, 0.006)
+        self.assertGreaterEqual(slow.wall_max, 0.002)
+        self.assertEqual(sum(slow.wall_histogram), 3)
+        self.assertEqual(sum(slow.wall_histogram[TurnTimes.bucket(0.002):]), 3)
+        self.assertLess(game.turn_times[game.goody0].wall_max, slow.wall_max)
+        self.assertEqual(slow.overruns, 0)
+        self.assertEqual(len(game.timing_summary().splitlines()), 3)
+
+    def test_seed(self):
+        from goodies import RandomGoody
+        from baddies import RandomBaddy
+        from mazes import SMALL as maze
+
+        def history(game):
+            states = []
+            game.play(hook=lambda game: states.append([game.position[player] for player in game.players]))
+            return game.status, states
+
+        first = Game.from_seed(maze, 12345, RandomGoody, RandomGoody, RandomBaddy, max_rounds=100)
+        random.seed(1)  # The global random module makes no difference
+        second = Game.from_seed(maze, 12345, RandomGoody, RandomGoody, RandomBaddy, max_rounds=100)
+        self.assertEqual(history(first), history(second))
+        histories = set(repr(history(Game.from_seed(maze, seed, RandomGoody, RandomGoody, RandomBaddy)))
+                        for seed in xrange(10))
+        self.assertGreater(len(histories), 1)
+
+        repeaters = [game_repeater(maze, RandomGoody, RandomGoody, RandomBaddy, seed=3) for _ in xrange(2)]
+        repeated = [[game.seed for game in islice(repeater, 5)] for repeater in repeaters]
+        self.assertEqual(repeated[0], repeated[1])
+        self.assertEqual(len(set(repeated[0])), 5)
+
+    def test_connected_placement(self):
+        maze = Maze(8, 1, "00010100")
+        for seed in xrange(20):
+            game = Game(maze, self.Slow(), self.Slow(), self.Slow(), seed=seed)
+            self.assertTrue(maze.connected(*game.position.values()))
+            self.assertTrue(game.can_end())
+        apart = [Game(maze, self.Slow(), self.Slow(), self.Slow(), seed=seed, connected=False) for seed in xrange(20)]
+        self.assertIn(False, [game.can_end() for game in apart])
+        for game in apart:
+            self.assertEqual(game.can_end(), len(set(maze.component(position)
+                                                     for position in game.position.values())) < 3)
+
+    def test_early_draws(self):
+        class Still(Goody, Baddy):
+            stateless = True
+            def take_turn(self, obstruction, ping_response):
+                return STAY
+
+        game = Game(self.maze, Still(), Still(), Still(), seed=0)
+        self.assertEqual(game.play(), (Game.draw, 2))  # Back where it started after one round
+        self.assertEqual(game.draw_reason, Game.repeating)
+
+        game = Game(self.maze, Still(), Still(), self.Slow(), seed=0)  # Slow isn't stateless
+        self.assertEqual(game.play(), (Game.draw, 10000))
+        self.assertEqual(game.draw_reason, Game.out_of_rounds)
+
+        maze = Maze(5, 1, "01010")
+        game = Game(maze, self.Slow(move=RIGHT), self.Slow(), self.Slow(), seed=0, connected=False)
+        self.assertEqual(game.play(), (Game.draw, 1))
+        self.assertEqual(game.draw_reason, Game.unreachable)
+        self.assertEqual(game.last_actions, [])
+
+        game = Game(maze, self.Slow(), self.Slow(), self.Slow(), max_rounds=50, seed=0, connected=False,
+                    fast_forward=True)
+        self.assertEqual(game.play(), (Game.draw, 50))
+        self.assertEqual(game.draw_reason, Game.unreachable)
+
+        game = Game(maze, self.Slow(), self.Slow(), self.Slow(), max_rounds=50, seed=0, connected=False,
+                    detect_draws=False)
+        self.assertEqual(game.play(), (Game.draw, 50))
+        self.assertEqual(game.draw_reason, Game.out_of_rounds)
+
+    def test_turn_budget(self):
+        game = self.new_game(0.01, turn_budget=0.005)
+        game.do_round()
+        self.assertEqual(game.last_actions, [STAY, STAY, STAY])  # The PING took too long
+        self.assertFalse(game.ping)
+        self.assertEqual(game.turn_times[game.goody1].overruns, 1)
+        self.assertEqual(game.turn_times[game.goody0].overruns, 0)
+
+        game = self.new_game(0.01, turn_budget=1)
+        game.do_round()
+        self.assertEqual(game.last_actions, [STAY, PING, STAY])
+        self.assertTrue(game.ping)
+
 
 if __name__ == "__main__":
     # Run the unittests in this script, with a nice level of output
@@ -0,0 +1,446 @@
+'''
+    remote.py
+
+    Run players in worker processes, so that a player which crashes or hangs can't take the game down with it.
+
+    A PlayerWorker is a process hosting instances of one Player class - one for each game it is playing in. Its
+    player() method returns a local stand-in (a RemoteGoody or RemoteBaddy), which can be used in a Game just like
+    any other player. Each of its turns is then a round trip to the worker.
+
+    play_games plays many games at once, and amortises the round trips: all the turns waiting on the same worker are
+    sent to it as one message, and every worker is sent its batch before waiting for any of the replies. The time
+    limit on those turns is the worker's timeout, rather than the Game's turn_budget (see play_games).
+
+    The protocol is a compact binary one, sent over a pipe with Connection.send_bytes. A request is made up of
+        <II   the number of players to forget, and the number of turns
+        <I    the id of each player to forget
+    and then for each turn
+        <IBB  the player's id, its obstruction mask, and the number of entries in its ping response (0 for None)
+        <Bii  for each entry: the index of the other player (shifted left one bit, with the low bit set if it is a
+              goody), then its relative x and y
+    The reply holds one byte per turn - the code of the Move (see maze.Move), or ERROR if take_turn raised an
+    exception or didn't return a Move. An empty request tells the worker to exit.
+
+    If a worker doesn't reply within its timeout, or dies, it is replaced (so the players it was hosting start
+    afresh) and every turn in the batch becomes STAY.
+
+    Defines:
+        PlayerWorker - a worker process hosting players of one class
+        RemoteGoody, RemoteBaddy - the local stand-ins for players hosted by a PlayerWorker
+        play_games - play many games at once, batching the turns of remote players
+'''
+
+import multiprocessing
+import random
+import struct
+import time
+import unittest
+
+from collections import OrderedDict
+
+from maze import Game, Goody, Baddy, Obstruction, Position, MOVES, UP, STAY, PING
+
+ERROR = 0xFF  # The reply to a turn that failed
+
+_REQUEST_HEADER = struct.Struct("<II")  # Players to forget, turns
+_TURN = struct.Struct("<IBB")  # Player id, obstruction mask, ping response entries
+_ENTRY = struct.Struct("<Bii")  # Other player (index << 1 | is goody), relative x, y
+
+
+class _OtherGoody(Goody):
+    ''' Private - stands in for another goody in the ping responses passed to a hosted player '''
+    def take_turn(self, _obstruction, _ping_response):
+        return STAY
+
+
+class _OtherBaddy(Baddy):
+    ''' Private - stands in for another baddy in the ping responses passed to a hosted player '''
+    def take_turn(self, _obstruction, _ping_response):
+        return STAY
+
+
+class _PlayerHost(object):
+    ''' Private - the players hosted by a worker process, and the decoding of requests to them '''
+
+    def __init__(self, player_cls):
+        self.player_cls = player_cls
+        self.players = {}  # Player id -> player
+        self.others = {}  # Player id -> {entry: stand-in for another player}
+
+    def _other(self, player_id, entry):
+        ''' Private - return the stand-in for the other player described by a ping response entry '''
+        others = self.others.setdefault(player_id, {})
+        if entry not in others:
+            others[entry] = _OtherGoody() if entry & 1 else _OtherBaddy()
+        return others[entry]
+
+    def handle(self, request):
+        ''' Take the turns in a request, and return the reply '''
+        forget, turns = _REQUEST_HEADER.unpack_from(request)
+        offset = _REQUEST_HEADER.size
+        for player_id in struct.unpack_from("<{}I".format(forget), request, offset):
+            self.players.pop(player_id, None)
+            self.others.pop(player_id, None)
+        offset += 4 * forget
+
+        reply = bytearray(turns)
+        for turn in xrange(turns):
+            player_id, mask, entries = _TURN.unpack_from(request, offset)
+            offset += _TURN.size
+            ping_response = None
+            if entries:
+                ping_response = {}
+                for _ in xrange(entries):
+                    entry, x, y = _ENTRY.unpack_from(request, offset)
+                    offset += _ENTRY.size
+                    ping_response[self._other(player_id, entry)] = Position(x, y)
+            try:
+                player = self.players.get(player_id)
+                if player is None:
+                    player = self.players[player_id] = self.player_cls()
+                reply[turn] = MOVES.index(player.take_turn(Obstruction.from_mask(mask), ping_response))
+            except Exception:
+                reply[turn] = ERROR
+        return bytes(reply)
+
+
+def _encode_request(forgotten, turns):
+    ''' Private - encode a request, given the ids of the players to forget and a list of
+        (remote player, obstruction, ping_response)
+    '''
+    parts = [_REQUEST_HEADER.pack(len(forgotten), len(turns)), struct.pack("<{}I".format(len(forgotten)), *forgotten)]
+    for player, obstruction, ping_response in turns:
+        if ping_response is None:
+            parts.append(_TURN.pack(player.player_id, obstruction.mask, 0))
+        else:
+            parts.append(_TURN.pack(player.player_id, obstruction.mask, len(ping_response)))
+            for other, position in ping_response.iteritems():
+                parts.append(_ENTRY.pack(player._entry(other), position.x, position.y))
+    return b"".join(parts)
+
+
+def _serve(connection, player_cls):
+    ''' Private - the main loop of a worker process '''
+    host = _PlayerHost(player_cls)
+    while True:
+        try:
+            request = connection.recv_bytes()
+        except EOFError:
+            return
+        if not request:
+            return
+        connection.send_bytes(host.handle(request))
+
+
+class RemotePlayer(object):
+    ''' The local stand-in for a player hosted by a PlayerWorker. Use RemoteGoody or RemoteBaddy, which are what
+        PlayerWorker.player() returns. Call close() when the game is over, so the worker can free the player.
+    '''
+
+    def __init__(self, worker, player_id):
+        self.worker = worker
+        self.player_id = player_id
+        self._others = {}  # Other player -> index, in the order they were first seen in a ping response
+
+    def take_turn(self, obstruction, ping_response):
+        return self.worker.take_turns([(self, obstruction, ping_response)])[0]
+
+    def _entry(self, other):
+        ''' Private - the ping response entry header for the other player '''
+        index = self._others.setdefault(other, len(self._others))
+        return index << 1 | isinstance(other, Goody)
+
+    def close(self):
+        self.worker.forget(self)
+        self._others = {}
+
+
+class RemoteGoody(RemotePlayer, Goody):
+    ''' A Goody which is hosted by a PlayerWorker '''
+    pass
+
+
+class RemoteBaddy(RemotePlayer, Baddy):
+    ''' A Baddy which is hosted by a PlayerWorker '''
+    pass
+
+
+class PlayerWorker(object):
+    ''' A worker process which hosts players of the given class (constructed without arguments, like those in a
+        Tournament).
+
+        'timeout' is how many seconds to wait for the reply to a batch of turns. If the worker takes longer, or dies,
+        it is stopped and the turns are taken as STAY. A new worker process is started for the next batch.
+
+        Attributes, counting problems so far:
+            errors - turns in which the player raised an exception, or didn't return a Move
+            timeouts - batches of turns which the worker didn't reply to in time
+            crashes - batches of turns which the worker died during
+        Use it as a context manager, or call close() when finished.
+    '''
+
+    def __init__(self, player_cls, timeout=1.0):
+        if not issubclass(player_cls, (Goody, Baddy)):
+            raise TypeError("A PlayerWorker must host a Goody or Baddy class. Got: {}".format(player_cls))
+        self.player_cls = player_cls
+        self.timeout = timeout
+        self.errors = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self._next_id = 0
+        self._forgotten = []  # Ids of players to be freed with the next request
+        self._sent = None  # The number of turns sent and not yet replied to, or None
+        self._start()
+
+    def _start(self):
+        ''' Private - start the worker process '''
+        self._connection, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(child, self.player_cls))
+        self._process.daemon = True
+        self._process.start()
+        child.close()
+
+    def _stop(self):
+        ''' Private - get rid of a hung or dead worker process. A new one is started when it's next needed. '''
+        self._process.terminate()
+        self._process.join()
+        self._connection.close()
+        self._process = None
+        self._forgotten = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc_info):
+        self.close()
+
+    def close(self):
+        ''' Ask the worker process to exit, and wait for it '''
+        if self._process is None:
+            return
+        try:
+            self._connection.send_bytes(b"")
+        except (IOError, OSError):
+            pass
+        self._process.join(self.timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._connection.close()
+        self._process = None
+
+    def player(self):
+        ''' Return a new player hosted by this worker '''
+        self._next_id += 1
+        remote_cls = RemoteGoody if issubclass(self.player_cls, Goody) else RemoteBaddy
+        return remote_cls(self, self._next_id)
+
+    def forget(self, player):
+        ''' Free the given player in the worker (this happens when the next batch of turns is sent) '''
+        self._forgotten.append(player.player_id)
+
+    def send(self, turns):
+        ''' Send a batch of turns to the worker. 'turns' is a list of (remote player, obstruction, ping_response).
+            receive() must be called to get the actions before sending another batch.
+        '''
+        if self._sent is not None:
+            raise ValueError("The last batch of turns has not been received")
+        if self._process is None:
+            self._start()
+        request = _encode_request(self._forgotten, turns)
+        self._forgotten = []
+        self._sent = len(turns)
+        try:
+            self._connection.send_bytes(request)
+        except (IOError, OSError):
+            pass  # The worker has died - receive() will notice
+
+    def receive(self):
+        ''' Wait for the reply to the last batch of turns sent, and return the list of actions '''
+        count, self._sent = self._sent, None
+        try:
+            if self._connection.poll(self.timeout):
+                reply = bytearray(self._connection.recv_bytes())
+            else:
+                reply = None
+                self.timeouts += 1
+        except (EOFError, IOError, OSError):
+            reply = None
+            self.crashes += 1
+        if reply is None:
+            self._stop()
+            return [STAY] * count
+
+        actions = []
+        for code in reply:
+            if code == ERROR:
+                self.errors += 1
+                actions.append(STAY)
+            else:
+                actions.append(MOVES[code])
+        return actions
+
+    def take_turns(self, turns):
+        ''' Send a batch of turns to the worker, and return the actions '''
+        self.send(turns)
+        return self.receive()
+
+
+def play_games(games):
+    ''' Play every game to the end, interleaving their turns so that all the turns waiting on each PlayerWorker are
+        sent to it as one batch, and every worker is sent its batch before waiting for any replies. Players which
+        aren't remote take their turns in-process as usual.
+
+        The turns of remote players are not timed, and the Game's turn_budget doesn't apply to them: the round trip
+        of a batch is shared by all of its turns, so it says nothing about how long any one of them took. A remote
+        player's turns are limited by its PlayerWorker's 'timeout' instead. The turns of other players are timed as
+        usual.
+
+        Every remote player is closed once the games are over (or if one of them raises an exception), so that its
+        worker can free it. Returns a list of (result, number of rounds), one for each game.
+    '''
+    games = list(games)
+    try:
+        waiting = []  # (game, turns generator, turn) for every game waiting on a remote player
+        for game in games:
+            _advance(game, game.turns(), None, waiting)
+
+        while waiting:
+            batches = OrderedDict()
+            for item in waiting:
+                batches.setdefault(item[2][0].worker, []).append(item)
+            for worker, items in batches.iteritems():
+                worker.send([turn for _, _, turn in items])
+            waiting = []
+            for worker, items in batches.iteritems():
+                for (game, turns, _), action in zip(items, worker.receive()):
+                    _advance(game, turns, action, waiting)
+    finally:
+        for game in games:
+            for player in game.players:
+                if isinstance(player, RemotePlayer):
+                    player.close()
+
+    return [(game.status, game.round) for game in games]
+
+def _advance(game, turns, action, waiting):
+    ''' Private - send the action to the game's turns generator, and carry on playing (starting new rounds as needed)
+        until the game is over, or a remote player has to take a turn - in which case it's added to 'waiting'.
+    '''
+    while True:
+        try:
+            turn = turns.send(action)
+        except StopIteration:
+            if game.status != Game.in_play:
+                return
+            turns, action = game.turns(), None
+            continue
+        if isinstance(turn[0], RemotePlayer):
+            waiting.append((game, turns, turn))
+            return
+        action = game.take_turn(*turn)
+
+
+class RemoteTest(unittest.TestCase):
+    ''' Test players hosted in worker processes '''
+
+    class Recorder(Goody):
+        ''' Remembers what it was told, and moves UP '''
+        turns = []
+
+        def take_turn(self, obstruction, ping_response):
+            self.turns.append((obstruction, ping_response))
+            return UP
+
+    class Crasher(Goody):
+        ''' Raises an exception on its second turn '''
+        def __init__(self):
+            self.turn = 0
+
+        def take_turn(self, _obstruction, _ping_response):
+            self.turn += 1
+            if self.turn == 2:
+                raise RuntimeError("Crashed on purpose")
+            return PING
+
+    class Sleeper(Baddy):
+        ''' Hangs unless 'awake' is set '''
+        awake = False
+
+        def take_turn(self, _obstruction, _ping_response):
+            if not self.awake:
+                time.sleep(60)
+            return STAY
+
+    def setUp(self):
+        from mazes import SMALL
+        self.maze = SMALL
+
+    def test_protocol(self):
+        first, second = RemoteGoody(None, 1), RemoteGoody(None, 2)
+        ping_response = {self.Recorder(): Position(-3, 2), _OtherBaddy(): Position(4, -1)}
+        request = _encode_request([], [(first, Obstruction.from_mask(5), None),
+                                       (second, Obstruction.from_mask(0), ping_response)])
+
+        host = _PlayerHost(self.Recorder)
+        del self.Recorder.turns[:]
+        self.assertEqual(host.handle(request), bytes(bytearray([UP.code, UP.code])))
+        (obstruction0, ping0), (obstruction1, ping1) = self.Recorder.turns
+        self.assertIs(obstruction0, Obstruction.from_mask(5))
+        self.assertIsNone(ping0)
+        self.assertIs(obstruction1, Obstruction.from_mask(0))
+        self.assertEqual(sorted((isinstance(player, Goody), position) for player, position in ping1.items()),
+                         [(False, Position(4, -1)), (True, Position(-3, 2))])
+        self.assertEqual(sorted(host.players), [1, 2])
+
+        host.handle(_encode_request([2], []))
+        self.assertEqual(sorted(host.players), [1])
+
+        turns = [(first, Obstruction.from_mask(5), None)] * 70000  # More than a 16-bit count
+        self.assertEqual(host.handle(_encode_request([], turns)), bytes(bytearray([UP.code] * 70000)))
+
+    def test_play_games(self):
+        from goodies import RandomGoody
+        from baddies import RandomBaddy
+        random.seed(0)
+        with PlayerWorker(RandomGoody) as goodies, PlayerWorker(RandomBaddy) as baddies:
+            games = [Game(self.maze, goodies.player(), goodies.player(), baddies.player(), max_rounds=200)
+                     for _ in xrange(20)]
+            games.append(Game(self.maze, RandomGoody(), goodies.player(), RandomBaddy(), max_rounds=200))
+            results = play_games(games)
+            self.assertEqual(results, [(game.status, game.round) for game in games])
+            for result, rounds in results:
+                self.assertIn(result, (Game.goodies_win, Game.baddy_wins, Game.draw))
+                self.assertLessEqual(rounds, 200)
+            self.assertEqual((goodies.errors, goodies.timeouts, goodies.crashes), (0, 0, 0))
+            self.assertEqual(len(goodies._forgotten), 41)  # Every remote goody was closed
+
+    def test_errors(self):
+        from baddies import StaticBaddy
+        random.seed(0)
+        with PlayerWorker(self.Crasher) as worker:
+            game = Game(self.maze, worker.player(), worker.player(), StaticBaddy(), max_rounds=4)
+            game.do_round()
+            self.assertEqual(game.last_actions, [PING, PING, STAY])
+            game.do_round()
+            self.assertEqual(game.last_actions, [STAY, STAY, STAY])
+            self.assertEqual(worker.errors, 2)
+
+    def test_timeout(self):
+        from goodies import StaticGoody
+        random.seed(0)
+        with PlayerWorker(self.Sleeper, timeout=0.2) as worker:
+            game = Game(self.maze, StaticGoody(), StaticGoody(), worker.player(), max_rounds=4)
+            game.do_round()
+            self.assertEqual(worker.timeouts, 1)
+            self.assertEqual(game.last_actions, [STAY, STAY, STAY])
+            self.Sleeper.awake = True  # The restarted worker process is forked from this one, so it won't hang
+            try:
+                game.do_round()
+            finally:
+                self.Sleeper.awake = False
+            self.assertEqual(worker.timeouts, 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,385 @@
+'''
+    replay.py
+
+    A compact binary format for recording games, and reading them back.
+
+    A replay file starts with a short header, followed by any number of records. New records can be appended to an
+    existing file at any time, so many games (from many runs) can be archived in one file. There are two kinds of
+    record:
+        maze - the size of a maze, and its walls packed one bit per cell. Each maze is identified by a key derived
+               from its contents, and is only written once per ReplayWriter.
+        game - the key of the maze, the seed (if known), the player class names, the result, the initial positions
+               of the players, the actions taken by every player in every round (three actions packed into each byte),
+               and periodic keyframes holding the positions of the players.
+
+    The keyframes mean that GameRecord.state_at can find the state of a game at any round by replaying at most
+    'keyframe_interval' rounds.
+
+    Defines:
+        ReplayWriter - records games into a file
+        ReplayReader - reads the games back from a file
+        GameRecord - a recorded game
+'''
+
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from maze import Game, Maze, Position, MOVES, STEP, STAY, PING
+
+MAGIC = b"MZRP"
+VERSION = 1
+
+_FILE_HEADER = struct.Struct("<4sB")
+_RECORD_HEADER = struct.Struct("<cI")  # Record type, length of the payload
+_MAZE_HEADER = struct.Struct("<8sII")  # Key, width, height
+_GAME_HEADER = struct.Struct("<8s?QIBIII")  # Maze key, has seed, seed, max rounds, result, rounds, actions, interval
+_KEYFRAME = struct.Struct("<?6I")  # Ping, then x, y of goody0, goody1, baddy
+
+_MAZE_RECORD = b"M"
+_GAME_RECORD = b"G"
+
+RESULTS = (Game.goodies_win, Game.baddy_wins, Game.draw)
+
+
+def maze_key(maze):
+    ''' Return the 8-byte key that identifies the given maze in a replay file '''
+    return maze.digest()[:8]  # Cached by the maze, so recording many games on one maze doesn't rehash it
+
+
+def _check_seed(seed):
+    ''' Private - raise an error unless the seed can be recorded: it must be None or a 64-bit unsigned integer '''
+    if seed is None:
+        return
+    if not isinstance(seed, (int, long)):
+        raise TypeError("Only integer seeds can be recorded, got: {!r}".format(seed))
+    if not 0 <= seed < 1 << 64:
+        raise ValueError("Only seeds from 0 to 2**64 - 1 can be recorded, got: {}".format(seed))
+
+
+class ReplayWriter(object):
+    ''' Records games into a replay file, appending to it if it already exists.
+
+        Use it as a context manager, or call close() when finished.
+    '''
+
+    def __init__(self, path, keyframe_interval=256):
+        self.file = open(path, "ab")
+        self.keyframe_interval = keyframe_interval
+        self._written_mazes = set()
+        if self.file.tell() == 0:
+            self.file.write(_FILE_HEADER.pack(MAGIC, VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def _write_record(self, record_type, payload):
+        ''' Private - write a record to the file '''
+        self.file.write(_RECORD_HEADER.pack(record_type, len(payload)))
+        self.file.write(payload)
+
+    def play(self, game, seed=None, hook=None):
+        ''' Play the game (see Game.play), record it, and return the result and the number of rounds.
+            The game's own seed is recorded, unless another 'seed' is given.
+        '''
+        if seed is None:
+            seed = game.seed
+        _check_seed(seed)  # Before playing - the game can't be recorded otherwise
+        initial = _keyframe(game)
+        keyframes = []
+        actions = []
+
+        def record_round(game):
+            actions.extend(game.last_actions)
+            if game.round % self.keyframe_interval == 0:
+                keyframes.append(_keyframe(game))
+            if callable(hook):
+                hook(game)
+
+        result, rounds = game.play(hook=record_round)
+        self.write(game.maze, seed, [type(player).__name__ for player in game.players],
+                   game.max_rounds, result, rounds, initial, keyframes, actions)
+        return result, rounds
+
+    def write(self, maze, seed, player_names, max_rounds, result, rounds, initial, keyframes, actions):
+        ''' Write a game record. Usually play() is more convenient.
+            'initial' and each of 'keyframes' are (ping, positions) pairs, and 'actions' is a list of Moves.
+            'seed' must be None or an integer from 0 to 2**64 - 1, and each player name at most 255 bytes long in
+            UTF-8.
+        '''
+        _check_seed(seed)
+        names = [name.encode("utf-8") for name in player_names]
+        for name in names:
+            if len(name) > 255:
+                raise ValueError("Player names can be at most 255 bytes long, got: {!r}".format(name))
+        key = maze_key(maze)
+        if key not in self._written_mazes:
+            self._write_record(_MAZE_RECORD, _MAZE_HEADER.pack(key, maze.width, maze.height) + bytes(maze.packed()))
+            self._written_mazes.add(key)
+
+        parts = [_GAME_HEADER.pack(key, seed is not None, seed or 0, max_rounds, RESULTS.index(result), rounds,
+                                   len(actions), self.keyframe_interval)]
+        for name in names:
+            parts.append(struct.pack("<B", len(name)) + name)
+        parts.append(_pack_keyframe(initial))
+        parts.append(struct.pack("<I", len(keyframes)))
+        parts.extend(_pack_keyframe(keyframe) for keyframe in keyframes)
+
+        # Pack the actions of each round into one byte
+        codes = [action.code for action in actions]
+        codes.extend([STAY.code] * (-len(codes) % 3))
+        parts.append(bytes(bytearray(codes[i] + 6 * codes[i + 1] + 36 * codes[i + 2]
+                                     for i in xrange(0, len(codes), 3))))
+        self._write_record(_GAME_RECORD, b"".join(parts))
+
+
+def _keyframe(game):
+    ''' Private - return the (ping, positions) pair describing the current state of the game '''
+    return game.ping, tuple(game.position[player] for player in game.players)
+
+def _pack_keyframe(keyframe):
+    ''' Private - pack a (ping, positions) pair '''
+    ping, positions = keyframe
+    return _KEYFRAME.pack(ping, *[coordinate for position in positions for coordinate in (position.x, position.y)])
+
+def _unpack_keyframe(data, offset):
+    ''' Private - unpack a (ping, positions) pair '''
+    values = _KEYFRAME.unpack_from(data, offset)
+    return values[0], tuple(Position(values[i], values[i + 1]) for i in xrange(1, 7, 2))
+
+
+class GameRecord(object):
+    ''' A game read from a replay file.
+
+        Attributes: maze, seed (None if unknown), player_names, max_rounds, result, rounds, initial_positions
+    '''
+
+    def __init__(self, maze, payload):
+        (_, has_seed, seed, self.max_rounds, result, self.rounds, self._action_count,
+         self.keyframe_interval) = _GAME_HEADER.unpack_from(payload)
+        self.maze = maze
+        self.seed = seed if has_seed else None
+        self.result = RESULTS[result]
+
+        offset = _GAME_HEADER.size
+        self.player_names = []
+        for _ in xrange(3):
+            length = ord(payload[offset:offset + 1])
+            self.player_names.append(payload[offset + 1:offset + 1 + length].decode("utf-8"))
+            offset += 1 + length
+        self._keyframes = [_unpack_keyframe(payload, offset)]
+        offset += _KEYFRAME.size
+        keyframe_count, = struct.unpack_from("<I", payload, offset)
+        offset += 4
+        for _ in xrange(keyframe_count):
+            self._keyframes.append(_unpack_keyframe(payload, offset))
+            offset += _KEYFRAME.size
+        self._actions = bytearray(payload[offset:])
+
+    @property
+    def initial_positions(self):
+        return self._keyframes[0][1]
+
+    def actions(self, round_number):
+        ''' Return the list of actions taken in the given round (counting from 1), in turn order. The list is
+            shorter than three if the game ended part way through the round.
+        '''
+        if not 1 <= round_number <= self.rounds:
+            raise IndexError("Round {} is out of range (1-{})".format(round_number, self.rounds))
+        first = (round_number - 1) * 3
+        count = min(3, self._action_count - first)
+        if count <= 0:
+            return []
+        packed = self._actions[round_number - 1]
+        return [MOVES[packed // 6 ** i % 6] for i in xrange(count)]
+
+    def state_at(self, round_number):
+        ''' Return (ping, positions) after the given number of rounds. 'positions' holds the Positions of goody0,
+            goody1 and the baddy.
+        '''
+        if not 0 <= round_number <= self.rounds:
+            raise IndexError("Round {} is out of range (0-{})".format(round_number, self.rounds))
+        keyframe = min(round_number // self.keyframe_interval, len(self._keyframes) - 1)
+        ping, positions = self._keyframes[keyframe]
+        positions = list(positions)
+        for current_round in xrange(keyframe * self.keyframe_interval + 1, round_number + 1):
+            actions = self.actions(current_round)
+            if actions:
+                ping = False
+            for player, action in enumerate(actions):
+                if action == PING:
+                    ping = ping or player < 2  # Baddies can't ping
+                elif action != STAY and not self.maze.obstruction(positions[player])[action]:
+                    positions[player] += STEP[action]
+        return ping, tuple(positions)
+
+
+class ReplayReader(object):
+    ''' Reads the games in a replay file. Subscript it, or iterate over it, to get GameRecords.
+        The file is memory-mapped, and only the record headers are read until a game is asked for. A record which was
+        cut short at the end of the file (by a writer that was killed part way through it, say) is ignored, and
+        'truncated' is set.
+
+        Use it as a context manager, or call close() when finished. GameRecords already read stay usable after that.
+    '''
+
+    def __init__(self, path):
+        with open(path, "rb") as replay_file:
+            self._data = mmap.mmap(replay_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._data) < _FILE_HEADER.size:
+            raise ValueError("{} is not a replay file".format(path))
+        magic, version = _FILE_HEADER.unpack_from(self._data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a version {} replay file".format(path, VERSION))
+
+        self._mazes = {}
+        self._games = []  # (maze key, offset of payload, length of payload)
+        self.truncated = False
+        offset = _FILE_HEADER.size
+        while offset < len(self._data):
+            if offset + _RECORD_HEADER.size > len(self._data):
+                self.truncated = True
+                break
+            record_type, length = _RECORD_HEADER.unpack_from(self._data, offset)
+            offset += _RECORD_HEADER.size
+            if offset + length > len(self._data):
+                self.truncated = True
+                break
+            if record_type == _MAZE_RECORD:
+                key, width, height = _MAZE_HEADER.unpack_from(self._data, offset)
+                if key not in self._mazes:
+                    self._mazes[key] = Maze.from_packed(width, height,
+                                                        self._data[offset + _MAZE_HEADER.size:offset + length])
+            elif record_type == _GAME_RECORD:
+                self._games.append((self._data[offset:offset + 8], offset, length))
+            offset += length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc_info):
+        self.close()
+
+    def close(self):
+        ''' Unmap the file '''
+        self._data.close()
+
+    def __len__(self):
+        return len(self._games)
+
+    def __getitem__(self, index):
+        key, offset, length = self._games[index]
+        return GameRecord(self._mazes[key], self._data[offset:offset + length])
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+
+class ReplayTest(unittest.TestCase):
+    ''' Test that games can be recorded and replayed '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        from mazes import SMALL
+        self.path = os.path.join(self.directory, "games.replay")
+        self.maze = SMALL
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record_games(self, count, seed):
+        ''' Record some games, returning the state of each game after every round '''
+        from goodies import RandomGoody
+        from baddies import RandomBaddy
+        states = []
+        with ReplayWriter(self.path, keyframe_interval=4) as writer:
+            for game_seed in xrange(seed, seed + count):
+                game = Game.from_seed(self.maze, game_seed, RandomGoody, RandomGoody, RandomBaddy, max_rounds=50)
+                game_states = [_keyframe(game)]
+                writer.play(game, hook=lambda game: game_states.append(_keyframe(game)))
+                states.append((game.status, game_states))
+        return states
+
+    def test_round_trip(self):
+        states = self.record_games(10, seed=0)
+        states += self.record_games(5, seed=100)  # Appended to the same file
+        reader = ReplayReader(self.path)
+        self.assertEqual(len(reader), 15)
+        for record, (result, game_states) in zip(reader, states):
+            self.assertEqual(repr(record.maze), repr(self.maze))
+            self.assertEqual(record.player_names, ["RandomGoody", "RandomGoody", "RandomBaddy"])
+            self.assertEqual(record.result, result)
+            self.assertEqual(record.rounds, len(game_states) - 1)
+            for round_number in reversed(xrange(record.rounds + 1)):
+                self.assertEqual(record.state_at(round_number), game_states[round_number])
+        self.assertEqual([record.seed for record in reader], range(10) + range(100, 105))
+
+    def test_replay_from_seed(self):
+        from goodies import RandomGoody
+        from baddies import RandomBaddy
+        self.record_games(10, seed=0)
+        for record in ReplayReader(self.path):
+            game = Game.from_seed(record.maze, record.seed, RandomGoody, RandomGoody, RandomBaddy,
+                                  max_rounds=record.max_rounds)
+            self.assertEqual(game.play(), (record.result, record.rounds))
+            self.assertEqual(record.state_at(record.rounds), _keyframe(game))
+
+    def test_size(self):
+        self.record_games(20, seed=0)
+        reader = ReplayReader(self.path)
+        rounds = sum(record.rounds for record in reader)
+        # A header of about 100 bytes per game, three actions per byte, and a keyframe every four rounds
+        self.assertLess(os.path.getsize(self.path), 120 * len(reader) + rounds * (1 + _KEYFRAME.size / 4.0))
+
+    def test_bad_seeds(self):
+        from goodies import RandomGoody
+        from baddies import RandomBaddy
+        with ReplayWriter(self.path) as writer:
+            for seed, error in ((-1, ValueError), (1 << 64, ValueError), ("seed", TypeError), (1.5, TypeError)):
+                game = Game(self.maze, RandomGoody(), RandomGoody(), RandomBaddy(), max_rounds=50, seed=seed)
+                self.assertRaises(error, writer.play, game)
+                self.assertEqual(game.status, Game.not_started)
+        self.assertEqual(len(ReplayReader(self.path)), 0)
+
+    def test_long_names(self):
+        with ReplayWriter(self.path) as writer:
+            initial = False, (Position(0, 0),) * 3
+            self.assertRaises(ValueError, writer.write, self.maze, None, ["A" * 256, "B", "C"], 10, Game.draw, 0,
+                              initial, [], [])
+            writer.write(self.maze, None, [u"\xe9" * 127, "B", "C"], 10, Game.draw, 0, initial, [], [])
+        with ReplayReader(self.path) as reader:
+            self.assertEqual([record.player_names for record in reader], [[u"\xe9" * 127, "B", "C"]])
+
+    def test_truncated(self):
+        self.record_games(3, seed=0)
+        size = os.path.getsize(self.path)
+        with ReplayReader(self.path) as reader:
+            records = list(reader)
+            self.assertFalse(reader.truncated)
+        self.assertRaises(ValueError, len, reader._data)  # Unmapped
+        self.assertEqual(len(records[2].state_at(records[2].rounds)[1]), 3)  # Still usable
+        for cut in (1, 3, 40):
+            with open(self.path, "r+b") as replay_file:
+                replay_file.truncate(size - cut)
+            with ReplayReader(self.path) as reader:
+                self.assertTrue(reader.truncated)
+                self.assertEqual([record.seed for record in reader], [0, 1])
+        with open(self.path, "r+b") as replay_file:
+            replay_file.truncate(_FILE_HEADER.size + 2)  # Part of the first record's header
+        with ReplayReader(self.path) as reader:
+            self.assertTrue(reader.truncated)
+            self.assertEqual(len(reader), 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
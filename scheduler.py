@@ -0,0 +1,339 @@
+'''
+    scheduler.py
+
+    Play thousands of games concurrently on one thread, so that players which spend their turns waiting (on a model
+    server, say) have their waiting overlapped rather than done one turn after another.
+
+    A player can opt in by defining take_turn_async(obstruction, ping_response), which starts its turn and returns a
+    TurnFuture (or a concurrent.futures.Future) to be completed with its Move - from any thread. Players which block
+    in take_turn can be wrapped with threaded(), which runs their turns in a thread pool. All other players just take
+    their turns synchronously when they come up.
+
+    Each game is driven through Game.turns(), so the rules are exactly those of Game.do_round: the players take their
+    turns in order - goody0, goody1, then the baddy - and pings are answered at the start of the next round. Only the
+    turns of different games are interleaved.
+
+    Defines:
+        TurnFuture - the eventual result of a turn taken asynchronously
+        threaded - wrap a blocking player so its turns run in a thread pool
+        GameScheduler - plays many games at once
+'''
+
+import Queue
+import random
+import threading
+import time
+import unittest
+
+from collections import deque
+from itertools import islice
+from multiprocessing.pool import ThreadPool
+
+from maze import Game, Goody, Baddy, MOVES, STAY, PING
+from tournament import TournamentResults
+
+
+class TurnFuture(object):
+    ''' The eventual result of a turn which is being taken asynchronously. Call set_result (or set_exception) from any
+        thread to complete it.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._done = False
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        ''' Return the result, or raise the exception, that the turn was completed with '''
+        if not self._done:
+            raise ValueError("The turn has not been completed")
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def set_result(self, result):
+        self._complete(result, None)
+
+    def set_exception(self, exception):
+        self._complete(None, exception)
+
+    def add_done_callback(self, callback):
+        ''' Arrange for callback(future) to be called when the turn is completed - at once if it already has been '''
+        with self._lock:
+            if not self._done:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _complete(self, result, exception):
+        ''' Private - record the outcome of the turn, and call the callbacks '''
+        with self._lock:
+            if self._done:
+                raise ValueError("The turn has already been completed")
+            self._result, self._exception, self._done = result, exception, True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+def _run_turn(player, obstruction, ping_response, future):
+    ''' Private - take a turn in a pool thread, and complete the future with the outcome '''
+    try:
+        action = player.take_turn(obstruction, ping_response)
+    except Exception as exception:
+        future.set_exception(exception)
+    else:
+        future.set_result(action)
+
+
+class ThreadedPlayer(object):
+    ''' Wraps a player whose take_turn blocks, so that a GameScheduler runs its turns in a thread pool.
+        Use threaded() to create one.
+    '''
+
+    def __init__(self, player, pool):
+        self.player = player
+        self.pool = pool
+
+    @property
+    def rng(self):
+        return self.player.rng
+
+    @rng.setter
+    def rng(self, rng):
+        self.player.rng = rng  # So that the wrapped player gets the Game's random number stream
+
+    def take_turn(self, obstruction, ping_response):
+        return self.player.take_turn(obstruction, ping_response)
+
+    def take_turn_async(self, obstruction, ping_response):
+        future = TurnFuture()
+        self.pool.apply_async(_run_turn, (self.player, obstruction, ping_response, future))
+        return future
+
+
+class ThreadedGoody(ThreadedPlayer, Goody):
+    ''' A Goody whose turns are run in a thread pool '''
+    pass
+
+
+class ThreadedBaddy(ThreadedPlayer, Baddy):
+    ''' A Baddy whose turns are run in a thread pool '''
+    pass
+
+
+def threaded(player, pool):
+    ''' Wrap a Goody or Baddy so that a GameScheduler runs its turns in the given pool (e.g. a
+        multiprocessing.pool.ThreadPool) instead of blocking every other game while it decides.
+    '''
+    if isinstance(player, Goody):
+        return ThreadedGoody(player, pool)
+    elif isinstance(player, Baddy):
+        return ThreadedBaddy(player, pool)
+    raise TypeError("Only a Goody or a Baddy can be threaded. Got: {}".format(player))
+
+
+class GameScheduler(object):
+    ''' Plays many games concurrently, on the calling thread, interleaving their turns so that whenever a player is
+        waiting on an asynchronous turn the other games carry on.
+
+        At most 'max_games' games are in play at once. Turns which fail (by raising an exception, or completing with
+        something which isn't a Move) are taken as STAY, and counted in 'errors' - whether they were taken
+        synchronously or asynchronously.
+
+        Synchronous turns go through Game.take_turn, so they are timed and held to the game's turn_budget as usual.
+        Asynchronous turns bypass both: a game doesn't know how long one spent waiting rather than deciding, so any
+        limit on them is up to the player.
+    '''
+
+    def __init__(self, max_games=1000):
+        if max_games < 1:
+            raise ValueError("'max_games' must be at least 1, got: {}".format(max_games))
+        self.max_games = max_games
+        self.errors = 0
+
+    def _action(self, future):
+        ''' Private - the action that an asynchronous turn was completed with '''
+        try:
+            action = future.result()
+        except Exception:
+            action = None
+        return self._checked(action)
+
+    def _checked(self, action):
+        ''' Private - the action to take for a turn which returned 'action' (None if it failed) '''
+        if action not in MOVES:
+            self.errors += 1
+            return STAY
+        return action
+
+    def play(self, games, total_games=None, callback=None):
+        ''' Play the games from the iterable 'games' (e.g. a game_repeater), or the first 'total_games' of them,
+            and return a TournamentResults object. 'callback' will be called with each game when it ends.
+        '''
+        games = iter(games) if total_games is None else islice(games, total_games)
+        results = TournamentResults()
+        ready = deque()  # (game, turns generator, action) for each game that can carry on
+        completed = Queue.Queue()  # (game, turns generator, future) for each asynchronous turn that has finished
+        in_play = 0
+        more_games = True
+
+        while True:
+            while more_games and in_play < self.max_games:
+                game = next(games, None)
+                if game is None:
+                    more_games = False
+                else:
+                    ready.append((game, game.turns(), None))
+                    in_play += 1
+
+            if not ready:
+                if not in_play:
+                    return results
+                game, turns, future = completed.get()  # Wait for some turn to finish
+                ready.append((game, turns, self._action(future)))
+            while not completed.empty():
+                game, turns, future = completed.get_nowait()
+                ready.append((game, turns, self._action(future)))
+
+            # Play the game until it has to wait for a turn, or it ends
+            game, turns, action = ready.popleft()
+            while True:
+                try:
+                    player, obstruction, ping_response = turns.send(action)
+                except StopIteration:
+                    if game.status == Game.in_play:
+                        turns, action = game.turns(), None
+                        continue
+                    in_play -= 1
+                    results.add(game.status, game.round)
+                    if callable(callback):
+                        callback(game)
+                    break
+                take_turn_async = getattr(player, "take_turn_async", None)
+                if take_turn_async is None:
+                    try:
+                        action = game.take_turn(player, obstruction, ping_response)
+                    except Exception:
+                        action = None
+                    action = self._checked(action)
+                    continue
+                take_turn_async(obstruction, ping_response).add_done_callback(
+                    lambda future, game=game, turns=turns: completed.put((game, turns, future)))
+                break
+
+
+class GameSchedulerTest(unittest.TestCase):
+    ''' Test that scheduled games follow the same rules as games played one at a time '''
+
+    class Wanderer(object):
+        ''' Wanders at random using its own random number generator, pinging now and then. Remembers each ping
+            response. If 'delay' is set, takes a random time of up to that many seconds to decide.
+        '''
+        def __init__(self, seed, delay=0):
+            self.rng = random.Random(seed)
+            self.delay = delay
+            self.pings = []
+
+        def take_turn(self, obstruction, ping_response):
+            pause = self.rng.random() * self.delay  # Drawn even without a delay, to keep the moves the same
+            if pause:
+                time.sleep(pause)
+            self.pings.append(ping_response and sorted(ping_response.values()))
+            options = [move for move in MOVES if move not in (STAY, PING) and not obstruction[move]]
+            return self.rng.choice(options + [STAY, PING])
+
+    class WanderingGoody(Wanderer, Goody):
+        pass
+
+    class WanderingBaddy(Wanderer, Baddy):
+        pass
+
+    def setUp(self):
+        from mazes import SMALL
+        self.maze = SMALL
+
+    def new_games(self, count, pool=None, delay=0):
+        ''' Create some games between Wanderers - running in the pool, if one is given '''
+        games = []
+        for seed in xrange(count):
+            random.seed(seed)
+            players = [cls(seed * 3 + index, delay)
+                       for index, cls in enumerate((self.WanderingGoody, self.WanderingGoody, self.WanderingBaddy))]
+            if pool is not None:
+                players = [ThreadedGoody(players[0], pool), ThreadedGoody(players[1], pool),
+                           ThreadedBaddy(players[2], pool)]
+            games.append(Game(self.maze, *players, max_rounds=50))
+        return games
+
+    def history(self, game):
+        players = [getattr(player, "player", player) for player in game.players]
+        return game.status, game.round, [game.position[player] for player in game.players], \
+            [player.pings for player in players]
+
+    def test_matches_sequential_play(self):
+        sequential = self.new_games(40)
+        for game in sequential:
+            game.play()
+        pool = ThreadPool(16)
+        try:
+            scheduled = self.new_games(40, pool, delay=0.002)
+            finished = []
+            results = GameScheduler(max_games=25).play(scheduled, callback=finished.append)
+        finally:
+            pool.terminate()
+        self.assertEqual(results.total_games, 40)
+        self.assertEqual(set(finished), set(scheduled))
+        self.assertEqual([self.history(game) for game in scheduled], [self.history(game) for game in sequential])
+
+    def test_overlaps_waiting(self):
+        pool = ThreadPool(30)
+        try:
+            games = self.new_games(30, pool, delay=0.01)
+            start = time.time()
+            GameScheduler().play(games)
+            elapsed = time.time() - start
+        finally:
+            pool.terminate()
+        turns = sum(len(player.player.pings) for game in games for player in game.players)
+        self.assertLess(elapsed, turns * 0.005 / 5)  # Each turn waits 0.005s on average
+
+    def test_failed_turns(self):
+        class Failing(ThreadedGoody):
+            def take_turn_async(self, obstruction, ping_response):
+                future = TurnFuture()
+                future.set_result("not a move")
+                return future
+
+        random.seed(0)
+        game = Game(self.maze, Failing(self.WanderingGoody(0), None), self.WanderingGoody(1), self.WanderingBaddy(2),
+                    max_rounds=50)
+        start = game.position[game.goody0]
+        scheduler = GameScheduler()
+        scheduler.play([game])
+        self.assertEqual(game.position[game.goody0], start)
+        self.assertEqual(scheduler.errors, game.round - (game.status == Game.draw))  # goody0 goes first every round
+
+    def test_failed_synchronous_turns(self):
+        class Raising(self.WanderingBaddy):
+            def take_turn(self, obstruction, ping_response):
+                raise RuntimeError("Can't decide")
+
+        random.seed(0)
+        games = [Game(self.maze, self.WanderingGoody(0), self.WanderingGoody(1), Raising(2), max_rounds=50)
+                 for _ in xrange(3)]
+        starts = [game.position[game.baddy] for game in games]
+        scheduler = GameScheduler()
+        results = scheduler.play(games)
+        self.assertEqual(results.total_games, 3)
+        self.assertEqual([game.position[game.baddy] for game in games], starts)
+        self.assertEqual(scheduler.errors, sum(game.round - (game.status != Game.draw) for game in games))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,317 @@
+'''
+    stats.py
+
+    Streaming statistics over the results of many games, for comparing strategies.
+
+    Everything here can be updated one game (or one TournamentResults) at a time, and merged with the statistics
+    gathered by another process, so results can be looked at while a run is still going - and a run can be stopped
+    as soon as it has answered the question that it was started for (see compare).
+
+    Defines:
+        wilson_interval - a confidence interval for the rate of some result
+        RoundsSketch - a mergeable summary of the distribution of game lengths, with bounded relative error
+        ResultStats - counts, rates, intervals and game lengths of a stream of results
+        compare - play two strategies until the difference between them is settled
+'''
+
+from __future__ import division
+
+import math
+import multiprocessing
+import random
+import unittest
+
+from collections import Counter
+
+from maze import Game
+from tournament import Tournament, TournamentResults
+
+RESULTS = (Game.goodies_win, Game.baddy_wins, Game.draw)
+
+
+def z_score(confidence):
+    ''' Return the z such that a standard normal variable lies in [-z, z] with the given probability '''
+    if not 0 < confidence < 1:
+        raise ValueError("'confidence' must be between 0 and 1, got: {}".format(confidence))
+    low, high = 0.0, 40.0
+    for _ in xrange(100):  # Bisect - erf is monotonic
+        middle = (low + high) / 2
+        if math.erf(middle / math.sqrt(2)) < confidence:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+def wilson_interval(successes, trials, confidence=0.95):
+    ''' Return the Wilson score interval (low, high) for a rate, given the number of successes out of some trials.
+        With no trials at all the interval is (0, 1).
+    '''
+    if trials == 0:
+        return 0.0, 1.0
+    z = z_score(confidence)
+    rate = successes / trials
+    denominator = 1 + z * z / trials
+    centre = (rate + z * z / (2 * trials)) / denominator
+    half_width = z * math.sqrt(rate * (1 - rate) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, centre - half_width), min(1.0, centre + half_width)
+
+
+class RoundsSketch(object):
+    ''' A summary of the distribution of game lengths (in rounds), taking memory logarithmic in the longest game.
+
+        Lengths are counted in logarithmically sized buckets, so quantiles are accurate to within a factor of
+        'relative_accuracy' (1% by default). The count, mean, minimum and maximum are exact. Sketches with the same
+        accuracy can be merged.
+    '''
+
+    def __init__(self, relative_accuracy=0.01):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("'relative_accuracy' must be between 0 and 1, got: {}".format(relative_accuracy))
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets = Counter()  # Bucket index -> count. Bucket i holds lengths in (gamma**(i-1), gamma**i]
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, rounds, count=1):
+        ''' Record 'count' games of the given length '''
+        self.buckets[int(math.ceil(math.log(rounds) / self._log_gamma)) if rounds > 0 else None] += count
+        self.count += count
+        self.total += rounds * count
+        self.min = rounds if self.min is None else min(self.min, rounds)
+        self.max = rounds if self.max is None else max(self.max, rounds)
+
+    def merge(self, other):
+        ''' Add the games summarised by another sketch into this one. Returns self. '''
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same accuracy can be merged")
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+        for extreme in (other.min, other.max):
+            if extreme is not None:
+                self.min = extreme if self.min is None else min(self.min, extreme)
+                self.max = extreme if self.max is None else max(self.max, extreme)
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def quantile(self, q):
+        ''' Return the approximate q-quantile (0 <= q <= 1) of the game lengths, or None if there are none '''
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for bucket in sorted(self.buckets, key=lambda bucket: -1 if bucket is None else bucket):
+            seen += self.buckets[bucket]
+            if seen > rank:
+                if bucket is None:
+                    return 0
+                estimate = 2 * self._gamma ** bucket / (self._gamma + 1)  # The middle of the bucket, relatively
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+
+class ResultStats(object):
+    ''' Statistics over a stream of game results: the number of games with each result, the rate of each result
+        with its Wilson confidence interval, and a RoundsSketch of the game lengths for each result.
+
+        Feed it with add() after each game, or update() with a TournamentResults (e.g. from a Tournament's
+        callback). Statistics from different processes can be merged.
+    '''
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.counts = Counter()
+        self.rounds = {result: RoundsSketch(relative_accuracy) for result in RESULTS}
+
+    def add(self, result, rounds, count=1):
+        ''' Record 'count' games with the given result and length '''
+        self.counts[result] += count
+        self.rounds[result].add(rounds, count)
+
+    def update(self, tournament_results):
+        ''' Record all the games in a TournamentResults object '''
+        for result, histogram in tournament_results.rounds.iteritems():
+            for rounds, count in histogram.iteritems():
+                self.add(result, rounds, count)
+
+    def merge(self, other):
+        ''' Add the statistics from another ResultStats object into this one. Returns self. '''
+        self.counts.update(other.counts)
+        for result, sketch in other.rounds.iteritems():
+            self.rounds[result].merge(sketch)
+        return self
+
+    @property
+    def total_games(self):
+        return sum(self.counts.itervalues())
+
+    def rate(self, result):
+        ''' Return the fraction of games that ended with the given result, or None if there haven't been any '''
+        total = self.total_games
+        return self.counts[result] / total if total else None
+
+    def interval(self, result, confidence=0.95):
+        ''' Return the Wilson confidence interval (low, high) for the rate of the given result '''
+        return wilson_interval(self.counts[result], self.total_games, confidence)
+
+    def all_rounds(self):
+        ''' Return a RoundsSketch of the lengths of all the games, whatever their result '''
+        sketch = RoundsSketch(self.relative_accuracy)
+        for result_sketch in self.rounds.itervalues():
+            sketch.merge(result_sketch)
+        return sketch
+
+    def __str__(self):
+        parts = []
+        for result in RESULTS:
+            if self.counts[result]:
+                low, high = self.interval(result)
+                sketch = self.rounds[result]
+                parts.append("{}: {} ({:.1%}, 95% CI {:.1%}-{:.1%}; rounds mean {:.1f}, median {:.0f}, 90th {:.0f})"
+                             .format(result, self.counts[result], self.rate(result), low, high, sketch.mean,
+                                     sketch.quantile(0.5), sketch.quantile(0.9)))
+        return "{} games: ".format(self.total_games) + ", ".join(parts)
+
+
+class Comparison(object):
+    ''' The outcome of compare().
+
+        'stats' holds the ResultStats for strategies a and b. 'winner' is "a" or "b" if that strategy's rate of the
+        result being compared is higher with the requested confidence, or None if the run stopped before the
+        difference was settled.
+    '''
+
+    def __init__(self, stats, winner, looks):
+        self.stats = stats
+        self.winner = winner
+        self.looks = looks
+
+    @property
+    def total_games(self):
+        return sum(stats.total_games for stats in self.stats)
+
+    def __str__(self):
+        verdict = "strategy {} wins".format(self.winner) if self.winner else "not settled"
+        return "{} after {} looks\n  a: {}\n  b: {}".format(verdict, self.looks, *self.stats)
+
+
+def compare(maze, players_a, players_b, result=Game.goodies_win, confidence=0.95, batch_size=200, max_games=100000,
+            max_rounds=10000, processes=None, seed=None, callback=None):
+    ''' Play games on the maze between two combinations of player classes - 'players_a' and 'players_b' are each
+        (goody0_cls, goody1_cls, baddy_cls) - until the rate of 'result' is known to be different between them, or
+        'max_games' games have been played with each. Returns a Comparison.
+
+        Games are played in batches of 'batch_size' for each strategy (in Tournaments sharing one pool of 'processes'
+        workers), after which the two confidence intervals are compared. The confidence of the k'th comparison is raised
+        so that the chance of a wrong verdict over all the comparisons is at most 1 - 'confidence' - each of the two
+        intervals is given half of the error allowed for a comparison, since a verdict can be wrong if either of them
+        misses.
+        'callback' is called with the Comparison so far after each batch.
+    '''
+    rng = random.Random(seed)
+    processes = processes or multiprocessing.cpu_count()
+    chunk_size = -(-batch_size // processes)
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    stats = (ResultStats(), ResultStats())
+    looks = 0
+    try:
+        while stats[0].total_games < max_games:
+            for players, side_stats in zip((players_a, players_b), stats):
+                games = min(batch_size, max_games - side_stats.total_games)
+                tournament = Tournament(maze, *players, max_rounds=max_rounds, processes=processes,
+                                        seed=rng.getrandbits(64), chunk_size=chunk_size)
+                side_stats.update(tournament.play(games, pool=pool))
+
+            # Spend 1/(k(k+1)) of the allowed error on the k'th look, which sums to no more than the whole of it, and
+            # split that between the two intervals
+            looks += 1
+            side_confidence = 1 - (1 - confidence) / (2 * looks * (looks + 1))
+            (low_a, high_a), (low_b, high_b) = [side_stats.interval(result, side_confidence) for side_stats in stats]
+            winner = "a" if low_a > high_b else "b" if low_b > high_a else None
+            comparison = Comparison(stats, winner, looks)
+            if callable(callback):
+                callback(comparison)
+            if winner is not None:
+                return comparison
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return Comparison(stats, None, looks)
+
+
+class StatsTest(unittest.TestCase):
+    ''' Test the streaming statistics '''
+
+    def test_wilson_interval(self):
+        self.assertAlmostEqual(z_score(0.95), 1.959964, places=5)
+        low, high = wilson_interval(50, 100)
+        self.assertAlmostEqual(low, 0.4038, places=4)
+        self.assertAlmostEqual(high, 0.5962, places=4)
+        self.assertEqual(wilson_interval(0, 0), (0.0, 1.0))
+        low, high = wilson_interval(0, 10)
+        self.assertEqual(low, 0.0)
+        self.assertGreater(high, 0.0)
+
+    def test_sketch(self):
+        rng = random.Random(0)
+        lengths = [int(rng.expovariate(1 / 300.0)) + 1 for _ in xrange(5000)]
+        halves = RoundsSketch(), RoundsSketch()
+        for index, rounds in enumerate(lengths):
+            halves[index % 2].add(rounds)
+        sketch = halves[0].merge(halves[1])
+        lengths.sort()
+        self.assertEqual(sketch.count, len(lengths))
+        self.assertAlmostEqual(sketch.mean, sum(lengths) / len(lengths))
+        self.assertEqual((sketch.min, sketch.max), (lengths[0], lengths[-1]))
+        for q in (0, 0.1, 0.5, 0.9, 0.99, 1):
+            exact = lengths[int(q * (len(lengths) - 1))]
+            self.assertLessEqual(abs(sketch.quantile(q) - exact), 0.01 * exact + 1e-9)
+        self.assertLess(len(sketch.buckets), 1000)
+
+    def test_result_stats(self):
+        tournament_results = TournamentResults()
+        stats = ResultStats()
+        for rounds in xrange(1, 31):
+            result = RESULTS[rounds % 3]
+            tournament_results.add(result, rounds)
+            if rounds <= 10:
+                stats.add(result, rounds)
+        rest = ResultStats()
+        rest.update(tournament_results)
+        self.assertEqual(rest.total_games, 30)
+        self.assertEqual(rest.rate(Game.goodies_win), 1 / 3)
+        stats.merge(rest)
+        self.assertEqual(stats.counts[Game.draw], 13)
+        self.assertEqual(stats.all_rounds().count, 40)
+        self.assertIn("40 games", str(stats))
+
+    def test_compare(self):
+        from goodies import StaticGoody, RandomGoody
+        from baddies import StaticBaddy, RandomBaddy
+        from mazes import SMALL as maze
+        # Static goodies can never meet, random ones usually do
+        comparison = compare(maze, (StaticGoody, StaticGoody, StaticBaddy), (RandomGoody, RandomGoody, StaticBaddy),
+                             batch_size=20, max_games=1000, max_rounds=200, processes=1, seed=0)
+        self.assertEqual(comparison.winner, "b")
+        self.assertLess(comparison.total_games, 200)
+        parallel = compare(maze, (StaticGoody, StaticGoody, StaticBaddy), (RandomGoody, RandomGoody, StaticBaddy),
+                           batch_size=20, max_games=1000, max_rounds=200, processes=2, seed=0)
+        self.assertEqual([stats.counts for stats in parallel.stats], [stats.counts for stats in comparison.stats])
+
+        # The same strategy should never be found to be different
+        comparison = compare(maze, (RandomGoody, RandomGoody, RandomBaddy), (RandomGoody, RandomGoody, RandomBaddy),
+                             batch_size=50, max_games=200, max_rounds=200, processes=1, seed=0)
+        self.assertIsNone(comparison.winner)
+        self.assertEqual(comparison.total_games, 400)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
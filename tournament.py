@@ -0,0 +1,169 @@
+'''
+    tournament.py
+
+    Play many identical games across a pool of worker processes.
+
+    Every game is given its own seed (see Game), derived from a single master seed. The global random module is also
+    reseeded with it immediately before the game is created, for the sake of players which don't use their own 'rng'.
+    As a result a tournament gives the same results for a given master seed, no matter how many worker processes it is
+    spread across.
+
+    Defines:
+        TournamentResults - counts of each result, and histograms of the number of rounds each game took
+        Tournament - splits a number of games into chunks, plays them in a multiprocessing.Pool and merges the results
+'''
+
+import multiprocessing
+import random
+import unittest
+
+from collections import Counter, defaultdict
+
+from maze import Game, Maze
+
+
+class TournamentResults(object):
+    ''' The merged results of a number of games.
+
+        'results' maps a game result (e.g. Game.goodies_win) to the number of games that ended that way.
+        'rounds' maps a game result to a Counter of {number of rounds: number of games}.
+    '''
+    def __init__(self):
+        self.results = defaultdict(int)
+        self.rounds = defaultdict(Counter)
+
+    def add(self, result, rounds):
+        ''' Record the outcome of a single game '''
+        self.results[result] += 1
+        self.rounds[result][rounds] += 1
+
+    def merge(self, other):
+        ''' Add the results from another TournamentResults object into this one. Returns self. '''
+        for result, count in other.results.iteritems():
+            self.results[result] += count
+        for result, histogram in other.rounds.iteritems():
+            self.rounds[result].update(histogram)
+        return self
+
+    @property
+    def total_games(self):
+        ''' The number of games that have been recorded '''
+        return sum(self.results.itervalues())
+
+    def __eq__(self, other):
+        if not isinstance(other, TournamentResults):
+            return False
+        return dict(self.results) == dict(other.results) and dict(self.rounds) == dict(other.rounds)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __str__(self):
+        return str(dict(self.results))
+
+
+def _play_chunk(args):
+    ''' Private - play a chunk of games in a worker process, one for each of the given seeds '''
+    maze, goody0_cls, goody1_cls, baddy_cls, max_rounds, turn_budget, seeds = args
+    chunk_results = TournamentResults()
+    for seed in seeds:
+        random.seed(seed)
+        game = Game.from_seed(maze, seed, goody0_cls, goody1_cls, baddy_cls, max_rounds=max_rounds,
+                              turn_budget=turn_budget)
+        chunk_results.add(*game.play())
+    return chunk_results
+
+
+class Tournament(object):
+    ''' A Tournament plays many games between the same classes of players on the same maze.
+
+        Games are split into chunks of 'chunk_size' and handed out to 'processes' worker processes (by default, one
+        per CPU). The maze and the player classes must be picklable - so player classes should be defined at module
+        level.
+
+        'seed' is the master seed. If it is None a random one is chosen, and can be read back from the 'seed'
+        attribute so that the tournament can be reproduced.
+
+        'turn_budget' is passed on to every Game - turns that take longer than that many seconds become STAY.
+    '''
+
+    def __init__(self, maze, goody0_cls, goody1_cls, baddy_cls, max_rounds=10000, processes=None, seed=None,
+                 chunk_size=100, turn_budget=None):
+        if not isinstance(maze, Maze):
+            raise TypeError("A Tournament must be played on a Maze. Got: {}".format(maze))
+        if chunk_size < 1:
+            raise ValueError("'chunk_size' must be at least 1, got: {}".format(chunk_size))
+        self.maze = maze
+        self.goody0_cls = goody0_cls
+        self.goody1_cls = goody1_cls
+        self.baddy_cls = baddy_cls
+        self.max_rounds = max_rounds
+        self.processes = processes or multiprocessing.cpu_count()
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        self.chunk_size = chunk_size
+        self.turn_budget = turn_budget
+
+    def game_seeds(self, total_games):
+        ''' Return the list of per-game seeds for the first 'total_games' games of this tournament '''
+        rng = random.Random(self.seed)
+        return [rng.getrandbits(64) for _ in xrange(total_games)]
+
+    def _chunks(self, total_games):
+        ''' Private - generate the arguments passed to _play_chunk for each chunk of games '''
+        seeds = self.game_seeds(total_games)
+        for start in xrange(0, total_games, self.chunk_size):
+            yield (self.maze, self.goody0_cls, self.goody1_cls, self.baddy_cls, self.max_rounds, self.turn_budget,
+                   seeds[start:start + self.chunk_size])
+
+    def play(self, total_games, callback=None, pool=None):
+        ''' Play 'total_games' games and return the merged TournamentResults.
+            'callback' will be called each time a chunk of games has been merged in. It should accept one
+            argument - the TournamentResults so far.
+            'pool' is a multiprocessing.Pool to play the games in, which is left running afterwards - so that it can be
+            shared by several tournaments. By default a pool of 'processes' workers is started for this call only.
+        '''
+        results = TournamentResults()
+        own_pool = None
+        if pool is not None:
+            chunk_results = pool.imap_unordered(_play_chunk, self._chunks(total_games))
+        elif self.processes == 1:
+            # Don't bother with a pool - this is handy for debugging and profiling
+            chunk_results = (_play_chunk(chunk) for chunk in self._chunks(total_games))
+        else:
+            own_pool = multiprocessing.Pool(self.processes)
+            chunk_results = own_pool.imap_unordered(_play_chunk, self._chunks(total_games))
+        try:
+            for chunk_result in chunk_results:
+                results.merge(chunk_result)
+                if callable(callback):
+                    callback(results)
+        finally:
+            if own_pool is not None:
+                own_pool.terminate()
+                own_pool.join()
+        return results
+
+
+class TournamentTest(unittest.TestCase):
+    ''' Test that tournaments are reproducible, however they are split up '''
+
+    def setUp(self):
+        from goodies import RandomGoody
+        from baddies import RandomBaddy
+        from mazes import SMALL
+        self.maze = SMALL
+        self.players = (RandomGoody, RandomGoody, RandomBaddy)
+
+    def test_total_games(self):
+        results = Tournament(self.maze, *self.players, processes=1, seed=1, chunk_size=7).play(30)
+        self.assertEqual(results.total_games, 30)
+        self.assertEqual(sum(sum(histogram.values()) for histogram in results.rounds.values()), 30)
+
+    def test_reproducible_across_processes(self):
+        serial = Tournament(self.maze, *self.players, processes=1, seed=42, chunk_size=5).play(40)
+        parallel = Tournament(self.maze, *self.players, processes=3, seed=42, chunk_size=3).play(40)
+        self.assertEqual(serial, parallel)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)